@@ -0,0 +1,277 @@
+import os
+import threading
+import time
+from collections import Counter as _Tally
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional
+
+from metrics import Counter, Gauge, registry, timed
+
+# === CONFIG admission des libérations ===
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+# Au plus ce nombre d'ICCID : voie interactive (prioritaire), au-delà : voie bulk
+ADMISSION_INTERACTIVE_MAX_SIMS = int(os.getenv("ADMISSION_INTERACTIVE_MAX_SIMS", "10"))
+
+
+def _limits(value: str) -> Dict[str, int]:
+    """Lecture de "PROD=4,UAT=4" → {"PROD": 4, "UAT": 4}"""
+    limits = {}
+    for item in value.split(","):
+        if "=" in item:
+            key, limit = item.split("=", 1)
+            limits[key.strip()] = int(limit)
+    return limits
+
+
+# Sessions Oracle tenues simultanément par les libérations, par environnement (un run UAT compte aussi
+# ses sessions PROD du garde-fou), dont au plus ADMISSION_BULK_SLOTS pour la voie bulk : le reste est
+# réservé aux demandes interactives
+ADMISSION_ENV_SLOTS = _limits(os.getenv("ADMISSION_ENV_SLOTS", "PROD=4,UAT=4"))
+ADMISSION_BULK_SLOTS = _limits(os.getenv("ADMISSION_BULK_SLOTS", "PROD=3,UAT=3"))
+# Demandes simultanées (en cours ou en file de job) par utilisateur et par user_type
+ADMISSION_USER_BULK_LIMIT = int(os.getenv("ADMISSION_USER_BULK_LIMIT", "2"))
+ADMISSION_USER_INTERACTIVE_LIMIT = int(os.getenv("ADMISSION_USER_INTERACTIVE_LIMIT", "4"))
+ADMISSION_USER_TYPE_BULK_LIMITS = _limits(os.getenv("ADMISSION_USER_TYPE_BULK_LIMITS", ""))
+ADMISSION_USER_TYPE_BULK_DEFAULT = int(os.getenv("ADMISSION_USER_TYPE_BULK_DEFAULT", "4"))
+# s d'attente max d'une tranche interactive avant refus (les tranches bulk déjà admises attendent leur tour)
+ADMISSION_INTERACTIVE_WAIT = float(os.getenv("ADMISSION_INTERACTIVE_WAIT", "5"))
+# Retry-After (s) renvoyé selon la voie
+ADMISSION_RETRY_AFTER_INTERACTIVE = int(os.getenv("ADMISSION_RETRY_AFTER_INTERACTIVE", "2"))
+ADMISSION_RETRY_AFTER_BULK = int(os.getenv("ADMISSION_RETRY_AFTER_BULK", "30"))
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+ADMISSION_REJECTED = registry.register(Counter(
+    "sim_admission_rejected_total",
+    "Demandes de libération refusées par le contrôle d'admission",
+    ("env", "lane", "reason")
+))
+
+
+class AdmissionRejected(Exception):
+    """Limite atteinte : à renvoyer en 429 avec Retry-After"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def lane_for(sim_count: int, upload: bool = False) -> str:
+    return INTERACTIVE if not upload and sim_count <= ADMISSION_INTERACTIVE_MAX_SIMS else BULK
+
+
+class Ticket:
+    """Demande admise : libérée une seule fois, en fin de traitement (requête, flux ou job)"""
+
+    def __init__(self, controller: "AdmissionController", env: str, lane: str, username: str, user_type: str):
+        self.controller = controller
+        self.env = env
+        self.lane = lane
+        self.username = username
+        self.user_type = user_type
+        self.released = False
+
+    def release(self) -> None:
+        self.controller._release_request(self)
+
+    def __enter__(self) -> "Ticket":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class Slot:
+    """Sessions Oracle réservées pour une tranche ({env: nombre}) ; release() une seule fois"""
+
+    def __init__(self, controller: "AdmissionController", lane: str, sessions: Dict[str, int]):
+        self.controller = controller
+        self.lane = lane
+        self.sessions = sessions
+        self.released = False
+
+    def release(self) -> None:
+        self.controller._release_slot(self)
+
+
+class AdmissionController:
+    """
+    Deux niveaux :
+      - admit() à la réception : limites de demandes simultanées par utilisateur / user_type,
+        refus immédiat (429 + Retry-After) plutôt qu'une file qui s'allonge ;
+      - work_slot() autour de chaque tranche liberate : créneaux comptés en sessions Oracle par
+        environnement (workers parallèles × environnements touchés), une part réservée à la voie
+        interactive, et priorité aux tranches interactives en attente (une tranche bulk ne démarre pas
+        tant qu'une interactive attend). Un fichier cède ainsi la main entre deux tranches.
+    """
+
+    def __init__(self, env_slots: Dict[str, int], bulk_slots: Dict[str, int], user_bulk_limit: int,
+                 user_interactive_limit: int, user_type_bulk_limits: Dict[str, int], user_type_bulk_default: int,
+                 interactive_wait: float, enabled: bool = True):
+        self.enabled = enabled
+        self.env_slots = env_slots
+        self.bulk_slots = bulk_slots
+        self.user_bulk_limit = user_bulk_limit
+        self.user_interactive_limit = user_interactive_limit
+        self.user_type_bulk_limits = user_type_bulk_limits
+        self.user_type_bulk_default = user_type_bulk_default
+        self.interactive_wait = interactive_wait
+
+        self._cond = threading.Condition()
+        self._requests = _Tally()      # (lane, "user"|"type", nom) → demandes admises
+        self._running = _Tally()       # (env, lane) → sessions tenues par les tranches en cours
+        self._waiting = _Tally()       # (env, lane) → tranches en attente d'un créneau
+
+    # -------------------------
+    # Demandes
+    # -------------------------
+    def _reject(self, env: str, lane: str, reason: str, message: str) -> AdmissionRejected:
+        ADMISSION_REJECTED.inc(env=env, lane=lane, reason=reason)
+        retry_after = ADMISSION_RETRY_AFTER_INTERACTIVE if lane == INTERACTIVE else ADMISSION_RETRY_AFTER_BULK
+        return AdmissionRejected(message, retry_after)
+
+    def _check_locked(self, env: str, username: str, user_type: str, lane: str) -> None:
+        if lane == INTERACTIVE:
+            if self._requests[(lane, "user", username)] >= self.user_interactive_limit:
+                raise self._reject(env, lane, "user", "Trop de demandes en cours pour cet utilisateur, réessayez")
+            return
+        if self._requests[(lane, "user", username)] >= self.user_bulk_limit:
+            raise self._reject(env, lane, "user",
+                               f"{self.user_bulk_limit} traitement(s) fichier déjà en cours pour cet utilisateur, "
+                               f"réessayez plus tard")
+        type_limit = self.user_type_bulk_limits.get(user_type, self.user_type_bulk_default)
+        if self._requests[(lane, "type", user_type)] >= type_limit:
+            raise self._reject(env, lane, "user_type",
+                               f"{type_limit} traitement(s) fichier déjà en cours pour l'équipe "
+                               f"{user_type or 'inconnue'}, réessayez plus tard")
+
+    def admit(self, env: str, username: str, user_type: Optional[str], lane: str) -> Ticket:
+        env = env.upper()
+        user_type = user_type or ""
+        with self._cond:
+            if self.enabled:
+                self._check_locked(env, username, user_type, lane)
+            self._requests[(lane, "user", username)] += 1
+            self._requests[(lane, "type", user_type)] += 1
+        return Ticket(self, env, lane, username, user_type)
+
+    def _release_request(self, ticket: Ticket) -> None:
+        with self._cond:
+            if ticket.released:
+                return
+            ticket.released = True
+            for key in ((ticket.lane, "user", ticket.username), (ticket.lane, "type", ticket.user_type)):
+                self._requests[key] -= 1
+                if self._requests[key] <= 0:
+                    del self._requests[key]
+
+    # -------------------------
+    # Créneaux Oracle par tranche
+    # -------------------------
+    def max_parallelism(self, envs: Iterable[str], lane: str, requested: int) -> int:
+        """Workers liberate possibles sans dépasser les créneaux de la voie sur chaque environnement touché"""
+        if not self.enabled:
+            return requested
+        limits = self.bulk_slots if lane == BULK else self.env_slots
+        return max(1, min([requested] + [limits.get(env, 1) for env in envs]))
+
+    def _can_run(self, lane: str, sessions: Dict[str, int]) -> bool:
+        for env, count in sessions.items():
+            running = self._running[(env, INTERACTIVE)] + self._running[(env, BULK)]
+            # Une tranche plus large que les créneaux passe seule plutôt que jamais
+            if running and running + count > self.env_slots.get(env, 1):
+                return False
+            if lane == INTERACTIVE:
+                continue
+            if self._waiting[(env, INTERACTIVE)]:
+                return False
+            bulk_running = self._running[(env, BULK)]
+            if bulk_running and bulk_running + count > self.bulk_slots.get(env, 1):
+                return False
+        return True
+
+    def acquire_slot(self, env: str, lane: str, sessions: Optional[Dict[str, int]] = None) -> Slot:
+        """
+        Réserve les sessions d'une tranche (par défaut une sur env) : une tranche interactive attend
+        au plus interactive_wait secondes (AdmissionRejected ensuite), une tranche bulk attend son tour.
+        Appelé avant la réponse, un refus peut encore partir en 429.
+        """
+        env = env.upper()
+        sessions = {key.upper(): count for key, count in (sessions or {env: 1}).items() if count > 0}
+        slot = Slot(self, lane, sessions)
+        if not self.enabled:
+            slot.released = True
+            return slot
+        deadline = time.monotonic() + self.interactive_wait if lane == INTERACTIVE else None
+        with timed("admission_wait", env), self._cond:
+            for key in sessions:
+                self._waiting[(key, lane)] += 1
+            try:
+                while not self._can_run(lane, sessions):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise self._reject(env, lane, "slots", "Serveur occupé, réessayez")
+                    self._cond.wait(remaining)
+            finally:
+                for key in sessions:
+                    self._waiting[(key, lane)] -= 1
+                # Une interactive qui abandonne peut débloquer une tranche bulk
+                self._cond.notify_all()
+            for key, count in sessions.items():
+                self._running[(key, lane)] += count
+        return slot
+
+    def _release_slot(self, slot: Slot) -> None:
+        with self._cond:
+            if slot.released:
+                return
+            slot.released = True
+            for key, count in slot.sessions.items():
+                self._running[(key, slot.lane)] -= count
+            self._cond.notify_all()
+
+    @contextmanager
+    def work_slot(self, env: str, lane: str, sessions: Optional[Dict[str, int]] = None,
+                  held: Optional[Slot] = None) -> Iterator[None]:
+        """
+        acquire_slot pendant la tranche ; held : créneau déjà réservé par l'appelant (pris avant la
+        réponse), utilisé s'il couvre les mêmes sessions, sinon rendu et remplacé
+        """
+        if held is not None and not held.released and held.sessions == {
+                key.upper(): count for key, count in (sessions or {env.upper(): 1}).items() if count > 0}:
+            slot = held
+        else:
+            if held is not None:
+                held.release()
+            slot = self.acquire_slot(env, lane, sessions)
+        try:
+            yield
+        finally:
+            slot.release()
+
+    def stats(self) -> Dict[tuple, int]:
+        with self._cond:
+            stats = {(env, lane, "running"): count for (env, lane), count in self._running.items()}
+            stats.update({(env, lane, "waiting"): count for (env, lane), count in self._waiting.items()})
+            for (lane, kind, name), count in self._requests.items():
+                if kind == "user":
+                    stats[("", lane, "admitted")] = stats.get(("", lane, "admitted"), 0) + count
+        return stats
+
+
+admission_controller = AdmissionController(
+    env_slots=ADMISSION_ENV_SLOTS,
+    bulk_slots=ADMISSION_BULK_SLOTS,
+    user_bulk_limit=ADMISSION_USER_BULK_LIMIT,
+    user_interactive_limit=ADMISSION_USER_INTERACTIVE_LIMIT,
+    user_type_bulk_limits=ADMISSION_USER_TYPE_BULK_LIMITS,
+    user_type_bulk_default=ADMISSION_USER_TYPE_BULK_DEFAULT,
+    interactive_wait=ADMISSION_INTERACTIVE_WAIT,
+    enabled=ADMISSION_ENABLED
+)
+
+registry.register(Gauge(
+    "sim_admission_state", "Sessions Oracle tenues / tranches en attente par environnement et voie, demandes admises",
+    ("env", "lane", "state"), admission_controller.stats
+))
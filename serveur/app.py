@@ -1,12 +1,27 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
-from ldap_auth import bind_user, get_user_type
-from creation_liberation_sim import creationauc, liberate, normalize_iccid
+from ldap_auth import authenticate
+from creation_liberation_sim import creationauc, liberate, parse_iccids, iter_iccid_chunks, normalize_iccid
+from creation_liberation_sim import get_pool_stats, sftp_pool, liberation_sessions, SIM_PARALLELISM
 from flask_jwt_extended import create_access_token, JWTManager, jwt_required
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from datetime import datetime, timedelta, timezone
-from logs import log_sim_liberation
+from logs import log_sim_liberation, log_sink
+from jobs import job_manager, JobQueueFull, JOB_CHUNK_SIZE
+from checkpoints import checkpoint_store, run_fingerprint, stream_fingerprint, derive_run_id, verify_replay
+from checkpoints import RunMismatch, RunInProgress
+from uploads import spool_upload, iter_upload_lines, UploadTooLarge, UPLOAD_MIMETYPES
+from idempotency import idempotency_store, request_key, payload_fingerprint, RequestInProgress, IdempotencyKeyReused
+from metrics import registry, Gauge, start_trace, stop_trace
+from admission import admission_controller, lane_for, AdmissionRejected, BULK, INTERACTIVE
+import history
+import lifecycle
 import traceback
+import threading
+import queue
+import json
+import os
+import uuid
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
@@ -26,8 +41,9 @@ def login():
         if not username or not password:
             return jsonify({"message": "Username and password are required"}), 400
 
-        # 🔐 LDAP authentication
-        if not bind_user(username, password):
+        # 🔐 LDAP authentication (un seul bind, user_type résolu sur la même connexion)
+        authenticated, user_type = authenticate(username, password)
+        if not authenticated:
             log_sim_liberation(
                 action_type="login",
                 status=0,
@@ -38,9 +54,7 @@ def login():
             )
             return jsonify({"message": "Incorrect username or password"}), 401
 
-        # 🎯 Get user type from LDAP
-        user_type = get_user_type(username, password)
-
+        # 🎯 User type from LDAP groups
         if not user_type:
             log_sim_liberation(
                 action_type="login",
@@ -86,6 +100,198 @@ def login():
         return jsonify({"message": str(e)}), 500
 
 
+def _build_result_list(mapping_raw_to_norm, status_by_norm):
+    result_list = []
+    for raw, norm in mapping_raw_to_norm.items():
+        base_status = status_by_norm.get(norm)
+        if not norm:
+            result_list.append({"sim": raw, "status": "error", "message": "ICCID invalide"})
+        elif base_status:
+            result = {
+                "sim": raw,
+                "status": base_status["status"],
+                "message": base_status.get("message", "")
+            }
+            # Dry run : action prévue et nombre de spml:AddRequest
+            for key in ("action", "spmlRequests"):
+                if key in base_status:
+                    result[key] = base_status[key]
+            result_list.append(result)
+        else:
+            result_list.append({"sim": raw, "status": "error", "message": "ICCID introuvable"})
+    return result_list
+
+
+def _slot_plan(env, lane, sim_count):
+    """
+    (parallelism, sessions Oracle) d'une tranche : parallélisme borné par les créneaux de la voie,
+    sessions réservées via admission_controller.work_slot
+    """
+    parallelism = admission_controller.max_parallelism(liberation_sessions(env, sim_count, 1), lane, SIM_PARALLELISM)
+    return parallelism, liberation_sessions(env, sim_count, parallelism)
+
+
+def _iter_liberation_chunks(parts, env, username, user_type, ip_address, is_file, on_status=None,
+                            run_id=None, done_chunks=None, skip_recent=True, verify=False, ticket=None, slot=None):
+    """
+    Libère tranche par tranche (parts : parsed.chunks(JOB_CHUNK_SIZE) ou iter_iccid_chunks d'un upload) ;
+    produit la liste de résultats de chaque tranche dès qu'elle est terminée
+    (seule la tranche courante est gardée en mémoire).
+    run_id : chaque tranche terminée est enregistrée dans checkpoint_store ; celles de done_chunks
+    (déjà validées par une exécution précédente du run) ne sont pas rejouées.
+    verify : contrôle des tranches rejouées (run sans empreinte du contenu, cf. stream_fingerprint).
+    skip_recent : voir liberate (False pour forcer le retraitement des SIM libérées récemment).
+    ticket : demande admise (admission_controller.admit) ; chaque tranche réserve les sessions Oracle
+    qu'elle ouvre (workers × environnements) dans sa voie, le ticket est libéré quand le générateur se termine.
+    slot : créneau de la première tranche déjà pris par l'appelant (flux interactif, refus en 429 possible).
+    """
+    done_chunks = done_chunks or {}
+    lane = ticket.lane if ticket else BULK
+    index = -1
+    try:
+        for index, part in enumerate(parts):
+            if index in done_chunks:
+                status_list = done_chunks[index]
+                if verify:
+                    verify_replay(run_id, index, part.mapping.values(), status_list)
+            else:
+                parallelism, sessions = _slot_plan(env, lane, len(part.valid))
+                with admission_controller.work_slot(env, lane, sessions, held=slot):
+                    slot = None
+                    liberate_res = liberate(
+                        user_inputs=part.valid,
+                        env=env,
+                        username=username,
+                        user_type=user_type,
+                        ip_address=ip_address,
+                        is_file=is_file,
+                        on_status=on_status,
+                        parsed=part,
+                        skip_recent=skip_recent,
+                        parallelism=parallelism
+                    )
+                status_list = liberate_res.get("statusList", [])
+                if run_id:
+                    checkpoint_store.save_chunk(run_id, index, status_list)
+            yield _build_result_list(part.mapping, {s["sim"]: s for s in status_list})
+    except BaseException:
+        if run_id:
+            checkpoint_store.finish_run(run_id, "failed")
+        raise
+    finally:
+        if slot is not None:
+            slot.release()
+        if ticket:
+            ticket.release()
+    if run_id:
+        checkpoint_store.finish_run(run_id, total_chunks=index + 1)
+
+
+def _run_liberation_job(job, parts, env, username, user_type, ip_address, is_file, run_id=None, done_chunks=None,
+                        skip_recent=True, verify=False, ticket=None):
+    """
+    Exécuté par un worker de job_manager : publie les résultats de chaque tranche dès qu'elle est terminée
+    """
+    for results in _iter_liberation_chunks(parts, env, username, user_type, ip_address, is_file,
+                                           run_id=run_id, done_chunks=done_chunks, skip_recent=skip_recent,
+                                           verify=verify, ticket=ticket):
+        job.add_results(results)
+
+
+def _stream_liberation(parts, env, username, user_type, ip_address, is_file, run_id=None, done_chunks=None,
+                       skip_recent=True, verify=False, ticket=None, slot=None):
+    """
+    Réponse NDJSON : une ligne {"type": "result"} par SIM dès que son statut est décidé,
+    puis une ligne {"type": "summary"}. La libération tourne dans un thread et va au bout
+    même si le client se déconnecte.
+    Une fois la réponse commencée (HTTP 200), une erreur arrive en ligne {"type": "error", "message"} ;
+    un créneau Oracle refusé en cours de flux (tranche suivante d'un fichier) donne en plus
+    "status": 429 et "retryAfter" (s), les SIM déjà rendues restant acquises.
+    slot : voir _iter_liberation_chunks.
+    """
+    lines = queue.Queue(maxsize=1000)
+    cancelled = threading.Event()
+    done = object()
+
+    # Correspondances de la tranche en cours seulement (mises à jour quand la tranche suivante est lue)
+    raws_by_norm = {}
+    current = {}
+
+    def tracked(parts):
+        for part in parts:
+            raws_by_norm.clear()
+            for raw, norm in part.mapping.items():
+                raws_by_norm.setdefault(norm, []).append(raw)
+            current["mapping"] = part.mapping
+            yield part
+
+    def put(item):
+        # File bornée : freine la libération si le client lit lentement, abandonne la sortie s'il est parti
+        while not cancelled.is_set():
+            try:
+                lines.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def worker():
+        reported = set()
+
+        def on_status(entry):
+            reported.add(entry["sim"])
+            for raw in raws_by_norm.get(entry["sim"], []):
+                put({"type": "result", "sim": raw, "status": entry["status"], "message": entry.get("message", "")})
+
+        try:
+            for results in _iter_liberation_chunks(tracked(parts), env, username, user_type, ip_address, is_file,
+                                                   on_status=on_status, run_id=run_id, done_chunks=done_chunks,
+                                                   skip_recent=skip_recent, verify=verify, ticket=ticket,
+                                                   slot=slot):
+                # SIM sans statut via on_status (environnement invalide, tranche rejouée) : résultat de fin de tranche
+                for r in results:
+                    if current["mapping"][r["sim"]] not in reported:
+                        put({"type": "result", **r})
+                reported.clear()
+        except AdmissionRejected as e:
+            put({"type": "error", "status": 429, "retryAfter": e.retry_after, "message": str(e)})
+        except Exception as e:
+            traceback.print_exc()
+            put({"type": "error", "message": f"Erreur interne: {str(e)}"})
+        finally:
+            lifecycle.state.leave()
+            put(done)
+
+    def generate():
+        total = success_count = 0
+        failed = False
+        try:
+            while True:
+                item = lines.get()
+                if item is done:
+                    break
+                if item["type"] == "result":
+                    total += 1
+                    success_count += item["status"] == "success"
+                else:
+                    failed = True
+                yield json.dumps(item) + "\n"
+            yield json.dumps({
+                "type": "summary",
+                "success": not failed,
+                "runId": run_id,
+                "total": total,
+                "successCount": success_count,
+                "message": f"{success_count} SIM traitées avec succès, {total - success_count} anomalies."
+            }) + "\n"
+        finally:
+            cancelled.set()
+
+    # Compté dès maintenant : l'arrêt du worker attend la fin du flux
+    lifecycle.state.enter()
+    threading.Thread(target=worker, name="liberation-stream", daemon=True).start()
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
 @app.route("/sim/creation-liberation", methods=["POST", "OPTIONS"])
 @jwt_required()
 def creation_liberation():
@@ -93,6 +299,30 @@ def creation_liberation():
     if request.method == "OPTIONS":
         return jsonify({"status": "ok"}), 200
 
+    if lifecycle.is_draining():
+        return _draining_response()
+
+    with lifecycle.in_flight():
+        return _creation_liberation()
+
+
+def _admission_response(e):
+    response = jsonify({"success": False, "message": str(e), "retryAfter": e.retry_after})
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, 429
+
+
+def _draining_response():
+    # Arrêt en cours : le load balancer redirige la nouvelle tentative vers un autre worker
+    response = jsonify({"success": False, "message": "Serveur en cours d'arrêt, réessayez"})
+    response.headers["Retry-After"] = str(lifecycle.DRAIN_RETRY_AFTER)
+    return response, 503
+
+
+def _creation_liberation():
+    idem_key = None
+    ticket = None
+    pending_run = None   # run ouvert pas encore confié au traitement : marqué failed en cas d'échec
     try:
         # 🔐 Infos SÛRES depuis le JWT
         username = get_jwt_identity()
@@ -102,6 +332,12 @@ def creation_liberation():
         mode = data.get("mode")
         sims_input = data.get("data")
         env = data.get("environment", "UAT").upper()
+        run_async = bool(data.get("async", False))
+        stream = bool(data.get("stream", False))
+        force = bool(data.get("force", False))  # ignore les réponses / libérations récentes mémorisées
+        dry_run = bool(data.get("dryRun", False))
+        # Détail des durées par étape dans la réponse (mode synchrone)
+        trace = start_trace() if data.get("debug") else None
 
         if not sims_input:
             return jsonify({"success": False, "message": "Aucun ICCID fourni"}), 400
@@ -119,53 +355,423 @@ def creation_liberation():
         else:
             return jsonify({"success": False, "message": "Format des données invalide"}), 400
 
-        mapping_raw_to_norm = {raw: normalize_iccid(raw) for raw in raw_sims}
-        norm_sims = list(set(mapping_raw_to_norm.values()))
-
-        # --- Appel liberate ---
-        status_by_norm = {}
-        if norm_sims:
-            ip_address = request.remote_addr
-
-            liberate_res = liberate(
-                user_inputs=norm_sims,
-                env=env,
-                username=username,
-                user_type=user_type,
-                ip_address=ip_address,
-                is_file=(mode == "fichier")
+        # Parsing unique : normalisation, validation, dédoublonnage
+        parsed = parse_iccids(raw_sims)
+        ip_address = request.remote_addr
+        is_file = mode == "fichier"
+        # Voie d'admission : quelques SIM (support) passent devant les fichiers
+        lane = lane_for(len(parsed.mapping))
+
+        # --- Simulation : lectures seules, plan par SIM et volume SPML prévu ---
+        if dry_run:
+            parallelism, sessions = _slot_plan(env, lane, len(parsed.valid))
+            with admission_controller.admit(env, username, user_type, lane), \
+                    admission_controller.work_slot(env, lane, sessions):
+                plan = liberate(
+                    user_inputs=parsed.valid,
+                    env=env,
+                    username=username,
+                    user_type=user_type,
+                    ip_address=ip_address,
+                    parsed=parsed,
+                    skip_recent=not force,
+                    dry_run=True,
+                    parallelism=parallelism
+                )
+            result_list = _build_result_list(parsed.mapping, {s["sim"]: s for s in plan.get("statusList", [])})
+            planned_count = sum(1 for r in result_list if r["status"] == "planned")
+            body = {
+                "success": plan["success"],
+                "dryRun": True,
+                "results": result_list,
+                "counts": plan.get("counts", {}),
+                "spmlRequests": plan.get("spmlRequests", 0),
+                "spmlFiles": plan.get("spmlFiles", 0),
+                "spmlUnknown": plan.get("spmlUnknown", 0),
+                "message": plan.get("message") or
+                f"{planned_count} SIM seraient traitées, {len(result_list) - planned_count} anomalies."
+            }
+            if trace:
+                body["timings"] = trace.summary()
+            return jsonify(body)
+
+        # --- Idempotence : même demande (Idempotency-Key ou mêmes ICCID) → réponse mémorisée ---
+        if not stream and not force:
+            response_mode = f"{mode}|{'async' if run_async else 'sync'}"
+            idem_key = request_key(
+                username, request.headers.get("Idempotency-Key"), env, response_mode, parsed.mapping.values()
             )
+            try:
+                cached = idempotency_store.begin(
+                    idem_key, payload_fingerprint(env, response_mode, parsed.mapping.values())
+                )
+            except RequestInProgress as e:
+                return jsonify({"success": False, "message": str(e)}), 409
+            except IdempotencyKeyReused as e:
+                return jsonify({"success": False, "message": str(e)}), 422
+            if cached is not None:
+                body, code = cached
+                return jsonify({**body, "replayed": True}), code
 
-            for s in liberate_res.get("statusList", []):
-                status_by_norm[s["sim"]] = s
+        def respond(body, code=200):
+            if trace and code == 200:
+                body["timings"] = trace.summary()
+            # Seules les réponses abouties sont rejouables
+            if idem_key:
+                if code in (200, 202):
+                    idempotency_store.finish(idem_key, body, code)
+                else:
+                    idempotency_store.abort(idem_key)
+            return jsonify(body), code
 
-        # --- Résultat final ---
+        # --- Admission : limites par utilisateur / user_type (429 + Retry-After sinon) ---
+        ticket = admission_controller.admit(env, username, user_type, lane)
+
+        # --- Reprise des fichiers : runId fourni, sinon dérivé de l'utilisateur et du contenu ---
+        run_id, done_chunks = None, {}
+        if is_file:
+            fingerprint = run_fingerprint(env, JOB_CHUNK_SIZE, parsed.valid + sorted(parsed.invalid))
+            run_id = data.get("runId") or derive_run_id(username, fingerprint)
+            try:
+                done_chunks = checkpoint_store.open_run(
+                    run_id, fingerprint, username, env,
+                    total_chunks=max(-(-len(parsed.valid) // JOB_CHUNK_SIZE), 1),
+                    restart_done=not data.get("runId")
+                )
+            except (RunMismatch, RunInProgress) as e:
+                return respond({"success": False, "runId": run_id, "message": str(e)}, 409)
+            pending_run = run_id
+
+        # --- Mode job : réponse immédiate, traitement en tâche de fond ---
+        if run_async:
+            try:
+                job = job_manager.submit(
+                    username, env, len(parsed.mapping), _run_liberation_job,
+                    parsed.chunks(JOB_CHUNK_SIZE), env, username, user_type, ip_address, is_file, run_id, done_chunks,
+                    skip_recent=not force, ticket=ticket
+                )
+            except JobQueueFull as e:
+                return respond({"success": False, "message": str(e)}, 429)
+            ticket = pending_run = None  # libérés par le job
+            return respond({"success": True, "jobId": job.id, "runId": run_id, "total": job.total}, 202)
+
+        # --- Mode streaming : une ligne NDJSON par SIM ---
+        if stream:
+            slot = None
+            if lane == INTERACTIVE and 0 not in done_chunks:
+                # Créneau de la première tranche pris avant la réponse : un refus reste un 429
+                _, sessions = _slot_plan(env, lane, min(len(parsed.valid), JOB_CHUNK_SIZE))
+                slot = admission_controller.acquire_slot(env, lane, sessions)
+            try:
+                response = _stream_liberation(parsed.chunks(JOB_CHUNK_SIZE), env, username, user_type, ip_address,
+                                              is_file, run_id, done_chunks, skip_recent=not force, ticket=ticket,
+                                              slot=slot)
+            except BaseException:
+                if slot is not None:
+                    slot.release()
+                raise
+            ticket = pending_run = None  # libérés en fin de flux
+            return response
+
+        # --- Appel liberate (par tranches) ---
         result_list = []
-        for raw, norm in mapping_raw_to_norm.items():
-            base_status = status_by_norm.get(norm)
-            if not norm:
-                result_list.append({"sim": raw, "status": "error", "message": "ICCID invalide"})
-            elif base_status:
-                result_list.append({
-                    "sim": raw,
-                    "status": base_status["status"],
-                    "message": base_status.get("message", "")
-                })
-            else:
-                result_list.append({"sim": raw, "status": "error", "message": "ICCID introuvable"})
+        pending_run = None  # terminé par _iter_liberation_chunks
+        if parsed.mapping:
+            for results in _iter_liberation_chunks(parsed.chunks(JOB_CHUNK_SIZE), env, username, user_type,
+                                                   ip_address, is_file, run_id=run_id, done_chunks=done_chunks,
+                                                   skip_recent=not force, ticket=ticket):
+                result_list.extend(results)
 
+        # --- Résultat final ---
         success_count = sum(1 for r in result_list if r["status"] == "success")
 
-        return jsonify({
+        return respond({
             "success": True,
+            "runId": run_id,
             "results": result_list,
             "message": f"{success_count} SIM traitées avec succès, {len(result_list) - success_count} anomalies."
         })
 
+    except AdmissionRejected as e:
+        if idem_key:
+            idempotency_store.abort(idem_key)
+        return _admission_response(e)
+
+    except Exception as e:
+        traceback.print_exc()
+        if idem_key:
+            idempotency_store.abort(idem_key)
+        return jsonify({"success": False, "message": f"Erreur interne: {str(e)}"}), 500
+
+    finally:
+        if pending_run is not None:
+            checkpoint_store.finish_run(pending_run, "failed")
+        if ticket is not None:
+            ticket.release()
+        # Le thread sert d'autres requêtes ensuite : pas de détail hérité
+        stop_trace()
+
+
+@app.route("/sim/creation-liberation/upload", methods=["POST", "OPTIONS"])
+@jwt_required()
+def creation_liberation_upload():
+    """
+    Fichier d'ICCID (une ligne par SIM) envoyé tel quel : corps text/plain ou partie "file" d'un
+    multipart/form-data, compressé gzip ou non. Paramètres en query string (ou champs du formulaire) :
+    environment, async, force, runId. Le fichier est lu ligne à ligne et libéré par tranches de
+    JOB_CHUNK_SIZE : la mémoire dépend de la taille de tranche, pas de celle du fichier.
+    Réponse NDJSON comme le mode stream, ou 202 + jobId si async.
+    """
+    if request.method == "OPTIONS":
+        return jsonify({"status": "ok"}), 200
+
+    if lifecycle.is_draining():
+        return _draining_response()
+
+    with lifecycle.in_flight():
+        return _creation_liberation_upload()
+
+
+def _creation_liberation_upload():
+    spool = None
+    pending_run = None
+    ticket = None
+    try:
+        username = get_jwt_identity()
+        user_type = get_jwt().get("userType")
+        ip_address = request.remote_addr
+
+        multipart = request.mimetype == "multipart/form-data"
+        if not multipart and request.mimetype not in UPLOAD_MIMETYPES:
+            return jsonify({"success": False, "message": f"Type de contenu non supporté : {request.mimetype}"}), 415
+        params = request.values if multipart else request.args
+        env = params.get("environment", "UAT").upper()
+        run_async = params.get("async", "0").lower() in ("1", "true")
+        force = params.get("force", "0").lower() in ("1", "true")
+
+        # --- Admission (voie bulk) avant de lire le corps brut ---
+        ticket = admission_controller.admit(env, username, user_type, lane_for(0, upload=True))
+
+        # --- Fichier reçu : recopié par blocs (mémoire puis disque), lu plus tard ligne à ligne ---
+        if multipart:
+            upload = request.files.get("file")
+            if upload is None:
+                return jsonify({"success": False, "message": "Aucun fichier fourni (champ file)"}), 400
+            spool = spool_upload(upload.stream)
+        else:
+            spool = spool_upload(request.stream)
+
+        # --- Reprise : contenu inconnu avant lecture, tranches rejouées vérifiées une à une ---
+        requested_run_id = params.get("runId") or uuid.uuid4().hex
+        try:
+            done_chunks = checkpoint_store.open_run(
+                requested_run_id, stream_fingerprint(env, JOB_CHUNK_SIZE), username, env, total_chunks=0
+            )
+        except (RunMismatch, RunInProgress) as e:
+            return jsonify({"success": False, "runId": requested_run_id, "message": str(e)}), 409
+        run_id = pending_run = requested_run_id
+
+        parts = iter_iccid_chunks(iter_upload_lines(spool), JOB_CHUNK_SIZE)
+
+        if run_async:
+            try:
+                job = job_manager.submit(
+                    username, env, None, _run_liberation_job,
+                    parts, env, username, user_type, ip_address, True, run_id, done_chunks,
+                    skip_recent=not force, verify=True, ticket=ticket
+                )
+            except JobQueueFull as e:
+                return jsonify({"success": False, "message": str(e)}), 429
+            # Fichier fermé par iter_upload_lines en fin de lecture, ticket et run terminés par le job
+            spool = ticket = pending_run = None
+            return jsonify({"success": True, "jobId": job.id, "runId": run_id, "total": None}), 202
+
+        response = _stream_liberation(parts, env, username, user_type, ip_address, True, run_id, done_chunks,
+                                      skip_recent=not force, verify=True, ticket=ticket)
+        spool = ticket = pending_run = None
+        return response
+
+    except AdmissionRejected as e:
+        return _admission_response(e)
+
+    except UploadTooLarge as e:
+        return jsonify({"success": False, "message": str(e)}), 413
+
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"success": False, "message": f"Erreur interne: {str(e)}"}), 500
+
+    finally:
+        if pending_run is not None:
+            checkpoint_store.finish_run(pending_run, "failed")
+        if spool is not None:
+            spool.close()
+        if ticket is not None:
+            ticket.release()
+
+
+def _get_own_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None or job.owner != get_jwt_identity():
+        return None
+    return job
+
+
+@app.route("/sim/jobs/<job_id>", methods=["GET"])
+@jwt_required()
+def liberation_job_status(job_id):
+    job = _get_own_job(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": "Job introuvable"}), 404
+    return jsonify({"success": True, **job.to_dict()}), 200
+
+
+@app.route("/sim/jobs/<job_id>/results", methods=["GET"])
+@jwt_required()
+def liberation_job_results(job_id):
+    job = _get_own_job(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": "Job introuvable"}), 404
+
+    offset = request.args.get("offset", 0, type=int)
+    limit = request.args.get("limit", type=int)
+    return jsonify({
+        "success": True,
+        **job.to_dict(),
+        "offset": offset,
+        "results": job.results_slice(offset, limit)
+    }), 200
+
+
+@app.route("/sim/runs/<run_id>", methods=["GET"])
+@jwt_required()
+def liberation_run_status(run_id):
+    run = checkpoint_store.get_run(run_id)
+    if run is None or run.pop("owner") != get_jwt_identity():
+        return jsonify({"success": False, "message": "Run introuvable"}), 404
+    return jsonify({"success": True, **run}), 200
+
+
+# =========================
+# Historique SimLiberationProdUat
+# =========================
+# user_type autorisés à consulter l'activité de tous les utilisateurs (les autres ne voient que la leur)
+HISTORY_FULL_ACCESS = [
+    t.strip() for t in os.getenv("HISTORY_FULL_ACCESS", "support1515,crm_it_team").split(",") if t.strip()
+]
+
+
+def _history_filters(**overrides):
+    filters = history.parse_filters(request.args)
+    for key, value in overrides.items():
+        setattr(filters, key, value)
+    if get_jwt().get("userType") not in HISTORY_FULL_ACCESS:
+        filters.created_by = get_jwt_identity().lower()
+    return filters
+
+
+def _history_call(fn):
+    try:
+        return fn()
+    except history.InvalidQuery as e:
+        return jsonify({"success": False, "message": str(e)}), 400
     except Exception as e:
         traceback.print_exc()
         return jsonify({"success": False, "message": f"Erreur interne: {str(e)}"}), 500
 
 
+@app.route("/history", methods=["GET"])
+@jwt_required()
+def history_list():
+    return _history_call(lambda: jsonify(history.list_entries(
+        _history_filters(), history.page_size(request.args.get("limit")), request.args.get("cursor")
+    )))
+
+
+@app.route("/history/sims/<num_sim>", methods=["GET"])
+@jwt_required()
+def history_sim(num_sim):
+    return _history_call(lambda: jsonify(history.list_entries(
+        _history_filters(num_sim=normalize_iccid(num_sim).upper()),
+        history.page_size(request.args.get("limit")), request.args.get("cursor")
+    )))
+
+
+@app.route("/history/summary/users", methods=["GET"])
+@jwt_required()
+def history_user_activity():
+    return _history_call(lambda: jsonify({"items": history.user_activity(_history_filters())}))
+
+
+@app.route("/history/summary/daily", methods=["GET"])
+@jwt_required()
+def history_daily_summary():
+    return _history_call(lambda: jsonify({"items": history.daily_summary(_history_filters())}))
+
+
+@app.route("/history/export.csv", methods=["GET"])
+@jwt_required()
+def history_export():
+    def export():
+        rows = history.export_csv(_history_filters())
+        filename = f"sim-history-{datetime.now():%Y%m%d-%H%M%S}.csv"
+        return Response(rows, mimetype="text/csv",
+                        headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+    return _history_call(export)
+
+
+@app.route("/stats/oracle-pools", methods=["GET"])
+@jwt_required()
+def oracle_pool_stats():
+    return jsonify({"success": True, "pools": get_pool_stats()}), 200
+
+
+# =========================
+# Métriques Prometheus
+# =========================
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # si défini, exigé dans l'en-tête X-Metrics-Token
+
+
+def _oracle_pool_sessions():
+    return {
+        (env, state): stats[state]
+        for env, stats in get_pool_stats().items()
+        for state in ("opened", "busy", "max")
+    }
+
+
+registry.register(Gauge("oracle_pool_sessions", "Sessions des pools Oracle", ("env", "state"), _oracle_pool_sessions))
+registry.register(Gauge(
+    "sftp_pool_state", "Transport et canaux du pool SFTP", ("field",),
+    lambda: {(field,): int(value) for field, value in sftp_pool.stats().items()}
+))
+registry.register(Gauge(
+    "log_sink_entries", "Entrées de log SimLiberationProdUat (file asynchrone)", ("counter",),
+    lambda: {(counter,): value for counter, value in log_sink.stats().items()}
+))
+registry.register(Gauge(
+    "liberation_jobs_active", "Jobs de libération en attente ou en cours", (),
+    lambda: {(): job_manager.active_count()}
+))
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    if METRICS_TOKEN and request.headers.get("X-Metrics-Token") != METRICS_TOKEN:
+        return jsonify({"message": "Unauthorized"}), 401
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/health/live", methods=["GET"])
+def health_live():
+    return jsonify(lifecycle.liveness())
+
+
+@app.route("/health/ready", methods=["GET"])
+def health_ready():
+    ready, body = lifecycle.readiness()
+    return jsonify(body), 200 if ready else 503
+
+
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=5012, debug=True)
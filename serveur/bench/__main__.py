@@ -0,0 +1,312 @@
+"""
+Banc de performance hors ligne : libération PROD/UAT, création AUC et /auth/login
+sans base Oracle, boîte SFTP HLR ni Active Directory.
+
+Stand-ins :
+  - Oracle : SQLite (bench/oracle_sqlite.py) alimenté par un jeu storage_medium/port synthétique
+  - SFTP   : serveur paramiko en mémoire (bench/sftp_server.py)
+  - LDAP   : annuaire ldap3 MOCK_SYNC (bench/ldap_mock.py)
+  - Logs SimLiberationProdUat : SQLite local
+
+Depuis serveur/ :
+    python -m bench                                   # tous les scénarios
+    python -m bench --scenarios file_1k_uat,logins_cold --latency-ms 1
+    python -m bench --json bench.json                 # enregistre les résultats
+    python -m bench --baseline bench.json             # code retour 1 si régression > --max-regression
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# Configuration des modules applicatifs avant leur import (sans écraser un environnement existant)
+_BENCH_ENV = {
+    "LDAP_SERVER": "bench-dc",
+    "LDAP_BASE_DN": "bench.local",
+    "LDAP_SEARCH_BASE": "dc=bench,dc=local",
+    "SFTP_INBOX_DIR": "/inbox",
+}
+for _key, _value in _BENCH_ENV.items():
+    os.environ.setdefault(_key, _value)
+# Pas de compte de service : les recherches passent par la connexion de l'utilisateur
+os.environ["LDAP_SERVICE_USER"] = ""
+
+from sqlalchemy import create_engine, text  # noqa: E402
+
+import creation_liberation_sim as cls  # noqa: E402
+import ldap_auth  # noqa: E402
+import logs  # noqa: E402
+from metrics import start_trace, stop_trace, run_in_context  # noqa: E402
+from sftp_pool import SftpPool  # noqa: E402
+
+from bench.ldap_mock import MockDirectory  # noqa: E402
+from bench.oracle_sqlite import SqliteOracleBackend  # noqa: E402
+from bench.sftp_server import InMemorySftpServer  # noqa: E402
+
+_LOGS_TABLE = """
+CREATE TABLE IF NOT EXISTS SimLiberationProdUat (
+    id INTEGER PRIMARY KEY, action_type TEXT, status INTEGER, created_at TIMESTAMP, created_by TEXT,
+    user_type TEXT, num_sim TEXT, sim_status TEXT, dealer_id INTEGER, message TEXT, ip_address TEXT
+)
+"""
+
+
+def percentile(samples: List[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class Bench:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix="sim-bench-")
+
+        # Oracle → SQLite
+        self.oracle = SqliteOracleBackend(self.workdir, latency=args.latency_ms / 1000)
+        self.sims = [f"{cls.PREFIX}{i:012d}{cls.SUFFIX}" for i in range(args.dataset)]
+        cls.set_connection_factory(self.oracle.acquire)
+
+        # Boîte HLR → serveur SFTP local
+        self.sftp = InMemorySftpServer().start()
+        cls.sftp_pool = SftpPool(self.sftp.host, self.sftp.port, "bench", "bench",
+                                 max_channels=cls.SFTP_MAX_CHANNELS, keepalive=cls.SFTP_KEEPALIVE)
+
+        # Active Directory → ldap3 MOCK_SYNC
+        self.directory = MockDirectory(os.environ["LDAP_SEARCH_BASE"], os.environ["LDAP_BASE_DN"],
+                                       users=args.users)
+        self.directory.install()
+
+        # Logs SQL Server → SQLite
+        logs.engine = create_engine(f"sqlite:///{os.path.join(self.workdir, 'logs.sqlite3')}")
+        with logs.engine.begin() as connection:
+            connection.execute(text(_LOGS_TABLE))
+
+    def close(self) -> None:
+        logs.log_sink.close()
+        cls.sftp_pool.close()
+        self.sftp.close()
+        self.oracle.close()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    # -------------------------
+    # Mesure
+    # -------------------------
+    def measure(self, name: str, operations: List[Callable[[], int]], setup: Optional[Callable[[], None]] = None,
+                threads: int = 1) -> Dict[str, Any]:
+        """
+        Exécute les opérations (chacune retourne le nombre d'éléments traités) et agrège
+        débit, latences et allers-retours. setup() est appelé avant chaque opération, hors chrono.
+        """
+        self.oracle.reset_round_trips()
+        self.directory.reset_operations()
+        uploads_before, connections_before = self.sftp.store.uploads, self.sftp.store.connections
+
+        latencies: List[float] = []
+        items = 0
+        setup_seconds = 0.0
+        lock = threading.Lock()
+        trace = start_trace()
+
+        def run(ops):
+            nonlocal items, setup_seconds
+            for op in ops:
+                start = time.perf_counter()
+                if setup:
+                    setup()
+                    with lock:
+                        setup_seconds += time.perf_counter() - start
+                start = time.perf_counter()
+                count = op()
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    items += count
+
+        start = time.perf_counter()
+        if threads == 1:
+            run(operations)
+        else:
+            workers = [threading.Thread(target=run_in_context(run), args=(operations[i::threads],))
+                       for i in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        # Reseed hors chrono (setup n'est utilisé qu'en séquentiel)
+        wall = time.perf_counter() - start - setup_seconds
+        stages = trace.summary()["stages"]
+        stop_trace()
+
+        oracle_trips = self.oracle.reset_round_trips()
+        return {
+            "scenario": name,
+            "operations": len(latencies),
+            "items": items,
+            "wallSeconds": round(wall, 4),
+            "itemsPerSecond": round(items / wall, 2) if wall else 0.0,
+            "p50Ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95Ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99Ms": round(percentile(latencies, 99) * 1000, 2),
+            "stages": stages,
+            "roundTrips": {
+                "oracle": {f"{env}.{kind}": count for (env, kind), count in sorted(oracle_trips.items())},
+                "oracleTotal": sum(oracle_trips.values()),
+                "sftpUploads": self.sftp.store.uploads - uploads_before,
+                "sftpConnections": self.sftp.store.connections - connections_before,
+                "ldap": self.directory.reset_operations(),
+            },
+        }
+
+    def reseed(self) -> None:
+        self.oracle.seed(self.sims, seed=self.args.seed)
+
+    # -------------------------
+    # Scénarios
+    # -------------------------
+    def _liberate(self, sims: List[str], env: str, dry_run: bool = False) -> int:
+        res = cls.liberate(sims, env=env, username="bench", user_type="crm_it_team", ip_address="127.0.0.1",
+                           is_file=len(sims) > 1, parallelism=self.args.parallelism, skip_recent=False,
+                           dry_run=dry_run)
+        return len(res["statusList"])
+
+    def single(self, env: str) -> Dict[str, Any]:
+        self.reseed()
+        ops = [lambda sim=sim: self._liberate([sim], env) for sim in self.sims[:self.args.singles]]
+        return self.measure(f"single_{env.lower()}", ops)
+
+    def file(self, env: str, size: int, dry_run: bool = False) -> Dict[str, Any]:
+        sims = self.sims[:size]
+        ops = [lambda: self._liberate(sims, env, dry_run) for _ in range(self.args.repeat)]
+        label = f"{'dry_run' if dry_run else 'file'}_{size // 1000}k_{env.lower()}"
+        return self.measure(label, ops, setup=self.reseed)
+
+    def auc(self, size: int) -> Dict[str, Any]:
+        sims = self.sims[:size]
+        ops = [lambda: len(cls.creationauc(sims, env="UAT", prevalidated=True)["processed"])
+               for _ in range(self.args.repeat)]
+        self.reseed()
+        return self.measure(f"auc_{size // 1000}k", ops)
+
+    def logins(self, warm: bool) -> Dict[str, Any]:
+        from app import app
+
+        client = app.test_client()
+        users = self.directory.usernames
+        ttl = ldap_auth.LDAP_USER_TYPE_TTL
+        ldap_auth.LDAP_USER_TYPE_TTL = ttl if warm else 0
+
+        def login(username):
+            response = client.post("/auth/login", json={"username": username, "password": self.directory.password})
+            return 1 if response.status_code in (200, 403) else 0
+
+        try:
+            if warm:
+                for username in users:
+                    login(username)
+            ops = [lambda u=users[i % len(users)]: login(u) for i in range(self.args.logins)]
+            return self.measure(f"logins_{'warm' if warm else 'cold'}", ops, threads=self.args.login_threads)
+        finally:
+            ldap_auth.LDAP_USER_TYPE_TTL = ttl
+
+
+SCENARIOS: Dict[str, Callable[[Bench], Dict[str, Any]]] = {
+    "single_prod": lambda b: b.single("PROD"),
+    "single_uat": lambda b: b.single("UAT"),
+    "file_1k_prod": lambda b: b.file("PROD", 1000),
+    "file_1k_uat": lambda b: b.file("UAT", 1000),
+    "file_10k_prod": lambda b: b.file("PROD", 10000),
+    "file_10k_uat": lambda b: b.file("UAT", 10000),
+    "dry_run_10k_uat": lambda b: b.file("UAT", 10000, dry_run=True),
+    "auc_1k": lambda b: b.auc(1000),
+    "logins_cold": lambda b: b.logins(warm=False),
+    "logins_warm": lambda b: b.logins(warm=True),
+}
+
+
+def _print_result(result: Dict[str, Any]) -> None:
+    print(f"\n== {result['scenario']} ==")
+    print(f"  {result['operations']} op. / {result['items']} éléments en {result['wallSeconds']} s"
+          f" → {result['itemsPerSecond']} /s")
+    print(f"  latence p50 {result['p50Ms']} ms | p95 {result['p95Ms']} ms | p99 {result['p99Ms']} ms")
+    trips = result["roundTrips"]
+    print(f"  allers-retours Oracle {trips['oracleTotal']} {trips['oracle']}")
+    print(f"  SFTP {trips['sftpUploads']} dépôt(s), {trips['sftpConnections']} connexion(s) | LDAP {trips['ldap']}")
+    for stage, stats in sorted(result["stages"].items(), key=lambda kv: -kv[1]["seconds"]):
+        print(f"    {stage:<16} x{stats['count']:<6} {stats['seconds']:.4f} s")
+
+
+def _regressions(results: List[Dict[str, Any]], baseline_path: str, tolerance: float) -> List[str]:
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {r["scenario"]: r for r in json.load(f)["results"]}
+    problems = []
+    for result in results:
+        ref = baseline.get(result["scenario"])
+        if not ref:
+            continue
+        if result["itemsPerSecond"] < ref["itemsPerSecond"] * (1 - tolerance):
+            problems.append(f"{result['scenario']}: débit {result['itemsPerSecond']}/s < {ref['itemsPerSecond']}/s")
+        if result["p95Ms"] > ref["p95Ms"] * (1 + tolerance):
+            problems.append(f"{result['scenario']}: p95 {result['p95Ms']} ms > {ref['p95Ms']} ms")
+        if result["roundTrips"]["oracleTotal"] > ref["roundTrips"]["oracleTotal"]:
+            problems.append(f"{result['scenario']}: allers-retours Oracle "
+                            f"{result['roundTrips']['oracleTotal']} > {ref['roundTrips']['oracleTotal']}")
+    return problems
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"liste séparée par des virgules parmi : {', '.join(SCENARIOS)}")
+    parser.add_argument("--dataset", type=int, default=20000, help="ICCID du jeu synthétique")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="latence simulée par aller-retour Oracle")
+    parser.add_argument("--singles", type=int, default=200, help="libérations unitaires par scénario single_*")
+    parser.add_argument("--repeat", type=int, default=3, help="exécutions par scénario fichier / AUC")
+    parser.add_argument("--parallelism", type=int, default=cls.SIM_PARALLELISM)
+    parser.add_argument("--users", type=int, default=50, help="utilisateurs de l'annuaire simulé")
+    parser.add_argument("--logins", type=int, default=500)
+    parser.add_argument("--login-threads", type=int, default=8)
+    parser.add_argument("--json", help="fichier de sortie des résultats")
+    parser.add_argument("--baseline", help="résultats de référence (--json d'une exécution précédente)")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="tolérance relative (0.2 = 20 %%)")
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"scénario(s) inconnu(s) : {', '.join(unknown)}")
+    if args.dataset < 10000 and any("10k" in name for name in names):
+        parser.error("--dataset doit contenir au moins 10000 ICCID pour les scénarios 10k")
+
+    bench = Bench(args)
+    results = []
+    try:
+        for name in names:
+            result = SCENARIOS[name](bench)
+            _print_result(result)
+            results.append(result)
+    finally:
+        bench.close()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+    if args.baseline:
+        problems = _regressions(results, args.baseline, args.max_regression)
+        for problem in problems:
+            print(f"RÉGRESSION {problem}")
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""
+Annuaire AD simulé (ldap3 MOCK_SYNC) pour le banc de test : utilisateurs répartis dans les
+groupes de USER_TYPE_BY_GROUP, bind par UPN comme ldap_auth, binds et recherches comptés.
+"""
+import threading
+from collections import Counter
+
+from ldap3 import Connection, MOCK_SYNC, OFFLINE_AD_2012_R2, Server
+
+import ldap_auth
+
+# Groupes sans user_type : volume d'appartenances réaliste pour la recherche des groupes
+_FILLER_GROUPS = 20
+
+
+class MockDirectory:
+    def __init__(self, base_dn: str, upn_domain: str, users: int = 50, password: str = "bench"):
+        """base_dn : LDAP_SEARCH_BASE ; upn_domain : LDAP_BASE_DN (suffixe des binds username@domaine)"""
+        self.base_dn = base_dn
+        self.password = password
+        self.usernames = [f"bench{i:04d}" for i in range(users)]
+        self.server = Server("bench-dc", get_info=OFFLINE_AD_2012_R2)
+        self.upn_to_dn = {}
+        self.operations = Counter()
+        self._lock = threading.Lock()
+
+        admin = Connection(self.server, user=f"cn=admin,{base_dn}", password="admin", client_strategy=MOCK_SYNC)
+        admin.strategy.add_entry(f"cn=admin,{base_dn}", {"userPassword": "admin", "sn": "admin"})
+
+        groups = [group for group, _ in ldap_auth.USER_TYPE_BY_GROUP] + [f"Filler {i}" for i in range(_FILLER_GROUPS)]
+        members = {group: [] for group in groups}
+
+        for i, username in enumerate(self.usernames):
+            dn = f"cn={username},ou=users,{base_dn}"
+            admin.strategy.add_entry(dn, {
+                "objectClass": ["top", "person", "user"],
+                "sAMAccountName": username,
+                "userPassword": password,
+                "sn": username,
+            })
+            self.upn_to_dn[f"{username}@{upn_domain}"] = dn
+            # Un groupe user_type (le dernier utilisateur sur 10 n'en a aucun : accès refusé) + 3 groupes annexes
+            if i % 10 != 9:
+                members[ldap_auth.USER_TYPE_BY_GROUP[i % len(ldap_auth.USER_TYPE_BY_GROUP)][0]].append(dn)
+            for k in range(3):
+                members[f"Filler {(i + k) % _FILLER_GROUPS}"].append(dn)
+
+        for group, dns in members.items():
+            admin.strategy.add_entry(f"cn={group},ou=groups,{base_dn}", {
+                "objectClass": ["top", "group"],
+                "member": dns,
+                "sn": group,
+            })
+
+    def count(self, operation: str) -> None:
+        with self._lock:
+            self.operations[operation] += 1
+
+    def reset_operations(self) -> dict:
+        with self._lock:
+            counts, self.operations = dict(self.operations), Counter()
+        return counts
+
+    def install(self) -> None:
+        """Branche ldap_auth sur cet annuaire"""
+        directory = self
+
+        class MockAdConnection(Connection):
+            # MOCK_SYNC ne connaît ni le bind par UPN ni la règle LDAP_MATCHING_RULE_IN_CHAIN :
+            # UPN → DN, et appartenance directe (les groupes du jeu ne sont pas imbriqués)
+            def __init__(self, server, user=None, password=None, **kwargs):
+                for key in ("client_strategy", "pool_name", "pool_size", "pool_lifetime", "pool_keepalive"):
+                    kwargs.pop(key, None)
+                super().__init__(directory.server, user=directory.upn_to_dn.get(user, user), password=password,
+                                 client_strategy=MOCK_SYNC, **kwargs)
+
+            def bind(self, *args, **kwargs):
+                directory.count("bind")
+                return super().bind(*args, **kwargs)
+
+            def search(self, search_base, search_filter, *args, **kwargs):
+                directory.count("search")
+                search_filter = search_filter.replace(f"member:{ldap_auth.LDAP_MATCHING_RULE_IN_CHAIN}:=", "member=")
+                return super().search(search_base, search_filter, *args, **kwargs)
+
+        ldap_auth.configure_directory(directory.server, MockAdConnection)
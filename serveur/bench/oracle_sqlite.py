@@ -0,0 +1,330 @@
+"""
+Stand-in Oracle sur SQLite pour le banc de test : mêmes requêtes que creation_liberation_sim
+(array binds TABLE(:sims), DECODE, SYSDATE, schéma MEDIATION, procédures *_SIM_TEST,
+executemany batcherrors) sur un jeu storage_medium/port synthétique.
+Chaque aller-retour est compté par environnement et par type ; une latence réseau peut être simulée.
+"""
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import cx_Oracle
+
+FREE_DEALER_ID = 31970747
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS storage_medium (
+    sm_id              INTEGER PRIMARY KEY,
+    sm_serialnum       TEXT NOT NULL UNIQUE,
+    sm_status          TEXT,
+    dealer_id          INTEGER,
+    smc_id             INTEGER,
+    sm_status_mod_date TEXT,
+    sm_delivery_id     INTEGER,
+    rec_version        INTEGER,
+    prepaid_profile_id INTEGER,
+    BUSINESS_UNIT_ID   INTEGER
+);
+CREATE TABLE IF NOT EXISTS port (
+    port_id           INTEGER PRIMARY KEY,
+    sm_id             INTEGER NOT NULL,
+    port_num          TEXT,
+    port_ki           TEXT,
+    port_tkey         TEXT,
+    port_status       TEXT,
+    dealer_id         INTEGER,
+    port_statusmoddat TEXT,
+    port_moddate      TEXT,
+    dn_id             INTEGER,
+    BUSINESS_UNIT_ID  INTEGER
+);
+CREATE INDEX IF NOT EXISTS port_sm_id ON port (sm_id);
+"""
+
+_MEDIATION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS MEDIATION.SIM_TO_UPDATE (sm_serialnum TEXT PRIMARY KEY, status TEXT, message TEXT);
+CREATE TABLE IF NOT EXISTS MEDIATION.SIM_TO_CREATE (sm_serialnum TEXT PRIMARY KEY, status TEXT, message TEXT);
+"""
+
+# Répartition des sm_status du jeu synthétique (action attendue entre parenthèses)
+STATUS_WEIGHTS = (
+    (("d", None), 40),               # liberate
+    (("r", FREE_DEALER_ID), 20),     # already_free
+    (("r", None), 10),               # liberate
+    (("a", 1001), 15),               # active
+    (("b", 1001), 5),                # blocked
+    (("p", 1001), 10),               # update (UAT)
+)
+
+# Oracle → SQLite
+_REWRITES = (
+    (re.compile(r"SELECT\s+column_value\s+FROM\s+TABLE\(:(\w+)\)", re.IGNORECASE), r"SELECT value FROM json_each(:\1)"),
+    (re.compile(r"DECODE\(\s*([\w.]+)\s*,\s*(\w+)\s*,\s*(\w+)\s*,\s*(\w+)\s*\)", re.IGNORECASE),
+     r"CASE \1 WHEN \2 THEN \3 ELSE \4 END"),
+    (re.compile(r"\bSYSDATE\b", re.IGNORECASE), "CURRENT_TIMESTAMP"),
+)
+_CALL_RE = re.compile(r"^\s*CALL\s+MEDIATION\.(\w+)\(\)\s*$", re.IGNORECASE)
+
+
+def _translate(sql: str) -> str:
+    for pattern, replacement in _REWRITES:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+def _kind(sql: str) -> str:
+    return sql.split(None, 1)[0].lower()
+
+
+class _VarcharList(list):
+    """Objet SYS.ODCIVARCHAR2LIST : lié en JSON pour json_each"""
+
+
+class _ListType:
+    def newobject(self, values: List[str]) -> _VarcharList:
+        return _VarcharList(values)
+
+
+class _BatchError:
+    def __init__(self, offset: int, message: str):
+        self.offset = offset
+        self.message = message
+
+
+class SqliteCursor:
+    def __init__(self, connection: "SqliteConnection"):
+        self.connection = connection
+        self.arraysize = 100
+        self.prefetchrows = 2
+        self._cursor = connection.db.cursor()
+        self._batch_errors: List[_BatchError] = []
+
+    @staticmethod
+    def _binds(params: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: json.dumps(v) if isinstance(v, _VarcharList) else v for k, v in params.items()}
+
+    def execute(self, sql: str, params: Optional[Dict[str, Any]] = None, **kwargs) -> "SqliteCursor":
+        call = _CALL_RE.match(sql)
+        self.connection.round_trip("call" if call else _kind(sql))
+        try:
+            if call:
+                self.connection.backend.call_procedure(self._cursor, call.group(1))
+            else:
+                self._cursor.execute(_translate(sql), self._binds({**(params or {}), **kwargs}))
+        except sqlite3.Error as e:
+            raise cx_Oracle.DatabaseError(str(e)) from e
+        return self
+
+    def executemany(self, sql: str, rows: List[Dict[str, Any]], batcherrors: bool = False) -> None:
+        # Un seul aller-retour pour tout le tableau, comme l'array DML Oracle
+        self.connection.round_trip(_kind(sql))
+        sql = _translate(sql)
+        self._batch_errors = []
+        if not self.connection.db.in_transaction:
+            # Sinon le RELEASE du savepoint le plus externe validerait la transaction
+            self._cursor.execute("BEGIN")
+        for offset, row in enumerate(rows):
+            self._cursor.execute("SAVEPOINT batch_row")
+            try:
+                self._cursor.execute(sql, self._binds(row))
+            except sqlite3.Error as e:
+                self._cursor.execute("ROLLBACK TO SAVEPOINT batch_row")
+                if not batcherrors:
+                    raise cx_Oracle.DatabaseError(str(e)) from e
+                self._batch_errors.append(_BatchError(offset, str(e)))
+            finally:
+                self._cursor.execute("RELEASE SAVEPOINT batch_row")
+
+    def getbatcherrors(self) -> List[_BatchError]:
+        return self._batch_errors
+
+    def __iter__(self) -> Iterator[Tuple]:
+        # Lignes ramenées par paquets de arraysize : un aller-retour par paquet au-delà du premier
+        first = True
+        while True:
+            rows = self._cursor.fetchmany(max(1, self.arraysize))
+            if not rows:
+                return
+            if not first:
+                self.connection.round_trip("fetch")
+            first = False
+            yield from rows
+
+    def fetchone(self) -> Optional[Tuple]:
+        return self._cursor.fetchone()
+
+    def fetchall(self) -> List[Tuple]:
+        return list(self)
+
+    def close(self) -> None:
+        self._cursor.close()
+
+
+class SqliteConnection:
+    def __init__(self, backend: "SqliteOracleBackend", env: str, db: sqlite3.Connection):
+        self.backend = backend
+        self.env = env
+        self.db = db
+
+    def round_trip(self, kind: str) -> None:
+        self.backend.round_trip(self.env, kind)
+
+    def cursor(self) -> SqliteCursor:
+        return SqliteCursor(self)
+
+    def gettype(self, name: str) -> _ListType:
+        self.round_trip("describe")
+        return _ListType()
+
+    def commit(self) -> None:
+        self.round_trip("commit")
+        self.db.commit()
+
+    def rollback(self) -> None:
+        self.round_trip("rollback")
+        self.db.rollback()
+
+    def close(self) -> None:
+        # Retour au pool, transaction non validée annulée comme à la libération d'une session Oracle
+        self.db.rollback()
+        self.backend.release(self)
+
+
+class SqliteOracleBackend:
+    """
+    Bases PROD et UAT (+ schéma MEDIATION attaché) dans workdir ; acquire(env) sert de
+    fabrique de sessions pour creation_liberation_sim.set_connection_factory
+    """
+
+    def __init__(self, workdir: str, latency: float = 0.0):
+        self.workdir = workdir
+        self.latency = latency
+        self.sims: List[str] = []
+        self._idle: Dict[str, List[sqlite3.Connection]] = {"PROD": [], "UAT": []}
+        self._lock = threading.Lock()
+        self.round_trips: Counter = Counter()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.workdir, f"{name}.sqlite3")
+
+    def _connect(self, env: str) -> sqlite3.Connection:
+        db = sqlite3.connect(self._path(env), timeout=60, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("ATTACH DATABASE ? AS MEDIATION", (self._path(f"{env}_mediation"),))
+        return db
+
+    # -------------------------
+    # Jeu de données
+    # -------------------------
+    def seed(self, sims: List[str], seed: int = 42, uat_missing: float = 0.1, multi_port: float = 0.05) -> None:
+        """
+        (Re)crée PROD et UAT : storage_medium + port pour chaque ICCID de sims.
+        uat_missing : part des ICCID absents de UAT (passent par SIM_TO_CREATE).
+        """
+        self.close()
+        rng = random.Random(seed)
+        choices, weights = zip(*STATUS_WEIGHTS)
+        self.sims = list(sims)
+
+        for env in ("PROD", "UAT"):
+            for name in (env, f"{env}_mediation"):
+                for suffix in ("", "-wal", "-shm"):
+                    if os.path.exists(self._path(name) + suffix):
+                        os.remove(self._path(name) + suffix)
+
+            db = self._connect(env)
+            db.executescript(_SCHEMA)
+            db.executescript(_MEDIATION_SCHEMA)
+
+            sm_rows, port_rows = [], []
+            for sm_id, sim in enumerate(sims, start=1):
+                if env == "UAT" and rng.random() < uat_missing:
+                    continue
+                sm_status, dealer_id = rng.choices(choices, weights)[0]
+                sm_rows.append((sm_id, sim, sm_status, dealer_id, rng.choice((1, 3))))
+                for n in range(2 if rng.random() < multi_port else 1):
+                    free_port = sm_status == "r" and rng.random() < 0.8
+                    port_rows.append((
+                        sm_id, f"{sm_id:010d}{n}", f"{rng.getrandbits(128):032X}", f"{rng.getrandbits(128):032X}",
+                        "r" if free_port else sm_status, FREE_DEALER_ID if free_port else dealer_id
+                    ))
+
+            db.executemany(
+                "INSERT INTO storage_medium (sm_id, sm_serialnum, sm_status, dealer_id, smc_id) VALUES (?, ?, ?, ?, ?)",
+                sm_rows
+            )
+            db.executemany(
+                "INSERT INTO port (sm_id, port_num, port_ki, port_tkey, port_status, dealer_id) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                port_rows
+            )
+            db.commit()
+            db.close()
+
+    # -------------------------
+    # Sessions
+    # -------------------------
+    def acquire(self, env: str) -> SqliteConnection:
+        env = "PROD" if env.upper() == "PROD" else "UAT"
+        with self._lock:
+            db = self._idle[env].pop() if self._idle[env] else None
+        return SqliteConnection(self, env, db or self._connect(env))
+
+    def release(self, connection: SqliteConnection) -> None:
+        with self._lock:
+            self._idle[connection.env].append(connection.db)
+
+    def close(self) -> None:
+        with self._lock:
+            for dbs in self._idle.values():
+                for db in dbs:
+                    db.close()
+                dbs.clear()
+
+    def round_trip(self, env: str, kind: str) -> None:
+        with self._lock:
+            self.round_trips[(env, kind)] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def reset_round_trips(self) -> Dict[Tuple[str, str], int]:
+        with self._lock:
+            counts, self.round_trips = dict(self.round_trips), Counter()
+        return counts
+
+    # -------------------------
+    # Procédures MEDIATION
+    # -------------------------
+    def call_procedure(self, cursor: sqlite3.Cursor, name: str) -> None:
+        name = name.upper()
+        if name == "UPDATE_SIM_TEST":
+            cursor.execute(f"""
+                UPDATE storage_medium SET sm_status = 'r', dealer_id = {FREE_DEALER_ID},
+                       sm_status_mod_date = CURRENT_TIMESTAMP
+                WHERE sm_serialnum IN (SELECT sm_serialnum FROM MEDIATION.SIM_TO_UPDATE)
+            """)
+            cursor.execute("DELETE FROM MEDIATION.SIM_TO_UPDATE")
+        elif name == "CREATE_SIM_TEST":
+            cursor.execute(f"""
+                INSERT INTO storage_medium (sm_serialnum, sm_status, dealer_id, smc_id, sm_status_mod_date)
+                SELECT sm_serialnum, 'r', {FREE_DEALER_ID}, 1, CURRENT_TIMESTAMP
+                FROM MEDIATION.SIM_TO_CREATE
+                WHERE sm_serialnum NOT IN (SELECT sm_serialnum FROM storage_medium)
+            """)
+            cursor.execute(f"""
+                INSERT INTO port (sm_id, port_num, port_ki, port_tkey, port_status, dealer_id)
+                SELECT sm.sm_id, printf('%010d0', sm.sm_id), hex(randomblob(16)), hex(randomblob(16)),
+                       'r', {FREE_DEALER_ID}
+                FROM storage_medium sm
+                WHERE sm.sm_serialnum IN (SELECT sm_serialnum FROM MEDIATION.SIM_TO_CREATE)
+                  AND NOT EXISTS (SELECT 1 FROM port p WHERE p.sm_id = sm.sm_id)
+            """)
+            cursor.execute("DELETE FROM MEDIATION.SIM_TO_CREATE")
+        else:
+            raise sqlite3.OperationalError(f"unknown procedure MEDIATION.{name}")
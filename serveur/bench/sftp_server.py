@@ -0,0 +1,141 @@
+"""
+Serveur SFTP paramiko en mémoire pour le banc de test : accepte tout login/mot de passe,
+conserve les fichiers déposés (la boîte HLR) et compte connexions et dépôts.
+"""
+import io
+import socket
+import threading
+from typing import Dict, List
+
+import paramiko
+
+
+class _FileStore:
+    def __init__(self):
+        self.files: Dict[str, bytes] = {}
+        self.connections = 0
+        self.uploads = 0
+        self._lock = threading.Lock()
+
+    def save(self, path: str, data: bytes) -> None:
+        with self._lock:
+            self.files[path] = data
+            self.uploads += 1
+
+    def rename(self, old: str, new: str) -> bool:
+        with self._lock:
+            if old not in self.files or new in self.files:
+                return False
+            self.files[new] = self.files.pop(old)
+            return True
+
+    def remove(self, path: str) -> bool:
+        with self._lock:
+            return self.files.pop(path, None) is not None
+
+    def size(self, path: str):
+        with self._lock:
+            data = self.files.get(path)
+        return None if data is None else len(data)
+
+
+class _Server(paramiko.ServerInterface):
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+
+class _Handle(paramiko.SFTPHandle):
+    def __init__(self, store: _FileStore, path: str, flags: int):
+        super().__init__(flags)
+        self.store = store
+        self.path = path
+        self.buffer = io.BytesIO()
+
+    def write(self, offset, data):
+        self.buffer.seek(offset)
+        self.buffer.write(data)
+        return paramiko.SFTP_OK
+
+    def stat(self):
+        attr = paramiko.SFTPAttributes()
+        attr.st_size = len(self.buffer.getvalue())
+        return attr
+
+    def close(self):
+        self.store.save(self.path, self.buffer.getvalue())
+        super().close()
+
+
+class _SftpInterface(paramiko.SFTPServerInterface):
+    def __init__(self, server, *args, store: _FileStore, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.store = store
+
+    def open(self, path, flags, attr):
+        return _Handle(self.store, self.canonicalize(path), flags)
+
+    def stat(self, path):
+        size = self.store.size(self.canonicalize(path))
+        if size is None:
+            return paramiko.SFTP_NO_SUCH_FILE
+        attr = paramiko.SFTPAttributes()
+        attr.st_size = size
+        return attr
+
+    lstat = stat
+
+    def rename(self, oldpath, newpath):
+        # Comme un serveur SFTP v3 : la cible ne doit pas exister
+        if self.store.rename(self.canonicalize(oldpath), self.canonicalize(newpath)):
+            return paramiko.SFTP_OK
+        return paramiko.SFTP_FAILURE
+
+    def remove(self, path):
+        return paramiko.SFTP_OK if self.store.remove(self.canonicalize(path)) else paramiko.SFTP_NO_SUCH_FILE
+
+
+class InMemorySftpServer:
+    """Serveur SSH/SFTP local sur 127.0.0.1:<port libre>, un thread d'acceptation"""
+
+    def __init__(self):
+        self.store = _FileStore()
+        self._host_key = paramiko.RSAKey.generate(2048)
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(16)
+        self.host, self.port = self._sock.getsockname()
+        self._transports: List[paramiko.Transport] = []
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._accept, name="bench-sftp", daemon=True)
+
+    def start(self) -> "InMemorySftpServer":
+        self._thread.start()
+        return self
+
+    def _accept(self) -> None:
+        while not self._closed.is_set():
+            try:
+                sock, _ = self._sock.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(sock)
+            transport.add_server_key(self._host_key)
+            transport.set_subsystem_handler("sftp", paramiko.SFTPServer, _SftpInterface, store=self.store)
+            transport.start_server(server=_Server())
+            self._transports.append(transport)
+            self.store.connections += 1
+
+    def close(self) -> None:
+        self._closed.set()
+        self._sock.close()
+        for transport in self._transports:
+            transport.close()
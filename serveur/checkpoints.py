@@ -0,0 +1,268 @@
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from processes import process_alive
+
+# === CONFIG reprise des traitements fichier ===
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "checkpoints.sqlite3")   # fichier SQLite local
+CHECKPOINT_TTL = int(os.getenv("CHECKPOINT_TTL", "86400"))          # s de conservation d'un run
+# s sans battement de cœur avant reprise possible (renouvelé toutes les CHECKPOINT_LEASE / 3 s par le process
+# qui tient le run) ; un run dont le process n'existe plus est repris immédiatement
+CHECKPOINT_LEASE = int(os.getenv("CHECKPOINT_LEASE", "60"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id       TEXT PRIMARY KEY,
+    fingerprint  TEXT NOT NULL,
+    owner        TEXT,
+    holder       TEXT,
+    env          TEXT NOT NULL,
+    total_chunks INTEGER NOT NULL,
+    done_chunks  INTEGER NOT NULL DEFAULT 0,
+    status       TEXT NOT NULL,
+    created_at   REAL NOT NULL,
+    updated_at   REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    run_id       TEXT NOT NULL,
+    chunk_index  INTEGER NOT NULL,
+    results      TEXT NOT NULL,
+    committed_at REAL NOT NULL,
+    PRIMARY KEY (run_id, chunk_index)
+);
+"""
+
+
+class RunMismatch(Exception):
+    """Le run id existe déjà pour un autre utilisateur ou un autre jeu d'ICCID"""
+
+
+class RunInProgress(Exception):
+    """Le run est tenu par un process vivant dont le dernier battement date de moins de CHECKPOINT_LEASE s"""
+
+
+def _holder() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _holder_alive(holder: Optional[str]) -> bool:
+    """Process du même hôte : vérifié par son pid ; autre hôte : supposé vivant (seul le bail compte)"""
+    if not holder:
+        return False
+    host, _, pid = holder.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    return process_alive(int(pid))
+
+
+def run_fingerprint(env: str, chunk_size: int, sims: List[str]) -> str:
+    """Empreinte du découpage : même env, même taille de tranche, mêmes ICCID dans le même ordre"""
+    h = hashlib.sha256(f"{env.upper()}|{chunk_size}".encode())
+    for sim in sims:
+        h.update(b"\n")
+        h.update(sim.encode())
+    return h.hexdigest()
+
+
+def stream_fingerprint(env: str, chunk_size: int) -> str:
+    """
+    Fichier lu en flux (upload) : contenu inconnu à l'ouverture du run ; chaque tranche rejouée
+    est comparée aux ICCID enregistrés (cf. verify_replay)
+    """
+    return run_fingerprint(env, chunk_size, []) + ":stream"
+
+
+def derive_run_id(owner: str, fingerprint: str) -> str:
+    """Run id par défaut : le même fichier renvoyé par le même utilisateur reprend le même run"""
+    return hashlib.sha256(f"{owner}|{fingerprint}".encode()).hexdigest()[:32]
+
+
+def verify_replay(run_id: str, chunk_index: int, expected_sims: Iterable[str],
+                  status_list: List[Dict[str, Any]]) -> None:
+    """Les ICCID de la tranche relue doivent tous figurer dans les résultats enregistrés"""
+    saved = {entry["sim"] for entry in status_list}
+    if any(sim not in saved for sim in expected_sims):
+        raise RunMismatch(f"La tranche {chunk_index} du run {run_id} ne correspond pas au fichier envoyé")
+
+
+class CheckpointStore:
+    """
+    Point de reprise par tranche validée (commit Oracle + AUC déposé) d'un traitement fichier.
+    Un run relancé avec le même run id saute les tranches déjà terminées et renvoie leurs résultats.
+    Le run est tenu par un seul process (holder = hôte:pid) : bail renouvelé par un thread de fond tant
+    que le run est ouvert (tranches longues, job en file), repris dès que ce process n'existe plus.
+    """
+
+    def __init__(self, path: str, ttl: int, lease: int):
+        self.path = path
+        self.ttl = ttl
+        self.lease = lease
+        self._lock = threading.Lock()
+        self._initialized = False
+        self._held = set()
+        self._heartbeat = None
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            if not self._initialized:
+                with self._lock:
+                    if not self._initialized:
+                        conn.execute("PRAGMA journal_mode=WAL")
+                        conn.executescript(_SCHEMA)
+                        # Base créée avant la colonne holder
+                        if "holder" not in {row[1] for row in conn.execute("PRAGMA table_info(runs)")}:
+                            conn.execute("ALTER TABLE runs ADD COLUMN holder TEXT")
+                        self._initialized = True
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _purge(self, conn: sqlite3.Connection) -> None:
+        expired = time.time() - self.ttl
+        conn.execute("DELETE FROM chunks WHERE run_id IN (SELECT run_id FROM runs WHERE updated_at < ?)", (expired,))
+        conn.execute("DELETE FROM runs WHERE updated_at < ?", (expired,))
+
+    def open_run(self, run_id: str, fingerprint: str, owner: str, env: str, total_chunks: int,
+                 restart_done: bool = False) -> Dict[int, List[Dict[str, Any]]]:
+        """
+        Crée ou reprend un run ; retourne les résultats des tranches déjà validées {chunk_index: statusList}.
+        restart_done : un run déjà terminé repart de zéro au lieu d'être rejoué.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            self._purge(conn)
+            row = conn.execute(
+                "SELECT fingerprint, owner, status, updated_at, holder FROM runs WHERE run_id = ?", (run_id,)
+            ).fetchone()
+
+            if row is not None:
+                if row[0] != fingerprint or row[1] != owner:
+                    raise RunMismatch(f"Le run {run_id} correspond à un autre traitement")
+                if row[2] == "running" and now - row[3] < self.lease and _holder_alive(row[4]):
+                    raise RunInProgress(f"Le run {run_id} est déjà en cours de traitement")
+                if restart_done and row[2] == "done":
+                    conn.execute("DELETE FROM chunks WHERE run_id = ?", (run_id,))
+                    conn.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+                    row = None
+
+            if row is None:
+                conn.execute(
+                    "INSERT INTO runs (run_id, fingerprint, owner, holder, env, total_chunks, status, created_at, "
+                    "updated_at) VALUES (?, ?, ?, ?, ?, ?, 'running', ?, ?)",
+                    (run_id, fingerprint, owner, _holder(), env, total_chunks, now, now)
+                )
+                done = {}
+            else:
+                conn.execute("UPDATE runs SET status = 'running', holder = ?, updated_at = ? WHERE run_id = ?",
+                             (_holder(), now, run_id))
+                done = {
+                    index: json.loads(results)
+                    for index, results in conn.execute(
+                        "SELECT chunk_index, results FROM chunks WHERE run_id = ?", (run_id,)
+                    )
+                }
+        self._hold(run_id)
+        return done
+
+    def save_chunk(self, run_id: str, chunk_index: int, results: List[Dict[str, Any]]) -> None:
+        """
+        Enregistre une tranche validée et renouvelle le bail ; RunInProgress si le run a été repris
+        par un autre process entre-temps (le traitement doit alors s'arrêter)
+        """
+        now = time.time()
+        with self._connect() as conn:
+            # Écriture en premier : le verrou SQLite est pris avant de vérifier qui tient le run
+            held = conn.execute("UPDATE runs SET updated_at = ? WHERE run_id = ? AND holder = ?",
+                                (now, run_id, _holder())).rowcount
+            if not held:
+                self._release(run_id)
+                raise RunInProgress(f"Le run {run_id} a été repris par un autre traitement")
+            conn.execute(
+                "INSERT OR REPLACE INTO chunks (run_id, chunk_index, results, committed_at) VALUES (?, ?, ?, ?)",
+                (run_id, chunk_index, json.dumps(results), now)
+            )
+            conn.execute(
+                "UPDATE runs SET done_chunks = (SELECT COUNT(*) FROM chunks WHERE run_id = ?) WHERE run_id = ?",
+                (run_id, run_id)
+            )
+
+    # -------------------------
+    # Bail (battement de cœur)
+    # -------------------------
+    def _hold(self, run_id: str) -> None:
+        with self._lock:
+            self._held.add(run_id)
+            if self._heartbeat is None or not self._heartbeat.is_alive():
+                self._heartbeat = threading.Thread(target=self._beat, name="checkpoint-lease", daemon=True)
+                self._heartbeat.start()
+
+    def _release(self, run_id: str) -> None:
+        with self._lock:
+            self._held.discard(run_id)
+
+    def _beat(self) -> None:
+        while True:
+            time.sleep(max(self.lease / 3, 0.1))
+            with self._lock:
+                held = list(self._held)
+                if not held:
+                    self._heartbeat = None
+                    return
+            try:
+                self.renew(held)
+            except Exception as e:
+                print(f"[CHECKPOINT] Renouvellement du bail impossible : {e}")
+
+    def renew(self, run_ids: List[str]) -> None:
+        """Renouvelle le bail des runs tenus par ce process ; ceux repris ailleurs ne sont plus suivis"""
+        with self._connect() as conn:
+            for run_id in run_ids:
+                renewed = conn.execute(
+                    "UPDATE runs SET updated_at = ? WHERE run_id = ? AND holder = ? AND status = 'running'",
+                    (time.time(), run_id, _holder())
+                ).rowcount
+                if not renewed:
+                    self._release(run_id)
+
+    def finish_run(self, run_id: str, status: str = "done", total_chunks: Optional[int] = None) -> None:
+        """
+        status : done, ou failed pour un run interrompu (reprise possible sans attendre CHECKPOINT_LEASE).
+        total_chunks : nombre de tranches connu en fin de lecture (fichier lu en flux)
+        Sans effet si le run a été repris par un autre process.
+        """
+        self._release(run_id)
+        with self._connect() as conn:
+            if total_chunks is not None:
+                conn.execute("UPDATE runs SET total_chunks = ? WHERE run_id = ? AND holder = ?",
+                             (total_chunks, run_id, _holder()))
+            conn.execute("UPDATE runs SET status = ?, updated_at = ? WHERE run_id = ? AND holder = ?",
+                         (status, time.time(), run_id, _holder()))
+
+    def get_run(self, run_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT run_id, owner, env, total_chunks, done_chunks, status FROM runs WHERE run_id = ?", (run_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "runId": row[0],
+            "owner": row[1],
+            "environment": row[2],
+            "totalChunks": row[3],
+            "doneChunks": row[4],
+            "status": row[5],
+        }
+
+
+checkpoint_store = CheckpointStore(CHECKPOINT_DB, CHECKPOINT_TTL, CHECKPOINT_LEASE)
@@ -1,10 +1,21 @@
 import os
 from dotenv import load_dotenv
 
+load_dotenv()
+
 LOGS_DB_CONFIG = {
     "server": os.getenv("LOGS_DB_SERVER"),
     "database": os.getenv("LOGS_DB_NAME"),
     "username": os.getenv("LOGS_DB_USERNAME"),
     "password": os.getenv("LOGS_DB_PASSWORD"),
     "driver": "ODBC Driver 18 for SQL Server"
-}
\ No newline at end of file
+}
+
+# Écriture asynchrone des logs (file bornée + insertion par lots)
+LOGS_SINK_CONFIG = {
+    "async": os.getenv("LOGS_ASYNC", "1") == "1",
+    "queue_size": int(os.getenv("LOGS_QUEUE_SIZE", "10000")),
+    "batch_size": int(os.getenv("LOGS_BATCH_SIZE", "200")),
+    "flush_interval": float(os.getenv("LOGS_FLUSH_INTERVAL", "2")),
+    "spill_file": os.getenv("LOGS_SPILL_FILE", "logs_spill.jsonl")
+}
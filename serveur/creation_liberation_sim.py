@@ -1,14 +1,20 @@
-import io
+import itertools
 import re
+import tempfile
 import cx_Oracle
-import paramiko
-import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
 from datetime import datetime
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Callable, Set, IO, Iterable
+from dataclasses import dataclass, field
 import traceback
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from logs import log_sim_liberation
+from sftp_pool import SftpPool
+from idempotency import recent_liberations
+from metrics import timed, timed_iter, run_in_context, SIM_RESULTS
 
 # === Charger variables d'environnement ===
 load_dotenv()
@@ -34,21 +40,130 @@ SFTP_PORT = int(os.getenv("SFTP_PORT", "22"))
 SFTP_USER = os.getenv("SFTP_USER")
 SFTP_PASSWORD = os.getenv("SFTP_PASSWORD")
 SFTP_INBOX_DIR = os.getenv("SFTP_INBOX_DIR")
+SFTP_MAX_CHANNELS = int(os.getenv("SFTP_MAX_CHANNELS", "4"))   # canaux SFTP simultanés
+SFTP_KEEPALIVE = int(os.getenv("SFTP_KEEPALIVE", "30"))        # s entre deux keepalive SSH
 
 # SIM config
 PREFIX = os.getenv("SIM_PREFIX", "8921303")
 SUFFIX = os.getenv("SIM_SUFFIX", "F")
 
+# Contrôle du chiffre de Luhn des ICCID (rejet avant Oracle)
+SIM_LUHN_CHECK = os.getenv("SIM_LUHN_CHECK", "0") == "1"
+
+# Traitement par lots (nombre d'ICCID par requête bulk)
+SIM_CHUNK_SIZE = int(os.getenv("SIM_CHUNK_SIZE", "500"))
+# Mode bulk : UPDATE en array DML (executemany) et un seul commit par lot
+SIM_BULK_MODE = os.getenv("SIM_BULK_MODE", "1") == "1"
+# Lots traités en parallèle (une session Oracle par worker), borné par SIM_MAX_PARALLELISM
+SIM_PARALLELISM = int(os.getenv("SIM_PARALLELISM", "1"))
+SIM_MAX_PARALLELISM = int(os.getenv("SIM_MAX_PARALLELISM", "4"))
+# Découpage des fichiers SPML (batchRequest) : nombre de requêtes / taille max par fichier
+AUC_SPML_MAX_REQUESTS = int(os.getenv("AUC_SPML_MAX_REQUESTS", "1000"))
+AUC_SPML_MAX_BYTES = int(os.getenv("AUC_SPML_MAX_BYTES", str(5 * 1024 * 1024)))
+AUC_FETCH_CHUNK_SIZE = int(os.getenv("AUC_FETCH_CHUNK_SIZE", "1000"))   # SIM par requête de lecture des ports/KI
+AUC_FETCH_ARRAYSIZE = int(os.getenv("AUC_FETCH_ARRAYSIZE", "1000"))     # lignes ramenées par aller-retour
+AUC_SPML_SPOOL_BYTES = int(os.getenv("AUC_SPML_SPOOL_BYTES", str(1024 * 1024)))   # au-delà : fichier temporaire disque
+
+# Pool de sessions Oracle (un par environnement)
+ORA_POOL_MIN = int(os.getenv("ORA_POOL_MIN", "1"))
+ORA_POOL_MAX = int(os.getenv("ORA_POOL_MAX", "8"))
+ORA_POOL_INCREMENT = int(os.getenv("ORA_POOL_INCREMENT", "1"))
+ORA_POOL_TIMEOUT = int(os.getenv("ORA_POOL_TIMEOUT", "300"))              # s avant fermeture d'une session inactive
+ORA_POOL_WAIT_TIMEOUT = int(os.getenv("ORA_POOL_WAIT_TIMEOUT", "10000"))  # ms d'attente max d'une session libre
+ORA_POOL_PING_INTERVAL = int(os.getenv("ORA_POOL_PING_INTERVAL", "60"))   # s avant ping d'une session au acquire
+ORA_STMT_CACHE_SIZE = int(os.getenv("ORA_STMT_CACHE_SIZE", "50"))
+
 # =========================
 # Connexion Oracle helpers
 # =========================
+_pools: Dict[str, cx_Oracle.SessionPool] = {}
+_pools_lock = threading.Lock()
+
+# Fabrique de sessions de remplacement (banc de test hors ligne) ; None = pools Oracle
+_connection_factory: Optional[Callable[[str], cx_Oracle.Connection]] = None
+
+def _pool_key(env: str) -> str:
+    return "PROD" if env.upper() == "PROD" else "UAT"
+
+def get_pool(env: str) -> cx_Oracle.SessionPool:
+    """
+    Pool de sessions de l'environnement, créé au premier usage puis partagé entre les requêtes
+    """
+    key = _pool_key(env)
+    pool = _pools.get(key)
+    if pool is not None:
+        return pool
+
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            if key == "PROD":
+                host, port, service, user, pwd = DB_HOST_PROD, DB_PORT_PROD, DB_SERVICE_PROD, DB_USER_PROD, DB_PASSWORD_PROD
+            else:
+                host, port, service, user, pwd = DB_HOST_UAT, DB_PORT_UAT, DB_SERVICE_UAT, DB_USER_UAT, DB_PASSWORD_UAT
+            dsn = cx_Oracle.makedsn(host, port, service_name=service)
+            pool = cx_Oracle.SessionPool(
+                user=user,
+                password=pwd,
+                dsn=dsn,
+                min=ORA_POOL_MIN,
+                max=ORA_POOL_MAX,
+                increment=ORA_POOL_INCREMENT,
+                threaded=True,
+                getmode=cx_Oracle.SPOOL_ATTRVAL_TIMEDWAIT,
+                wait_timeout=ORA_POOL_WAIT_TIMEOUT,
+                timeout=ORA_POOL_TIMEOUT,
+                stmtcachesize=ORA_STMT_CACHE_SIZE,
+                ping_interval=ORA_POOL_PING_INTERVAL
+            )
+            _pools[key] = pool
+    return pool
+
+def get_pool_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Statistiques des pools déjà créés (sessions ouvertes / occupées / bornes)
+    """
+    return {
+        key: {
+            "opened": pool.opened,
+            "busy": pool.busy,
+            "min": pool.min,
+            "max": pool.max,
+            "increment": pool.increment,
+            "stmtcachesize": pool.stmtcachesize,
+        }
+        for key, pool in list(_pools.items())
+    }
+
+def close_pools() -> None:
+    """
+    Ferme les pools Oracle (arrêt du worker) ; un get_pool ultérieur les recrée
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        try:
+            pool.close(force=True)
+        except cx_Oracle.Error:
+            traceback.print_exc()
+
+def set_connection_factory(factory: Optional[Callable[[str], cx_Oracle.Connection]]) -> None:
+    """
+    factory("PROD" | "UAT") → connexion compatible cx_Oracle (close() la libère) ;
+    None revient aux pools Oracle
+    """
+    global _connection_factory
+    _connection_factory = factory
+
 def get_connection(env) -> Tuple[cx_Oracle.Connection, cx_Oracle.Cursor]:
-    if env.upper() == "PROD":
-        host, port, service, user, pwd = DB_HOST_PROD, DB_PORT_PROD, DB_SERVICE_PROD, DB_USER_PROD, DB_PASSWORD_PROD
-    else:
-        host, port, service, user, pwd = DB_HOST_UAT, DB_PORT_UAT, DB_SERVICE_UAT, DB_USER_UAT, DB_PASSWORD_UAT
-    dsn = cx_Oracle.makedsn(host, port, service_name=service)
-    conn = cx_Oracle.connect(user=user, password=pwd, dsn=dsn)
+    # Session prise dans le pool : close() la rend au pool (les sessions inactives
+    # depuis plus de ORA_POOL_PING_INTERVAL sont pingées et remplacées si mortes)
+    with timed("oracle_acquire", env):
+        if _connection_factory is not None:
+            conn = _connection_factory(_pool_key(env))
+        else:
+            conn = get_pool(env).acquire()
     return conn, conn.cursor()
 
 def close_connection(conn: Optional[cx_Oracle.Connection], cur: Optional[cx_Oracle.Cursor]) -> None:
@@ -57,6 +172,7 @@ def close_connection(conn: Optional[cx_Oracle.Connection], cur: Optional[cx_Orac
             cur.close()
     finally:
         if conn:
+            _list_types.pop(id(conn), None)
             conn.close()
 
 # =========================
@@ -68,102 +184,529 @@ def normalize_iccid(iccid: str) -> str:
         return f"{PREFIX}{iccid}{SUFFIX}"
     return iccid
 
-def is_valid_sm_serialnum(sm_serialnum: str) -> bool:
-    return re.match(rf'^{PREFIX}\d{{12}}{SUFFIX}$', (sm_serialnum or "").strip().upper()) is not None
+_SM_SERIALNUM_RE = re.compile(rf'^{re.escape(PREFIX)}\d{{12}}{re.escape(SUFFIX)}$')
+
+def _luhn_ok(digits: str) -> bool:
+    total = 0
+    for i, d in enumerate(reversed(digits)):
+        n = ord(d) - 48
+        if i % 2:
+            n = n * 2 - 9 if n > 4 else n * 2
+        total += n
+    return total % 10 == 0
+
+def is_valid_sm_serialnum(sm_serialnum: str, luhn: bool = False) -> bool:
+    sm_serialnum = (sm_serialnum or "").strip().upper()
+    if _SM_SERIALNUM_RE.match(sm_serialnum) is None:
+        return False
+    # Chiffre de contrôle Luhn : porte sur les chiffres de l'ICCID (hors suffixe)
+    return not luhn or _luhn_ok(sm_serialnum[:len(sm_serialnum) - len(SUFFIX)])
+
+@dataclass
+class ParsedIccids:
+    """
+    Résultat de parse_iccids : tout ce dont les couches suivantes ont besoin, sans re-parser
+    """
+    mapping: Dict[str, str] = field(default_factory=dict)   # saisie brute → ICCID normalisé
+    valid: List[str] = field(default_factory=list)          # ICCID valides, dédoublonnés, ordre d'entrée
+    invalid: Dict[str, str] = field(default_factory=dict)   # ICCID normalisé invalide → motif
+    duplicates: int = 0
+
+    def in_input_order(self, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Statuts remis dans l'ordre de saisie (première occurrence de chaque ICCID normalisé)"""
+        position = {}
+        for norm in self.mapping.values():
+            position.setdefault(norm, len(position))
+        return sorted(entries, key=lambda entry: position.get(entry["sim"], len(position)))
+
+    def chunks(self, size: int) -> Iterator["ParsedIccids"]:
+        """Découpe en sous-ensembles de size ICCID valides (les invalides vont dans le premier)"""
+        raws_by_norm: Dict[str, List[str]] = {}
+        for raw, norm in self.mapping.items():
+            raws_by_norm.setdefault(norm, []).append(raw)
+
+        for i in range(0, max(len(self.valid), 1), size):
+            part = ParsedIccids(valid=self.valid[i:i + size])
+            if i == 0:
+                part.invalid = self.invalid
+                part.duplicates = self.duplicates
+            for norm in itertools.chain(part.valid, part.invalid):
+                for raw in raws_by_norm.get(norm, []):
+                    part.mapping[raw] = norm
+            yield part
+
+def parse_iccids(raw_items: Iterable[str], luhn: bool = SIM_LUHN_CHECK) -> ParsedIccids:
+    """
+    Étape unique de parsing d'une saisie / d'un fichier : normalise, valide (regex précompilée,
+    Luhn optionnel), dédoublonne et classe chaque ICCID
+    """
+    parsed = ParsedIccids()
+    seen = set()
+
+    for raw in raw_items:
+        raw = raw.strip()
+        if not raw:
+            continue
+        if raw in parsed.mapping:
+            parsed.duplicates += 1
+            continue
+
+        norm = normalize_iccid(raw).upper()
+        parsed.mapping[raw] = norm
+        if norm in seen:
+            parsed.duplicates += 1
+            continue
+        seen.add(norm)
+
+        reason = _invalid_reason(norm, luhn)
+        if reason:
+            parsed.invalid[norm] = reason
+        else:
+            parsed.valid.append(norm)
+
+    return parsed
+
+def _invalid_reason(norm: str, luhn: bool) -> Optional[str]:
+    if _SM_SERIALNUM_RE.match(norm) is None:
+        return "Invalid SIM number"
+    if luhn and not _luhn_ok(norm[:len(norm) - len(SUFFIX)]):
+        return "Invalid SIM check digit"
+    return None
+
+def iter_iccid_chunks(raw_items: Iterable[str], size: int, luhn: bool = SIM_LUHN_CHECK) -> Iterator[ParsedIccids]:
+    """
+    Variante incrémentale de parse_iccids pour les fichiers lus en flux : produit une tranche dès que
+    size ICCID valides sont réunis (les invalides vont dans la tranche où ils apparaissent).
+    Seuls les ICCID normalisés déjà vus sont gardés pour le dédoublonnage ; un doublon,
+    même saisi différemment, est seulement compté (sa première occurrence a déjà un statut).
+    Produit au moins une tranche (vide si l'entrée l'est).
+    """
+    seen = set()
+    part = ParsedIccids()
+    produced = False
+
+    for raw in raw_items:
+        raw = raw.strip()
+        if not raw:
+            continue
+        norm = normalize_iccid(raw).upper()
+        if norm in seen:
+            part.duplicates += 1
+            continue
+        seen.add(norm)
+
+        part.mapping[raw] = norm
+        reason = _invalid_reason(norm, luhn)
+        if reason:
+            part.invalid[norm] = reason
+            continue
+        part.valid.append(norm)
+        if len(part.valid) >= size:
+            yield part
+            produced = True
+            part = ParsedIccids()
+
+    if part.mapping or part.duplicates or not produced:
+        yield part
+
+# =========================
+# Lectures bulk (array binds)
+# =========================
+def _chunks(items: List[Any], size: int) -> Iterator[List[Any]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+# Type SYS.ODCIVARCHAR2LIST par connexion ouverte (id → type) : gettype coûte un aller-retour de
+# description, fait une fois par session empruntée et non à chaque requête bulk ; retiré par close_connection
+_list_types: Dict[int, Any] = {}
+
+def _varchar_array(cursor: cx_Oracle.Cursor, values: List[str]) -> cx_Oracle.Object:
+    conn = cursor.connection
+    list_type = _list_types.get(id(conn))
+    if list_type is None:
+        list_type = _list_types[id(conn)] = conn.gettype("SYS.ODCIVARCHAR2LIST")
+    return list_type.newobject(values)
+
+def _fetch_sim_rows(cursor: cx_Oracle.Cursor, sims: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Récupère en une seule requête storage_medium + port pour tout un lot d'ICCID.
+    Retourne {sm_serialnum: {sm_status, dealer_id, sm_id, has_port, port_status, port_dealer, port_count}}
+    """
+    if not sims:
+        return {}
+
+    cursor.execute("""
+        SELECT sm.sm_serialnum, sm.sm_status, sm.dealer_id, sm.sm_id,
+               p.sm_id, p.port_status, p.dealer_id
+        FROM storage_medium sm
+        LEFT JOIN port p ON p.sm_id = sm.sm_id
+        WHERE sm.sm_serialnum IN (SELECT column_value FROM TABLE(:sims))
+    """, sims=_varchar_array(cursor, sims))
+
+    rows = {}
+    for serial, sm_status, dealer_id, sm_id, port_sm_id, port_status, port_dealer in cursor:
+        # Une SIM peut avoir plusieurs ports : on garde le premier (comme l'ancien fetchone)
+        row = rows.setdefault(serial, {
+            "sm_status": sm_status,
+            "dealer_id": dealer_id,
+            "sm_id": sm_id,
+            "has_port": port_sm_id is not None,
+            "port_status": port_status,
+            "port_dealer": port_dealer,
+            "port_count": 0,
+        })
+        # Un port = une spml:AddRequest à la création AUC
+        row["port_count"] += port_sm_id is not None
+    return rows
+
+def _fetch_active_sims(cursor: cx_Oracle.Cursor, sims: List[str]) -> Set[str]:
+    """
+    Garde-fou PROD des runs UAT : ICCID du lot actifs (sm_status = 'a') dans cet environnement
+    """
+    if not sims:
+        return set()
+
+    cursor.execute("""
+        SELECT sm_serialnum
+        FROM storage_medium
+        WHERE sm_serialnum IN (SELECT column_value FROM TABLE(:sims))
+          AND sm_status = 'a'
+    """, sims=_varchar_array(cursor, sims))
+    return {serial for (serial,) in cursor}
+
+# =========================
+# Écritures (array DML)
+# =========================
+_SQL_FREE_SM = """
+    UPDATE storage_medium
+    SET sm_status='r',
+        dealer_id=31970747,
+        sm_status_mod_date=SYSDATE,
+        sm_delivery_id=31970747,
+        rec_version=2,
+        prepaid_profile_id=NULL,
+        BUSINESS_UNIT_ID=2
+    WHERE sm_id=:sm_id
+"""
+
+_SQL_FREE_PORT = """
+    UPDATE port
+    SET port_status='r',
+        dealer_id=31970747,
+        port_statusmoddat=SYSDATE,
+        port_moddate=SYSDATE,
+        dn_id=NULL,
+        BUSINESS_UNIT_ID=2
+    WHERE sm_id = :sm_id
+"""
+
+def _classify(row: Dict[str, Any]) -> str:
+    """
+    Décide l'action à mener pour une SIM existante à partir de sa ligne storage_medium
+    """
+    sm_status, dealer_id = row["sm_status"], row["dealer_id"]
+    if sm_status == 'r' and dealer_id == 31970747:
+        return "already_free"
+    if sm_status in ['d'] or (sm_status == 'r' and dealer_id is None):
+        return "liberate"
+    if sm_status == 'a':
+        return "active"
+    if sm_status == 'b':
+        return "blocked"
+    if sm_status == 'p':
+        return "update"
+    return "unknown"
+
+def _port_needs_fix(row: Dict[str, Any]) -> bool:
+    return row["has_port"] and not (row["port_status"] == 'r' and row["port_dealer"] == 31970747)
+
+def _executemany_by_sm_id(cursor: cx_Oracle.Cursor, sql: str, sm_ids: List[int]) -> Dict[int, str]:
+    if not sm_ids:
+        return {}
+    cursor.executemany(sql, [{"sm_id": sm_id} for sm_id in sm_ids], batcherrors=True)
+    return {sm_ids[err.offset]: err.message for err in cursor.getbatcherrors()}
+
+def _apply_liberation(conn: cx_Oracle.Connection, cursor: cx_Oracle.Cursor, liberate_ids: List[int],
+                      port_ids: List[int], bulk: bool = SIM_BULK_MODE) -> Dict[int, str]:
+    """
+    Libère storage_medium + port pour liberate_ids et remet seulement le port en état pour port_ids.
+    En mode bulk : executemany + un commit unique, erreurs par ligne via getbatcherrors.
+    Une SIM n'est jamais validée à moitié : storage_medium et port sont libérés ensemble ou pas du tout.
+    Retourne {sm_id: message d'erreur} pour les lignes en échec.
+    """
+    errors = {}
+
+    if bulk:
+        if not liberate_ids and not port_ids:
+            return errors
+        while True:
+            sm_errors = _executemany_by_sm_id(cursor, _SQL_FREE_SM, liberate_ids)
+            port_targets = [sm_id for sm_id in liberate_ids if sm_id not in sm_errors] + port_ids
+            port_errors = _executemany_by_sm_id(cursor, _SQL_FREE_PORT, port_targets)
+            # Port rejeté après un storage_medium libéré : on annule le lot et on le rejoue sans ces SIM
+            # (chaque tour en retire au moins une ; cas rare, le lot sans erreur reste en un aller-retour)
+            half_freed = {sm_id: port_errors[sm_id] for sm_id in liberate_ids if sm_id in port_errors}
+            if not half_freed:
+                break
+            conn.rollback()
+            errors.update(half_freed)
+            liberate_ids = [sm_id for sm_id in liberate_ids if sm_id not in half_freed]
+        conn.commit()
+        errors.update(sm_errors)
+        errors.update(port_errors)
+        return errors
+
+    # Mode unitaire : un commit par SIM, storage_medium et port annulés ensemble en cas d'erreur
+    for sm_ids, statements in ((liberate_ids, (_SQL_FREE_SM, _SQL_FREE_PORT)), (port_ids, (_SQL_FREE_PORT,))):
+        for sm_id in sm_ids:
+            try:
+                for sql in statements:
+                    cursor.execute(sql, sm_id=sm_id)
+                conn.commit()
+            except cx_Oracle.DatabaseError as e:
+                conn.rollback()
+                errors[sm_id] = str(e)
+    return errors
+
+def _stage_mediation(conn: cx_Oracle.Connection, cursor: cx_Oracle.Cursor, to_update: List[str],
+                     to_create: List[str], bulk: bool = SIM_BULK_MODE) -> Dict[str, str]:
+    """
+    Alimente MEDIATION.SIM_TO_UPDATE / SIM_TO_CREATE puis lance UPDATE_SIM_TEST / CREATE_SIM_TEST.
+    En mode bulk : un executemany par table, chaque procédure appelée une fois, un commit par table ;
+    une procédure en échec annule sa table seulement (toutes ses SIM en erreur), l'autre est validée.
+    Retourne {sm_serialnum: message d'erreur} pour les lignes rejetées.
+    """
+    errors = {}
+    stages = (
+        (to_update, "INSERT INTO MEDIATION.SIM_TO_UPDATE VALUES (:sim, NULL, NULL)", "CALL MEDIATION.UPDATE_SIM_TEST()"),
+        (to_create, "INSERT INTO MEDIATION.SIM_TO_CREATE VALUES (:sim, NULL, NULL)", "CALL MEDIATION.CREATE_SIM_TEST()"),
+    )
+
+    if bulk:
+        for sims, insert_sql, call_sql in stages:
+            if not sims:
+                continue
+            stage_errors = {}
+            try:
+                cursor.executemany(insert_sql, [{"sim": sim} for sim in sims], batcherrors=True)
+                stage_errors = {sims[err.offset]: err.message for err in cursor.getbatcherrors()}
+                if len(stage_errors) < len(sims):
+                    cursor.execute(call_sql)
+                conn.commit()
+            except cx_Oracle.DatabaseError as e:
+                conn.rollback()
+                # Lignes rejetées : leur propre message ; les autres ont été annulées avec la procédure
+                stage_errors = {sim: stage_errors.get(sim, str(e)) for sim in sims}
+            errors.update(stage_errors)
+        return errors
+
+    # Mode unitaire : insertion + procédure + commit par SIM, une SIM en échec n'arrête pas le lot
+    for sims, insert_sql, call_sql in stages:
+        for sim in sims:
+            try:
+                cursor.execute(insert_sql, sim=sim)
+                cursor.execute(call_sql)
+                conn.commit()
+            except cx_Oracle.DatabaseError as e:
+                conn.rollback()
+                errors[sim] = str(e)
+    return errors
 
 # =========================
 # SPML building & SFTP upload
 # =========================
-def _build_auc_spml(cursor: cx_Oracle.Cursor, sims: List[str]) -> io.BytesIO:
-    root = ET.Element('spml:batchRequest', {
-        'language': 'en_us',
-        'execution': 'synchronous',
-        'processing': 'parallel',
-        'xmlns:spml': 'urn:siemens:names:prov:gw:SPML:2:0',
-        'xmlns:subscriber': 'urn:siemens:names:prov:gw:SUBSCRIBER:1:0',
-        'xmlns:xsi': 'http://www.w3.org/2001/XMLSchema-instance',
-        'onError': 'resume'
-    })
-    version = ET.SubElement(root, 'version')
-    version.text = 'SUBSCRIBER_v10'
+_SPML_HEADER = (
+    "<?xml version='1.0' encoding='utf-8'?>\n"
+    '<spml:batchRequest language="en_us" execution="synchronous" processing="parallel"'
+    ' xmlns:spml="urn:siemens:names:prov:gw:SPML:2:0"'
+    ' xmlns:subscriber="urn:siemens:names:prov:gw:SUBSCRIBER:1:0"'
+    ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" onError="resume">'
+    '<version>SUBSCRIBER_v10</version>'
+).encode('utf-8')
+_SPML_FOOTER = b'</spml:batchRequest>'
+
+def _spml_text(tag: str, value: Any) -> str:
+    """Élément texte écrit comme par ElementTree : valeur NULL ou vide → <tag />"""
+    if value is None or value == "":
+        return f'<{tag} />'
+    return f'<{tag}>{escape(str(value))}</{tag}>'
+
+def _spml_add_request(port_num: str, port_ki: Optional[str], port_tkey: str, algoId: int, acsub: int) -> bytes:
+    return (
+        '<request xsi:type="spml:AddRequest"><version>SUBSCRIBER_v10</version>'
+        '<object xsi:type="subscriber:Subscriber">'
+        f'{_spml_text("identifier", port_num)}'
+        f'<auc>{_spml_text("imsi", port_num)}'
+        f'{_spml_text("encKey", port_ki)}'
+        f'{_spml_text("algoId", algoId)}'
+        f'{_spml_text("kdbId", "1" + port_tkey[-2:])}'
+        f'{_spml_text("acsub", acsub)}</auc>'
+        '</object></request>'
+    ).encode('utf-8')
+
+# Colonnes sans lesquelles une spml:AddRequest ne peut pas être écrite (IMSI, kdbId)
+_SPML_REQUIRED_COLUMNS = (("port_num", 1), ("port_tkey", 3))
+
+class _SpmlFile:
+    """
+    Fichier SPML en cours d'écriture (en mémoire jusqu'à AUC_SPML_SPOOL_BYTES, puis sur disque)
+    """
 
+    def __init__(self):
+        self.fileobj = tempfile.SpooledTemporaryFile(max_size=AUC_SPML_SPOOL_BYTES)
+        self.fileobj.write(_SPML_HEADER)
+        self.size = len(_SPML_HEADER)
+        self.requests = 0
+        self.sims: List[str] = []
+
+    def add(self, sm_serialnum: str, requests: List[bytes]) -> None:
+        for request in requests:
+            self.fileobj.write(request)
+            self.size += len(request)
+        self.requests += len(requests)
+        self.sims.append(sm_serialnum)
+
+    def is_full(self) -> bool:
+        return self.requests >= AUC_SPML_MAX_REQUESTS or self.size >= AUC_SPML_MAX_BYTES
+
+    def close(self) -> Tuple[IO[bytes], List[str]]:
+        self.fileobj.write(_SPML_FOOTER)
+        self.fileobj.seek(0)
+        return self.fileobj, self.sims
+
+def _build_auc_spml(cursor: cx_Oracle.Cursor, sims: List[str],
+                    rejected: Optional[Dict[str, str]] = None) -> Iterator[Tuple[IO[bytes], List[str]]]:
+    """
+    Écrit les spml:AddRequest au fil de la lecture des ports, sans construire d'arbre XML.
+    Produit (fichier spml:batchRequest, SIM incluses) dès qu'un fichier atteint AUC_SPML_MAX_REQUESTS
+    requêtes ou AUC_SPML_MAX_BYTES octets ; les ports d'une même SIM restent dans le même fichier.
+    Les SIM sans port ne sont dans aucun fichier. Une SIM dont un port a port_num ou port_tkey NULL
+    est écartée (aucun de ses ports n'est écrit) et son motif ajouté à rejected ; port_ki NULL → <encKey />.
+    """
     sql = """
-        SELECT p.port_num, p.port_ki, p.port_tkey,
+        SELECT sm.sm_serialnum, p.port_num, p.port_ki, p.port_tkey,
                DECODE(sm.smc_id, 3, 1, 0) AS algoId,
                DECODE(sm.smc_id, 3, 2, 1) AS acsub
         FROM port p, storage_medium sm
-        WHERE sm_serialnum = :sm_serialnum
+        WHERE sm.sm_serialnum IN (SELECT column_value FROM TABLE(:sims))
           AND p.sm_id = sm.sm_id
+        ORDER BY sm.sm_serialnum
     """
 
-    for sm_serialnum in sims:
-        cursor.execute(sql, sm_serialnum=sm_serialnum)
-        rows = cursor.fetchall()
-        if not rows:
-            continue
-        for port_num, port_ki, port_tkey, algoId, acsub in rows:
-            request = ET.SubElement(root, 'request', {'xsi:type': 'spml:AddRequest'})
-            ET.SubElement(request, 'version').text = 'SUBSCRIBER_v10'
-            obj = ET.SubElement(request, 'object', {'xsi:type': 'subscriber:Subscriber'})
-            ET.SubElement(obj, 'identifier').text = port_num
-            auc = ET.SubElement(obj, 'auc')
-            ET.SubElement(auc, 'imsi').text = port_num
-            ET.SubElement(auc, 'encKey').text = port_ki
-            ET.SubElement(auc, 'algoId').text = str(algoId)
-            ET.SubElement(auc, 'kdbId').text = '1' + port_tkey[-2:]
-            ET.SubElement(auc, 'acsub').text = str(acsub)
-
-    byte_stream = io.BytesIO()
-    ET.ElementTree(root).write(byte_stream, encoding='utf-8', xml_declaration=True)
-    byte_stream.seek(0)
-    return byte_stream
-
-def _sftp_upload(fileobj: io.BytesIO) -> str:
-    transport = paramiko.Transport((SFTP_HOST, SFTP_PORT))
-    transport.connect(username=SFTP_USER, password=SFTP_PASSWORD)
-    sftp = paramiko.SFTPClient.from_transport(transport)
+    # Lecture des ports par paquets de lignes : quelques allers-retours par lot au lieu d'un par SIM
+    cursor.arraysize = AUC_FETCH_ARRAYSIZE
+    cursor.prefetchrows = AUC_FETCH_ARRAYSIZE
+
+    spml = None
+    for batch in _chunks(sims, AUC_FETCH_CHUNK_SIZE):
+        cursor.execute(sql, sims=_varchar_array(cursor, batch))
+
+        for sm_serialnum, rows in itertools.groupby(cursor, key=lambda row: row[0]):
+            rows = list(rows)
+            missing = [name for name, index in _SPML_REQUIRED_COLUMNS if any(row[index] is None for row in rows)]
+            if missing:
+                if rejected is not None:
+                    rejected[sm_serialnum] = f"{' / '.join(missing)} NULL"
+                continue
+            requests = [_spml_add_request(*row[1:]) for row in rows]
+
+            if spml is not None and spml.is_full():
+                yield spml.close()
+                spml = None
+            if spml is None:
+                spml = _SpmlFile()
+            spml.add(sm_serialnum, requests)
+
+    if spml is not None:
+        yield spml.close()
+
+_upload_seq = itertools.count(1)
+
+# Transport SSH persistant partagé par tous les dépôts SPML
+sftp_pool = SftpPool(
+    SFTP_HOST, SFTP_PORT, SFTP_USER, SFTP_PASSWORD,
+    max_channels=SFTP_MAX_CHANNELS,
+    keepalive=SFTP_KEEPALIVE
+)
+
+def _sftp_upload(fileobj: IO[bytes]) -> str:
     current_time = datetime.now().strftime("%d%m%Y_%H%M%S")
-    auc_filename = f'auc{SFTP_USER}{current_time}.SPML'
+    # pid + suffixe séquentiel : plusieurs fichiers peuvent partir dans la même seconde, depuis
+    # plusieurs workers gunicorn
+    auc_filename = f'auc{SFTP_USER}{current_time}_{os.getpid()}_{next(_upload_seq)}.SPML'
     remote_path = f'{SFTP_INBOX_DIR}/{auc_filename}'
-    try:
-        sftp.putfo(fileobj, remote_path)
-        return auc_filename
-    finally:
-        sftp.close()
-        transport.close()
+    # Écrit sous un nom temporaire puis renommé : le HLR ne voit jamais un fichier incomplet
+    sftp_pool.put(fileobj, remote_path, temp_path=f'{remote_path}.part')
+    return auc_filename
 
 # =========================
 # création AUC
 # =========================
-def creationauc(sims: List[str], env: str = "PROD", is_file: bool = False) -> Dict[str, Any]:
-    conn, cursor = None, None
-    out = {"success": False, "processed": [], "skipped": [], "message": ""}
+def creationauc(sims: List[str], env: str = "PROD", is_file: bool = False,
+                cursor: Optional[cx_Oracle.Cursor] = None, prevalidated: bool = False) -> Dict[str, Any]:
+    """
+    Crée l'AUC de toutes les SIM en un minimum de fichiers SPML
+    (découpage automatique à AUC_SPML_MAX_REQUESTS requêtes / AUC_SPML_MAX_BYTES octets).
+    Le résultat de chaque SIM est renvoyé dans out["bySim"][sm_serialnum].
+    Si cursor est fourni (session de l'appelant), aucune session supplémentaire n'est prise.
+    prevalidated : sims sont déjà normalisés et validés (sortie de parse_iccids).
+    """
+    conn = None
+    owns_cursor = cursor is None
+    out = {"success": False, "processed": [], "skipped": [], "filenames": [], "bySim": {}, "message": ""}
 
     try:
-        sims_norm = [normalize_iccid(s) for s in sims]
-        valid = [s for s in sims_norm if is_valid_sm_serialnum(s)]
-        skipped = [orig for orig, norm in zip(sims, sims_norm) if not is_valid_sm_serialnum(norm)]
-        out["skipped"] = skipped
+        if prevalidated:
+            valid = list(dict.fromkeys(sims))
+        else:
+            sims_norm = [normalize_iccid(s) for s in sims]
+            valid = list(dict.fromkeys(s for s in sims_norm if is_valid_sm_serialnum(s)))
+            out["skipped"] = [orig for orig, norm in zip(sims, sims_norm) if not is_valid_sm_serialnum(norm)]
 
         if not valid:
             out["message"] = "Aucun ICCID valide."
             return out
 
-        conn, cursor = get_connection(env)
-
-        spml = _build_auc_spml(cursor, valid)
-
-        if spml.getbuffer().nbytes <= 60:
-            out["message"] = f"Aucune donnée AUC trouvée en {env}."
+        if owns_cursor:
+            conn, cursor = get_connection(env)
+
+        # Chaque fichier est déposé dès qu'il est complet, avant d'écrire le suivant
+        build_error = None
+        rejected: Dict[str, str] = {}
+        try:
+            for spml, included in timed_iter(_build_auc_spml(cursor, valid, rejected), "spml_build", env):
+                try:
+                    with timed("sftp_upload", env):
+                        filename = _sftp_upload(spml)
+                except Exception as e:
+                    for sim in included:
+                        out["bySim"][sim] = {"success": False, "message": f"Erreur création AUC ({env}): {str(e)}"}
+                    continue
+                finally:
+                    spml.close()
+
+                for sim in included:
+                    out["bySim"][sim] = {"success": True, "filename": filename,
+                                         "message": f"AUC créé avec succès en {env} ({filename})"}
+                out["processed"].extend(included)
+                out["filenames"].append(filename)
+        except Exception as e:
+            build_error = f"Erreur création AUC ({env}): {str(e)}"
+
+        for sim, reason in rejected.items():
+            out["bySim"][sim] = {"success": False, "message": f"Erreur création AUC ({env}): {reason}"}
+        for sim in valid:
+            if sim not in out["bySim"]:
+                out["bySim"][sim] = {"success": False, "message": build_error or f"Aucune donnée AUC trouvée en {env}."}
+
+        if not out["processed"]:
+            out["message"] = build_error or f"Aucune donnée AUC trouvée en {env}."
             return out
 
-        filename = _sftp_upload(spml)
-
         out.update({
             "success": True,
-            "processed": valid,
-            "filename": filename,
-            "message": f"AUC créé avec succès en {env} ({filename})"
+            "filename": ", ".join(out["filenames"]),
+            "message": f"AUC créé avec succès en {env} ({', '.join(out['filenames'])})"
         })
         return out
 
@@ -172,7 +715,119 @@ def creationauc(sims: List[str], env: str = "PROD", is_file: bool = False) -> Di
         return out
 
     finally:
-        close_connection(conn, cursor)
+        if owns_cursor:
+            close_connection(conn, cursor)
+
+
+StatusCallback = Callable[[Dict[str, Any]], None]
+
+def _chunk_plan(count: int, parallelism: int) -> Tuple[int, int]:
+    """(taille de lot, workers simultanés) de _run_chunks pour count ICCID"""
+    parallelism = max(1, min(parallelism, SIM_MAX_PARALLELISM))
+    # Lots plus petits en mode parallèle pour occuper tous les workers
+    chunk_size = max(1, min(SIM_CHUNK_SIZE, -(-count // parallelism)))
+    chunks = -(-count // chunk_size)
+    workers = 1 if parallelism == 1 or chunks <= 1 else min(parallelism, chunks)
+    return chunk_size, min(workers, chunks)
+
+def liberation_sessions(env: str, sim_count: int, parallelism: int = SIM_PARALLELISM) -> Dict[str, int]:
+    """
+    Sessions Oracle tenues en même temps par liberate / plan_liberation : une par worker et par
+    environnement (un run UAT tient aussi une session PROD par worker pour le garde-fou)
+    """
+    env = env.upper()
+    if env not in ("PROD", "UAT"):
+        return {}
+    _, workers = _chunk_plan(sim_count, parallelism)
+    return {"PROD": workers} if env == "PROD" else {"UAT": workers, "PROD": workers}
+
+def _run_chunks(user_inputs: List[str], envs: Tuple[str, ...], process: Callable[..., Tuple[List, List]],
+                parallelism: int = SIM_PARALLELISM) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Découpe les ICCID en lots et appelle process(chunk, *sessions) pour chacun, avec une session
+    poolée par environnement de envs. Si parallelism > 1, les lots sont répartis sur un pool
+    borné de workers ; l'ordre des statuts reste celui de l'entrée.
+    """
+    chunk_size, workers = _chunk_plan(len(user_inputs), parallelism)
+    chunks = list(_chunks(user_inputs, chunk_size))
+
+    def run(chunk):
+        sessions = []
+        try:
+            for env in envs:
+                sessions.append(get_connection(env))
+            return process(chunk, *sessions)
+        finally:
+            for conn, cursor in sessions:
+                close_connection(conn, cursor)
+
+    if workers <= 1:
+        results = [run(chunk) for chunk in chunks]
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="liberate") as executor:
+            # Contexte de la requête propagé aux workers (détail des durées par étape)
+            results = list(executor.map(run_in_context(run), chunks))
+
+    status_list, pending_auc = [], []
+    for chunk_status, chunk_pending in results:
+        status_list.extend(chunk_status)
+        pending_auc.extend(chunk_pending)
+    return status_list, pending_auc
+
+def _record(status_list: List[Dict[str, Any]], on_status: Optional[StatusCallback], entry: Dict[str, Any]) -> None:
+    """Ajoute le statut final d'une SIM et le publie immédiatement (streaming)"""
+    status_list.append(entry)
+    if on_status:
+        on_status(entry)
+
+
+_AUC_SUCCESS_MESSAGES = {
+    "liberate": "SIM liberated & AUC created in {env}",
+    "update": "SIM updated & AUC created in {env}",
+    "create": "SIM created & AUC created in {env}",
+}
+
+def _finalize_auc(env: str, cursor: Optional[cx_Oracle.Cursor], pending: List[Dict[str, Any]], is_file: bool,
+                  username: str, user_type: str, ip_address: str,
+                  on_status: Optional[StatusCallback] = None) -> None:
+    """
+    Création AUC différée : un seul creationauc pour toutes les SIM retenues de la requête,
+    puis report du statut de chaque SIM dans son entrée statusList et log.
+    """
+    if not pending:
+        return
+
+    with timed("auc", env):
+        auc = creationauc([p["sim"] for p in pending], env=env, is_file=is_file, cursor=cursor, prevalidated=True)
+
+    for p in pending:
+        res = auc["bySim"].get(p["sim"], {"success": False, "message": auc.get("message")})
+
+        if p["action"] == "already_free":
+            # AUC créé quand même, on ignore le résultat pour le message
+            msg = f"Already free in {env}"
+            status = 1
+        else:
+            msg = _AUC_SUCCESS_MESSAGES[p["action"]].format(env=env) if res["success"] else res["message"]
+            status = 1 if res["success"] else 0
+
+        p["entry"].update({"status": "success" if status == 1 else "error", "message": msg})
+        if res["success"]:
+            recent_liberations.add(env, p["sim"])
+        if on_status:
+            on_status(p["entry"])
+
+        log_sim_liberation(
+            action_type=env,
+            status=status,
+            created_by=username,
+            user_type=user_type,
+            num_sim=p["sim"],
+            sim_status=p["sm_status"],
+            dealer_id=p["dealer_id"],
+            message=msg,
+            ip_address=ip_address
+        )
 
 
 
@@ -182,146 +837,249 @@ def creationauc(sims: List[str], env: str = "PROD", is_file: bool = False) -> Di
 
 
 
-def liberate_prod(user_inputs: List[str], username: str, user_type: str, ip_address: str, is_file=False) -> Dict[str, Any]:
+def _liberate_prod_chunk(conn: cx_Oracle.Connection, cursor: cx_Oracle.Cursor, chunk: List[str],
+                         username: str, user_type: str, ip_address: str, bulk: bool,
+                         on_status: Optional[StatusCallback],
+                         prevalidated: bool = False) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Traite un lot PROD sur la session fournie.
+    Retourne (statuts du lot dans l'ordre d'entrée, SIM en attente de création AUC)
+    """
     status_list = []
-    conn, cursor = get_connection("PROD")
+    pending_auc = []
+
+    sims_chunk = chunk if prevalidated else [normalize_iccid(raw.strip()) for raw in chunk]
+
+    # Recherche SIM PROD (une requête pour tout le lot)
+    with timed("oracle_lookup", "PROD"):
+        sim_rows = _fetch_sim_rows(cursor, sims_chunk if prevalidated else [s for s in sims_chunk if is_valid_sm_serialnum(s)])
+    actions = {sim: _classify(row) for sim, row in sim_rows.items()}
+
+    # Libération du lot (array DML, un seul commit en mode bulk)
+    with timed("oracle_update", "PROD"):
+        db_errors = _apply_liberation(
+            conn, cursor,
+            liberate_ids=[row["sm_id"] for sim, row in sim_rows.items() if actions[sim] == "liberate"],
+            port_ids=[row["sm_id"] for sim, row in sim_rows.items()
+                      if actions[sim] == "already_free" and _port_needs_fix(row)],
+            bulk=bulk
+        )
 
-    try:
-        for raw in user_inputs:
-            sim = normalize_iccid(raw.strip())
-
-            # Validation SIM
-            if not is_valid_sm_serialnum(sim):
-                msg = "Invalid SIM number"
-                status_list.append({"sim": raw, "status": "error", "message": msg})
-                log_sim_liberation(
-                    action_type="PROD",
-                    status=0,
-                    created_by=username,
-                    user_type=user_type,
-                    num_sim=sim,
-                    sim_status=None,
-                    dealer_id=None,
-                    message=msg,
-                    ip_address=ip_address
-                )
-                continue
+    for raw, sim in zip(chunk, sims_chunk):
+        # Validation SIM (déjà faite par parse_iccids si prevalidated)
+        if not prevalidated and not is_valid_sm_serialnum(sim):
+            msg = "Invalid SIM number"
+            _record(status_list, on_status, {"sim": raw, "status": "error", "message": msg})
+            log_sim_liberation(
+                action_type="PROD",
+                status=0,
+                created_by=username,
+                user_type=user_type,
+                num_sim=sim,
+                sim_status=None,
+                dealer_id=None,
+                message=msg,
+                ip_address=ip_address
+            )
+            continue
 
-            # Recherche SIM PROD
-            cursor.execute("""
-                SELECT sm_status, dealer_id
-                FROM storage_medium
-                WHERE sm_serialnum = :sim
-            """, sim=sim)
-            row = cursor.fetchone()
-
-            if not row:
-                msg = "SIM not found in PROD"
-                status_list.append({"sim": raw, "status": "not_found", "message": msg})
-                log_sim_liberation(
-                    action_type="PROD",
-                    status=0,
-                    created_by=username,
-                    user_type=user_type,
-                    num_sim=sim,
-                    sim_status=None,
-                    dealer_id=None,
-                    message=msg,
-                    ip_address=ip_address
-                )
-                continue
+        row = sim_rows.get(sim)
 
-            sm_status, dealer_id = row
-
-            # --- Cas déjà libre ---
-            if sm_status == 'r' and dealer_id == 31970747:
-                # Vérification port
-                cursor.execute("""
-                    SELECT port_status, dealer_id
-                    FROM port
-                    WHERE sm_id = (
-                        SELECT sm_id FROM storage_medium WHERE sm_serialnum = :sim
-                    )
-                """, sim=sim)
-                row_port = cursor.fetchone()
-
-                if row_port:
-                    port_status, port_dealer = row_port
-                    # Update port si nécessaire
-                    if not (port_status == 'r' and port_dealer == 31970747):
-                        cursor.execute("""
-                            UPDATE port
-                            SET port_status='r',
-                                dealer_id=31970747,
-                                port_statusmoddat=SYSDATE,
-                                port_moddate=SYSDATE,
-                                dn_id=NULL,
-                                BUSINESS_UNIT_ID=2
-                            WHERE sm_id = (
-                                SELECT sm_id FROM storage_medium WHERE sm_serialnum=:sim
-                            )
-                        """, sim=sim)
-                        conn.commit()
-
-                # Message fixe
-                msg = "Already free in PROD"
-                status = 1
-
-                # Créer AUC quand même (optionnel, on ignore le résultat pour le message)
-                _ = creationauc([raw], env="PROD", is_file=is_file)
-
-            # Cas à libérer
-            elif sm_status in ['d'] or (sm_status == 'r' and dealer_id is None):
-                # Liberate + AUC
-                cursor.execute("""
-                    UPDATE storage_medium
-                    SET sm_status='r',
-                        dealer_id=31970747,
-                        sm_status_mod_date=SYSDATE,
-                        sm_delivery_id=31970747,
-                        rec_version=2,
-                        prepaid_profile_id=NULL,
-                        BUSINESS_UNIT_ID=2
-                    WHERE sm_serialnum=:sim
-                """, sim=sim)
-
-                cursor.execute("""
-                    UPDATE port
-                    SET port_status='r',
-                        dealer_id=31970747,
-                        port_statusmoddat=SYSDATE,
-                        port_moddate=SYSDATE,
-                        dn_id=NULL,
-                        BUSINESS_UNIT_ID=2
-                    WHERE sm_id = (
-                        SELECT sm_id FROM storage_medium WHERE sm_serialnum=:sim
-                    )
-                """, sim=sim)
-                conn.commit()
+        if not row:
+            msg = "SIM not found in PROD"
+            _record(status_list, on_status, {"sim": raw, "status": "not_found", "message": msg})
+            log_sim_liberation(
+                action_type="PROD",
+                status=0,
+                created_by=username,
+                user_type=user_type,
+                num_sim=sim,
+                sim_status=None,
+                dealer_id=None,
+                message=msg,
+                ip_address=ip_address
+            )
+            continue
 
-                auc = creationauc([raw], env="PROD", is_file=is_file)
-                msg = "SIM liberated & AUC created in PROD" if auc.get("success") else auc.get("message")
-                status = 1 if auc.get("success") else 0
+        sm_status, dealer_id = row["sm_status"], row["dealer_id"]
+        action = actions[sim]
+        db_error = db_errors.get(row["sm_id"])
+
+        # Échec de l'UPDATE pour cette ligne
+        if db_error:
+            msg = f"Erreur libération PROD: {db_error}"
+            status = 0
+
+        # --- Cas déjà libre / à libérer : statut final après la création AUC groupée ---
+        elif action in ("already_free", "liberate"):
+            entry = {"sim": raw, "status": "pending", "message": ""}
+            status_list.append(entry)
+            pending_auc.append({"entry": entry, "sim": sim, "action": action,
+                                "sm_status": sm_status, "dealer_id": dealer_id})
+            continue
 
-            # Cas SIM active
-            elif sm_status == 'a':
-                msg = "Already active in PROD"
+        # Cas SIM active
+        elif action == "active":
+            msg = "Already active in PROD"
+            status = 0
+
+        # Cas SIM bloquée
+        elif action == "blocked":
+            msg = "SIM blocked in PROD"
+            status = 0
+
+        else:
+            msg = "Statut inconnu PROD"
+            status = 0
+
+        # Ajout à la liste et log
+        _record(status_list, on_status, {"sim": raw, "status": "success" if status == 1 else "error", "message": msg})
+
+        log_sim_liberation(
+            action_type="PROD",
+            status=status,
+            created_by=username,
+            user_type=user_type,
+            num_sim=sim,
+            sim_status=sm_status,
+            dealer_id=dealer_id,
+            message=msg,
+            ip_address=ip_address
+        )
+
+    return status_list, pending_auc
+
+
+def liberate_prod(user_inputs: List[str], username: str, user_type: str, ip_address: str, is_file=False,
+                  bulk: bool = SIM_BULK_MODE, on_status: Optional[StatusCallback] = None,
+                  parallelism: int = SIM_PARALLELISM, prevalidated: bool = False) -> Dict[str, Any]:
+    def process(chunk, session_prod):
+        conn, cursor = session_prod
+        return _liberate_prod_chunk(conn, cursor, chunk, username, user_type, ip_address, bulk, on_status,
+                                    prevalidated)
+
+    status_list, pending_auc = _run_chunks(user_inputs, ("PROD",), process, parallelism)
+
+    # Création AUC groupée pour toute la requête
+    _finalize_auc("PROD", None, pending_auc, is_file, username, user_type, ip_address, on_status)
+
+    return {"success": True, "statusList": status_list}
+
+
+
+def _liberate_uat_chunk(conn_uat: cx_Oracle.Connection, cursor_uat: cx_Oracle.Cursor, cursor_prod: cx_Oracle.Cursor,
+                        chunk: List[str], username: str, user_type: str, ip_address: str, bulk: bool,
+                        on_status: Optional[StatusCallback],
+                        prevalidated: bool = False) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Traite un lot UAT sur les sessions fournies (UAT + PROD pour le garde-fou).
+    Retourne (statuts du lot dans l'ordre d'entrée, SIM en attente de création AUC)
+    """
+    status_list = []
+    pending_auc = []
+
+    sims_chunk = chunk if prevalidated else [normalize_iccid(raw.strip()) for raw in chunk]
+
+    valid_sims = sims_chunk if prevalidated else [s for s in sims_chunk if is_valid_sm_serialnum(s)]
+
+    # Vérification PROD (une requête pour tout le lot) : les SIM actives en PROD sont écartées d'emblée
+    with timed("prod_guard", "PROD"):
+        prod_active = _fetch_active_sims(cursor_prod, valid_sims)
+
+    # Recherche UAT (une requête pour le reste du lot)
+    with timed("oracle_lookup", "UAT"):
+        sim_rows = _fetch_sim_rows(cursor_uat, [s for s in valid_sims if s not in prod_active])
+    actions = {sim: _classify(row) for sim, row in sim_rows.items()}
+
+    # Libération du lot
+    with timed("oracle_update", "UAT"):
+        db_errors = _apply_liberation(
+            conn_uat, cursor_uat,
+            liberate_ids=[row["sm_id"] for sim, row in sim_rows.items() if actions[sim] == "liberate"],
+            port_ids=[row["sm_id"] for sim, row in sim_rows.items()
+                      if actions[sim] == "already_free" and _port_needs_fix(row)],
+            bulk=bulk
+        )
+
+    # SIM p → SIM_TO_UPDATE, SIM absentes → SIM_TO_CREATE (procédures appelées une fois par lot)
+    to_update = [sim for sim, action in actions.items() if action == "update"]
+    to_create = list(dict.fromkeys(s for s in valid_sims if s not in prod_active and s not in sim_rows))
+    with timed("mediation", "UAT"):
+        mediation_errors = _stage_mediation(conn_uat, cursor_uat, to_update, to_create, bulk=bulk)
+
+    # Relecture groupée des SIM créées
+    with timed("oracle_lookup", "UAT"):
+        created_rows = _fetch_sim_rows(cursor_uat, [s for s in to_create if s not in mediation_errors])
+
+    for raw, sim in zip(chunk, sims_chunk):
+        # Validation SIM (déjà faite par parse_iccids si prevalidated)
+        if not prevalidated and not is_valid_sm_serialnum(sim):
+            msg = "Invalid SIM number"
+            _record(status_list, on_status, {"sim": raw, "status": "error", "message": msg})
+            log_sim_liberation(
+                action_type="UAT",
+                status=0,
+                created_by=username,
+                user_type=user_type,
+                num_sim=sim,
+                sim_status=None,
+                dealer_id=None,
+                message=msg,
+                ip_address=ip_address
+            )
+            continue
+
+        if sim in prod_active:
+            msg = "Already active in PROD"
+            _record(status_list, on_status, {"sim": raw, "status": "error", "message": msg})
+            log_sim_liberation(
+                action_type="UAT",
+                status=0,
+                created_by=username,
+                user_type=user_type,
+                num_sim=sim,
+                sim_status='a',
+                dealer_id=None,
+                message=msg,
+                ip_address=ip_address
+            )
+            continue
+
+        row = sim_rows.get(sim)
+
+        if row:
+            sm_status, dealer_id = row["sm_status"], row["dealer_id"]
+            action = actions[sim]
+            db_error = db_errors.get(row["sm_id"])
+
+            # Échec de l'UPDATE / du staging SIM_TO_UPDATE pour cette ligne
+            if db_error:
+                msg = f"Erreur libération UAT: {db_error}"
                 status = 0
 
-            # Cas SIM bloquée
-            elif sm_status == 'b':
-                msg = "SIM blocked in PROD"
+            elif sim in mediation_errors:
+                msg = f"Erreur SIM_TO_UPDATE UAT: {mediation_errors[sim]}"
                 status = 0
 
-            else:
-                msg = "Statut inconnu PROD"
+            # Cas SIM active
+            elif action == "active":
+                msg = "Already active in UAT"
                 status = 0
 
-            # Ajout à la liste et log
-            status_list.append({"sim": raw, "status": "success" if status == 1 else "error", "message": msg})
+            # --- Cas déjà libre / à libérer / p → SIM_TO_UPDATE : statut final après AUC groupée ---
+            elif action in ("already_free", "liberate", "update"):
+                entry = {"sim": raw, "status": "pending", "message": ""}
+                status_list.append(entry)
+                pending_auc.append({"entry": entry, "sim": sim, "action": action,
+                                    "sm_status": sm_status, "dealer_id": dealer_id})
+                continue
+
+            else:
+                msg = "Unknown UAT status"
+                status = 0
 
             log_sim_liberation(
-                action_type="PROD",
+                action_type="UAT",
                 status=status,
                 created_by=username,
                 user_type=user_type,
@@ -332,257 +1090,282 @@ def liberate_prod(user_inputs: List[str], username: str, user_type: str, ip_addr
                 ip_address=ip_address
             )
 
-        return {"success": True, "statusList": status_list}
+            _record(status_list, on_status, {
+                "sim": raw,
+                "status": "success" if status == 1 else "error",
+                "message": msg
+            })
+
+        else:
+            # Création SIM UAT (déjà passée par SIM_TO_CREATE pour tout le lot)
+            row_created = created_rows.get(sim)
+
+            if row_created:
+                sm_status, dealer_id = row_created["sm_status"], row_created["dealer_id"]
+                entry = {"sim": raw, "status": "pending", "message": ""}
+                status_list.append(entry)
+                pending_auc.append({"entry": entry, "sim": sim, "action": "create",
+                                    "sm_status": sm_status, "dealer_id": dealer_id})
+                continue
 
-    finally:
-        close_connection(conn, cursor)
+            sm_status = dealer_id = None
+            if sim in mediation_errors:
+                msg = f"Erreur SIM_TO_CREATE UAT: {mediation_errors[sim]}"
+            else:
+                msg = "SIM not found after creation in UAT"
+            status = 0
+
+            log_sim_liberation(
+                action_type="UAT",
+                status=status,
+                created_by=username,
+                user_type=user_type,
+                num_sim=sim,
+                sim_status=sm_status,
+                dealer_id=dealer_id,
+                message=msg,
+                ip_address=ip_address
+            )
 
+            _record(status_list, on_status, {
+                "sim": raw,
+                "status": "success" if status == 1 else "error",
+                "message": msg
+            })
 
+    return status_list, pending_auc
 
-def liberate_uat(user_inputs: List[str], username: str, user_type: str, ip_address: str, is_file=False) -> Dict[str, Any]:
-    status_list = []
-    conn_uat, cursor_uat = get_connection("UAT")
-    conn_prod, cursor_prod = get_connection("PROD")
 
-    try:
-        for raw in user_inputs:
-            sim = normalize_iccid(raw.strip())
-
-            # Validation SIM
-            if not is_valid_sm_serialnum(sim):
-                msg = "Invalid SIM number"
-                status_list.append({"sim": raw, "status": "error", "message": msg})
-                log_sim_liberation(
-                    action_type="UAT",
-                    status=0,
-                    created_by=username,
-                    user_type=user_type,
-                    num_sim=sim,
-                    sim_status=None,
-                    dealer_id=None,
-                    message=msg,
-                    ip_address=ip_address
-                )
-                continue
+def liberate_uat(user_inputs: List[str], username: str, user_type: str, ip_address: str, is_file=False,
+                 bulk: bool = SIM_BULK_MODE, on_status: Optional[StatusCallback] = None,
+                 parallelism: int = SIM_PARALLELISM, prevalidated: bool = False) -> Dict[str, Any]:
+    def process(chunk, session_uat, session_prod):
+        conn_uat, cursor_uat = session_uat
+        _, cursor_prod = session_prod
+        return _liberate_uat_chunk(conn_uat, cursor_uat, cursor_prod, chunk, username, user_type, ip_address,
+                                   bulk, on_status, prevalidated)
 
-            # Vérification PROD
-            cursor_prod.execute(
-                "SELECT sm_status FROM storage_medium WHERE sm_serialnum=:sim",
-                sim=sim
-            )
-            row_prod = cursor_prod.fetchone()
-            if row_prod and row_prod[0] == 'a':
-                msg = "Already active in PROD"
-                status_list.append({"sim": raw, "status": "error", "message": msg})
-                log_sim_liberation(
-                    action_type="UAT",
-                    status=0,
-                    created_by=username,
-                    user_type=user_type,
-                    num_sim=sim,
-                    sim_status='a',
-                    dealer_id=None,
-                    message=msg,
-                    ip_address=ip_address
-                )
-                continue
+    status_list, pending_auc = _run_chunks(user_inputs, ("UAT", "PROD"), process, parallelism)
 
-            # Recherche UAT
-            cursor_uat.execute("""
-                SELECT sm_status, dealer_id
-                FROM storage_medium
-                WHERE sm_serialnum=:sim
-            """, sim=sim)
-            row = cursor_uat.fetchone()
-
-            if row:
-                sm_status, dealer_id = row
-
-                # --- Cas déjà libre ---
-                if sm_status == 'r' and dealer_id == 31970747:
-                    # Vérification port
-                    cursor_uat.execute("""
-                        SELECT port_status, dealer_id
-                        FROM port
-                        WHERE sm_id = (
-                            SELECT sm_id FROM storage_medium WHERE sm_serialnum = :sim
-                        )
-                    """, sim=sim)
-                    row_port = cursor_uat.fetchone()
-
-                    if row_port:
-                        port_status, port_dealer = row_port
-                        # Update port si nécessaire
-                        if not (port_status == 'r' and port_dealer == 31970747):
-                            cursor_uat.execute("""
-                                UPDATE port
-                                SET port_status='r',
-                                    dealer_id=31970747,
-                                    port_statusmoddat=SYSDATE,
-                                    port_moddate=SYSDATE,
-                                    dn_id=NULL,
-                                    BUSINESS_UNIT_ID=2
-                                WHERE sm_id = (
-                                    SELECT sm_id FROM storage_medium WHERE sm_serialnum=:sim
-                                )
-                            """, sim=sim)
-                            conn_uat.commit()
-
-                    # Message fixe
-                    msg = "Already free in UAT"
-                    status = 1
-
-                    # Créer AUC quand même (optionnel)
-                    _ = creationauc([raw], env="UAT", is_file=is_file)
-
-                # Cas SIM active
-                elif sm_status == 'a':
-                    msg = "Already active in UAT"
-                    status = 0
-
-                # UPDATE libération
-                elif sm_status in ['d'] or (sm_status == 'r' and dealer_id is None):
-                    cursor_uat.execute("""
-                        UPDATE storage_medium
-                        SET sm_status='r',
-                            dealer_id=31970747,
-                            sm_status_mod_date=SYSDATE,
-                            sm_delivery_id=31970747,
-                            rec_version=2,
-                            prepaid_profile_id=NULL,
-                            BUSINESS_UNIT_ID=2
-                        WHERE sm_serialnum=:sim
-                    """, sim=sim)
-
-                    cursor_uat.execute("""
-                        UPDATE port
-                        SET port_status='r',
-                            dealer_id=31970747,
-                            port_statusmoddat=SYSDATE,
-                            port_moddate=SYSDATE,
-                            dn_id=NULL,
-                            BUSINESS_UNIT_ID=2
-                        WHERE sm_id = (
-                            SELECT sm_id FROM storage_medium WHERE sm_serialnum=:sim
-                        )
-                    """, sim=sim)
-                    conn_uat.commit()
-
-                    auc = creationauc([raw], env="UAT", is_file=is_file)
-                    msg = "SIM liberated & AUC created in UAT" if auc.get("success") else auc.get("message")
-                    status = 1 if auc.get("success") else 0
-
-                # 🔴 Cas p → SIM_TO_UPDATE
-                elif sm_status == 'p':
-                    cursor_uat.execute(
-                        "INSERT INTO MEDIATION.SIM_TO_UPDATE VALUES (:sim, NULL, NULL)",
-                        sim=sim
-                    )
-                    cursor_uat.execute("CALL MEDIATION.UPDATE_SIM_TEST()")
-                    conn_uat.commit()
-
-                    auc = creationauc([raw], env="UAT", is_file=is_file)
-                    msg = "SIM updated & AUC created in UAT" if auc.get("success") else auc.get("message")
-                    status = 1 if auc.get("success") else 0
-
-                else:
-                    msg = "Unknown UAT status"
-                    status = 0
-
-                log_sim_liberation(
-                    action_type="UAT",
-                    status=status,
-                    created_by=username,
-                    user_type=user_type,
-                    num_sim=sim,
-                    sim_status=sm_status,
-                    dealer_id=dealer_id,
-                    message=msg,
-                    ip_address=ip_address
-                )
-
-                status_list.append({
-                    "sim": raw,
-                    "status": "success" if status == 1 else "error",
-                    "message": msg
-                })
+    # Création AUC groupée pour toute la requête
+    _finalize_auc("UAT", None, pending_auc, is_file, username, user_type, ip_address, on_status)
 
-            else:
-                # Création SIM UAT
-                cursor_uat.execute(
-                    "INSERT INTO MEDIATION.SIM_TO_CREATE VALUES (:sim, NULL, NULL)",
-                    sim=sim
-                )
-                cursor_uat.execute("CALL MEDIATION.CREATE_SIM_TEST()")
-                conn_uat.commit()
-
-                cursor_uat.execute("""
-                    SELECT sm_status, dealer_id
-                    FROM storage_medium
-                    WHERE sm_serialnum=:sim
-                """, sim=sim)
-                row_created = cursor_uat.fetchone()
-
-                if row_created:
-                    sm_status, dealer_id = row_created
-                    auc = creationauc([raw], env="UAT", is_file=is_file)
-                    msg = "SIM created & AUC created in UAT" if auc.get("success") else auc.get("message")
-                    status = 1 if auc.get("success") else 0
-                else:
-                    sm_status = dealer_id = None
-                    msg = "SIM not found after creation in UAT"
-                    status = 0
-
-                log_sim_liberation(
-                    action_type="UAT",
-                    status=status,
-                    created_by=username,
-                    user_type=user_type,
-                    num_sim=sim,
-                    sim_status=sm_status,
-                    dealer_id=dealer_id,
-                    message=msg,
-                    ip_address=ip_address
-                )
-
-                status_list.append({
-                    "sim": raw,
-                    "status": "success" if status == 1 else "error",
-                    "message": msg
-                })
-
-        return {"success": True, "statusList": status_list}
+    return {"success": True, "statusList": status_list}
 
-    finally:
-        close_connection(conn_uat, cursor_uat)
-        close_connection(conn_prod, cursor_prod)
 
 
 
 
+# =========================
+# Simulation (dry run)
+# =========================
+# Actions suivies d'une création AUC, par environnement
+_AUC_ACTIONS = {
+    "PROD": ("already_free", "liberate"),
+    "UAT": ("already_free", "liberate", "update", "create"),
+}
+
+_PLAN_MESSAGES = {
+    "liberate": "Would be liberated & AUC created in {env}",
+    "already_free": "Already free in {env}, AUC would be created",
+    "update": "Would be updated via SIM_TO_UPDATE & AUC created in {env}",
+    "create": "Would be created via SIM_TO_CREATE & AUC created in {env}",
+    "active": "Already active in {env}",
+    "active_prod": "Already active in PROD",
+    "blocked": "SIM blocked in {env}",
+    "not_found": "SIM not found in {env}",
+    "unknown": "Unknown {env} status",
+}
+
+def _plan_entry(env: str, sim: str, action: str, row: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    planned = action in _AUC_ACTIONS[env]
+    spml_requests = 0
+    if planned:
+        # Ports inconnus tant que la SIM n'est pas créée
+        spml_requests = row["port_count"] if row else None
+    return {
+        "sim": sim,
+        "status": "planned" if planned else ("not_found" if action == "not_found" else "error"),
+        "message": _PLAN_MESSAGES[action].format(env=env),
+        "action": action,
+        "spmlRequests": spml_requests,
+    }
+
+def _plan_prod_chunk(cursor: cx_Oracle.Cursor, chunk: List[str]) -> Tuple[List[Dict[str, Any]], List]:
+    with timed("oracle_lookup", "PROD"):
+        sim_rows = _fetch_sim_rows(cursor, chunk)
+    plan = []
+    for sim in chunk:
+        row = sim_rows.get(sim)
+        action = _classify(row) if row else "not_found"
+        # PROD ne passe pas par SIM_TO_UPDATE : une SIM p y est en statut inconnu
+        plan.append(_plan_entry("PROD", sim, "unknown" if action == "update" else action, row))
+    return plan, []
+
+def _plan_uat_chunk(cursor_uat: cx_Oracle.Cursor, cursor_prod: cx_Oracle.Cursor,
+                    chunk: List[str]) -> Tuple[List[Dict[str, Any]], List]:
+    with timed("prod_guard", "PROD"):
+        prod_active = _fetch_active_sims(cursor_prod, chunk)
+    with timed("oracle_lookup", "UAT"):
+        sim_rows = _fetch_sim_rows(cursor_uat, [s for s in chunk if s not in prod_active])
+    plan = []
+    for sim in chunk:
+        row = sim_rows.get(sim)
+        if sim in prod_active:
+            action = "active_prod"
+        elif row:
+            action = _classify(row)
+            # Comme le traitement réel : une SIM bloquée en UAT n'a pas de cas dédié
+            action = "unknown" if action == "blocked" else action
+        else:
+            action = "create"
+        plan.append(_plan_entry("UAT", sim, action, row))
+    return plan, []
+
+def _estimate_spml_files(port_counts: List[int]) -> int:
+    """Nombre de fichiers SPML selon le découpage de _build_auc_spml (limite en requêtes seulement)"""
+    files, current = 0, None
+    for count in port_counts:
+        if not count:
+            continue
+        if current is not None and current >= AUC_SPML_MAX_REQUESTS:
+            files, current = files + 1, None
+        current = (current or 0) + count
+    return files + (current is not None)
 
-def liberate(user_inputs: List[str], env: str = "PROD", username: str = None, user_type: str = None, ip_address: str = None, is_file: bool = False) -> Dict[str, Any]:
+def plan_liberation(sims: List[str], env: str, parallelism: int = SIM_PARALLELISM) -> Dict[str, Any]:
     """
-    Appelle la fonction liberate_prod ou liberate_uat en passant les informations utilisateur et ip_address
+    Dry run : lectures bulk seulement (storage_medium/port, garde-fou PROD en UAT), aucun UPDATE,
+    aucune procédure MEDIATION, aucun dépôt SFTP, aucun log.
+    sims : ICCID normalisés et validés (parse_iccids).
+    Retourne l'action prévue par SIM et le volume SPML qu'engendrerait le traitement réel.
     """
-    if env.upper() == "PROD":
-        return liberate_prod(
-            user_inputs=user_inputs,
-            username=username,
-            user_type=user_type,
-            ip_address=ip_address,
-            is_file=is_file
-        )
-    elif env.upper() == "UAT":
-        return liberate_uat(
-            user_inputs=user_inputs,
-            username=username,
-            user_type=user_type,
-            ip_address=ip_address,
-            is_file=is_file
-        )
+    env = env.upper()
+    if env == "PROD":
+        plan, _ = _run_chunks(sims, ("PROD",), lambda chunk, session: _plan_prod_chunk(session[1], chunk),
+                              parallelism)
     else:
+        plan, _ = _run_chunks(
+            sims, ("UAT", "PROD"),
+            lambda chunk, session_uat, session_prod: _plan_uat_chunk(session_uat[1], session_prod[1], chunk),
+            parallelism
+        )
+
+    counts: Dict[str, int] = {}
+    for entry in plan:
+        counts[entry["action"]] = counts.get(entry["action"], 0) + 1
+
+    port_counts = [e["spmlRequests"] for e in plan if e["spmlRequests"]]
+    return {
+        "success": True,
+        "dryRun": True,
+        "statusList": plan,
+        "counts": counts,
+        "spmlRequests": sum(port_counts),
+        "spmlFiles": _estimate_spml_files(port_counts),
+        # SIM à créer en UAT : nombre de ports connu seulement après SIM_TO_CREATE
+        "spmlUnknown": sum(1 for e in plan if e["status"] == "planned" and e["spmlRequests"] is None),
+    }
+
+
+
+def _liberate(user_inputs: List[str], env: str = "PROD", username: str = None, user_type: str = None, ip_address: str = None, is_file: bool = False,
+             bulk: bool = SIM_BULK_MODE, on_status: Optional[StatusCallback] = None,
+             parallelism: int = SIM_PARALLELISM, parsed: Optional[ParsedIccids] = None,
+             skip_recent: bool = True, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Appelle la fonction liberate_prod ou liberate_uat en passant les informations utilisateur et ip_address.
+    on_status(entry) est appelé dès que le statut final d'une SIM est connu.
+    parallelism : nombre de lots traités simultanément (borné par SIM_MAX_PARALLELISM).
+    parsed : résultat de parse_iccids déjà calculé par l'appelant (sinon user_inputs est parsé ici).
+    skip_recent : les SIM libérées avec AUC créé depuis moins de RECENT_SIM_TTL s ne sont pas retraitées.
+    dry_run : aucune écriture, retourne le plan de plan_liberation (statusList avec l'action prévue par SIM).
+    """
+    if env.upper() not in ("PROD", "UAT"):
         return {"success": False, "statusList": [], "message": "Environment invalide"}
 
+    if parsed is None:
+        parsed = parse_iccids(user_inputs)
+
+    # ICCID rejetés au parsing : aucun aller-retour Oracle
+    decided = []  # statuts connus sans traitement Oracle (invalides, libérées récemment)
+    for sim, reason in parsed.invalid.items():
+        _record(decided, on_status, {"sim": sim, "status": "error", "message": reason, "action": "invalid"})
+        if dry_run:
+            continue
+        log_sim_liberation(
+            action_type=env.upper(),
+            status=0,
+            created_by=username,
+            user_type=user_type,
+            num_sim=sim,
+            sim_status=None,
+            dealer_id=None,
+            message=reason,
+            ip_address=ip_address
+        )
 
+    # SIM déjà libérées récemment : ni requête Oracle ni nouveau SPML
+    to_process = parsed.valid
+    if skip_recent:
+        to_process = []
+        for sim in parsed.valid:
+            if not recent_liberations.contains(env, sim):
+                to_process.append(sim)
+                continue
+            msg = f"Already liberated & AUC created in {env.upper()} (recent request)"
+            _record(decided, on_status, {"sim": sim, "status": "success", "message": msg, "action": "recent"})
+            if dry_run:
+                continue
+            log_sim_liberation(
+                action_type=env.upper(),
+                status=1,
+                created_by=username,
+                user_type=user_type,
+                num_sim=sim,
+                sim_status=None,
+                dealer_id=None,
+                message=msg,
+                ip_address=ip_address
+            )
 
+    if dry_run:
+        result = plan_liberation(to_process, env, parallelism)
+        for entry in decided:
+            result["counts"][entry["action"]] = result["counts"].get(entry["action"], 0) + 1
+        result["statusList"] = parsed.in_input_order(decided + result["statusList"])
+        return result
+
+    liberate_env = liberate_prod if env.upper() == "PROD" else liberate_uat
+    result = liberate_env(
+        user_inputs=to_process,
+        username=username,
+        user_type=user_type,
+        ip_address=ip_address,
+        is_file=is_file,
+        bulk=bulk,
+        on_status=on_status,
+        parallelism=parallelism,
+        prevalidated=True
+    )
+    if decided:
+        # Invalides / récentes connues d'emblée : fusionnées à leur place dans l'ordre de saisie
+        result["statusList"] = parsed.in_input_order(decided + result.get("statusList", []))
+        result["success"] = not parsed.invalid
+    return result
+
+
+def liberate(user_inputs: List[str], env: str = "PROD", username: str = None, user_type: str = None, ip_address: str = None, is_file: bool = False,
+             bulk: bool = SIM_BULK_MODE, on_status: Optional[StatusCallback] = None,
+             parallelism: int = SIM_PARALLELISM, parsed: Optional[ParsedIccids] = None,
+             skip_recent: bool = True, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Voir _liberate ; mesure la durée totale (étape liberate / dry_run) et compte le statut final de chaque SIM
+    """
+    with timed("dry_run" if dry_run else "liberate", env.upper()):
+        result = _liberate(user_inputs, env, username, user_type, ip_address, is_file, bulk, on_status,
+                           parallelism, parsed, skip_recent, dry_run)
+    if not dry_run:
+        for entry in result.get("statusList", []):
+            SIM_RESULTS.inc(env=env.upper(), status=entry["status"])
+    return result
@@ -0,0 +1,57 @@
+"""
+Configuration gunicorn : gunicorn -c gunicorn.conf.py wsgi:application
+"""
+import os
+import signal
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5012")
+# Un seul worker : jobs (job_manager), idempotence et SIM récemment libérées (idempotency_store,
+# recent_liberations), admission et créneaux Oracle (admission_controller) et métriques (registry) sont
+# en mémoire du process. Avec plusieurs workers, un GET /sim/jobs/<id> arrivant sur l'autre process
+# répond 404, un Idempotency-Key rejoué relance la libération, les limites d'admission et les sessions
+# Oracle sont multipliées par le nombre de workers et chaque /metrics lit les compteurs d'un autre process.
+# La montée en charge passe par GUNICORN_THREADS (et ORA_POOL_MAX / ADMISSION_ENV_SLOTS).
+workers = int(os.getenv("GUNICORN_WORKERS", "1"))
+# Threads : les libérations synchrones et les flux NDJSON occupent un thread pendant tout le fichier ;
+# le reste (suivi des jobs, /health, /metrics) doit toujours trouver un thread libre
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "600"))
+# Délai entre SIGTERM et SIGKILL : drain() y cale son attente et garde DRAIN_FLUSH_MARGIN s pour les logs
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "300"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+# Pas de preload : cx_Oracle, paramiko et les threads de fond ne survivent pas à un fork
+preload_app = False
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    # -w en ligne de commande remplace la valeur ci-dessus
+    if server.cfg.workers > 1:
+        server.log.warning(
+            "%s workers : jobs, idempotence, admission et métriques ne sont pas partagés entre "
+            "workers (cf. gunicorn.conf.py)", server.cfg.workers
+        )
+
+
+def post_worker_init(worker):
+    # SIGTERM (redéploiement) : /health/ready passe en 503 et les nouvelles libérations sont refusées
+    # dès la réception du signal, pendant que gunicorn termine les requêtes en cours
+    import lifecycle
+
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def on_term(signum, frame):
+        lifecycle.begin_drain()
+        if callable(previous):
+            previous(signum, frame)
+
+    signal.signal(signal.SIGTERM, on_term)
+
+
+def worker_exit(server, worker):
+    # Après la dernière requête : jobs de fond, flux restants, file des logs, pools
+    import lifecycle
+
+    lifecycle.drain(grace=server.cfg.graceful_timeout)
@@ -0,0 +1,260 @@
+import base64
+import csv
+import io
+import json
+import os
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import text
+
+import logs
+from creation_liberation_sim import normalize_iccid
+from metrics import timed
+
+# === CONFIG consultation de l'historique SimLiberationProdUat ===
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "100"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "500"))
+HISTORY_SUMMARY_MAX_DAYS = int(os.getenv("HISTORY_SUMMARY_MAX_DAYS", "92"))           # plage max des synthèses
+HISTORY_EXPORT_MAX_ROWS = int(os.getenv("HISTORY_EXPORT_MAX_ROWS", "1000000"))
+HISTORY_EXPORT_FETCH_SIZE = int(os.getenv("HISTORY_EXPORT_FETCH_SIZE", "2000"))       # lignes par aller-retour
+
+# Colonnes exposées (ordre de l'export CSV) → clé JSON
+_COLUMNS = [
+    ("id", "id"),
+    ("created_at", "createdAt"),
+    ("action_type", "actionType"),
+    ("status", "status"),
+    ("created_by", "createdBy"),
+    ("user_type", "userType"),
+    ("num_sim", "numSim"),
+    ("sim_status", "simStatus"),
+    ("dealer_id", "dealerId"),
+    ("message", "message"),
+    ("ip_address", "ipAddress"),
+]
+_SELECT_COLUMNS = ", ".join(column for column, _ in _COLUMNS)
+
+
+class InvalidQuery(ValueError):
+    """Filtre, curseur ou plage de dates invalide"""
+
+
+@dataclass
+class HistoryFilters:
+    """
+    Filtres poussés dans le WHERE ; chacun correspond à un préfixe d'index (cf. sql/SimLiberationProdUat_indexes.sql)
+    """
+    num_sim: Optional[str] = None
+    created_by: Optional[str] = None
+    action_type: Optional[str] = None
+    status: Optional[int] = None
+    date_from: Optional[datetime] = None     # inclus
+    date_to: Optional[datetime] = None       # exclu
+
+    def where(self) -> Tuple[List[str], Dict[str, Any]]:
+        clauses, params = [], {}
+        if self.num_sim:
+            clauses.append("num_sim = :num_sim")
+            params["num_sim"] = self.num_sim
+        if self.created_by:
+            clauses.append("created_by = :created_by")
+            params["created_by"] = self.created_by
+        if self.action_type:
+            clauses.append("action_type = :action_type")
+            params["action_type"] = self.action_type
+        if self.status is not None:
+            clauses.append("status = :status")
+            params["status"] = self.status
+        if self.date_from:
+            clauses.append("created_at >= :date_from")
+            params["date_from"] = self.date_from
+        if self.date_to:
+            clauses.append("created_at < :date_to")
+            params["date_to"] = self.date_to
+        return clauses, params
+
+
+# =========================
+# Lecture des paramètres
+# =========================
+def _parse_datetime(value: str, name: str, end: bool = False) -> datetime:
+    """AAAA-MM-JJ (journée entière : to est alors exclusif au lendemain) ou horodatage ISO 8601"""
+    try:
+        if len(value) == 10:
+            day = date.fromisoformat(value)
+            return datetime.combine(day + timedelta(days=1) if end else day, datetime.min.time())
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise InvalidQuery(f"Paramètre {name} invalide : {value}")
+
+
+def parse_filters(args: Dict[str, str]) -> HistoryFilters:
+    filters = HistoryFilters()
+    if args.get("numSim"):
+        filters.num_sim = normalize_iccid(args["numSim"]).upper()
+    if args.get("createdBy"):
+        # log_sim_liberation enregistre created_by en minuscules
+        filters.created_by = args["createdBy"].strip().lower()
+    if args.get("actionType"):
+        filters.action_type = args["actionType"].strip()
+    if args.get("status") not in (None, ""):
+        if args["status"] not in ("0", "1"):
+            raise InvalidQuery("Paramètre status invalide : 0 ou 1")
+        filters.status = int(args["status"])
+    if args.get("from"):
+        filters.date_from = _parse_datetime(args["from"], "from")
+    if args.get("to"):
+        filters.date_to = _parse_datetime(args["to"], "to", end=True)
+    if filters.date_from and filters.date_to and filters.date_from >= filters.date_to:
+        raise InvalidQuery("La date from doit précéder la date to")
+    return filters
+
+
+def page_size(value: Optional[str]) -> int:
+    if not value:
+        return HISTORY_PAGE_SIZE
+    try:
+        size = int(value)
+    except ValueError:
+        raise InvalidQuery(f"Paramètre limit invalide : {value}")
+    return max(1, min(size, HISTORY_MAX_PAGE_SIZE))
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError):
+        raise InvalidQuery("Curseur de pagination invalide")
+
+
+def _json_value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def _row_to_dict(row: Any) -> Dict[str, Any]:
+    return {key: _json_value(value) for (_, key), value in zip(_COLUMNS, row)}
+
+
+# =========================
+# Requêtes
+# =========================
+def list_entries(filters: HistoryFilters, limit: int, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Page d'historique du plus récent au plus ancien, pagination par clé (created_at, id) :
+    coût constant quelle que soit la profondeur de la page (pas d'OFFSET)
+    """
+    clauses, params = filters.where()
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        # created_at est un DATETIME (1/300 s) : le paramètre (DATETIME2 côté pyodbc) est ramené au même type,
+        # sinon SQL Server 2016+ compare en DATETIME2 exact et saute ou répète les lignes en limite de page
+        clauses.append("(created_at < CAST(:cursor_at AS DATETIME) "
+                       "OR (created_at = CAST(:cursor_at AS DATETIME) AND id < :cursor_id))")
+        params.update(cursor_at=created_at, cursor_id=row_id)
+    # Une ligne de plus que la page : indique s'il reste une page suivante
+    params["limit"] = limit + 1
+
+    query = text(
+        f"SELECT TOP (:limit) {_SELECT_COLUMNS} FROM SimLiberationProdUat"
+        f"{' WHERE ' + ' AND '.join(clauses) if clauses else ''}"
+        " ORDER BY created_at DESC, id DESC"
+    )
+    with timed("history_query"), logs.engine.connect() as connection:
+        rows = connection.execute(query, params).fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "items": [_row_to_dict(row) for row in rows],
+        "nextCursor": encode_cursor(rows[-1][1], rows[-1][0]) if has_more else None,
+    }
+
+
+def _summary_range(filters: HistoryFilters) -> None:
+    """Les synthèses exigent une plage bornée (par défaut : les 30 derniers jours)"""
+    if filters.date_to is None:
+        filters.date_to = datetime.combine(date.today() + timedelta(days=1), datetime.min.time())
+    if filters.date_from is None:
+        filters.date_from = filters.date_to - timedelta(days=30)
+    if filters.date_to - filters.date_from > timedelta(days=HISTORY_SUMMARY_MAX_DAYS):
+        raise InvalidQuery(f"Plage limitée à {HISTORY_SUMMARY_MAX_DAYS} jours pour les synthèses")
+
+
+def _summary(group_columns: List[Tuple[str, str]], filters: HistoryFilters) -> List[Dict[str, Any]]:
+    _summary_range(filters)
+    clauses, params = filters.where()
+    select = ", ".join(f"{expr} AS {alias}" for expr, alias in group_columns)
+    group_by = ", ".join(expr for expr, _ in group_columns)
+    query = text(
+        f"SELECT {select}, "
+        "SUM(CASE WHEN status = 1 THEN 1 ELSE 0 END) AS success_count, "
+        "SUM(CASE WHEN status = 1 THEN 0 ELSE 1 END) AS error_count, "
+        "MIN(created_at) AS first_at, MAX(created_at) AS last_at "
+        f"FROM SimLiberationProdUat WHERE {' AND '.join(clauses)} "
+        f"GROUP BY {group_by} ORDER BY {group_by}"
+    )
+    with timed("history_summary"), logs.engine.connect() as connection:
+        rows = connection.execute(query, params).fetchall()
+
+    result = []
+    for row in rows:
+        entry = {alias: _json_value(value) for (_, alias), value in zip(group_columns, row)}
+        success, errors, first_at, last_at = row[len(group_columns):]
+        entry.update(successCount=success, errorCount=errors, total=success + errors,
+                     firstAt=_json_value(first_at), lastAt=_json_value(last_at))
+        result.append(entry)
+    return result
+
+
+def user_activity(filters: HistoryFilters) -> List[Dict[str, Any]]:
+    """Activité par utilisateur et type d'action sur la plage"""
+    return _summary([("created_by", "createdBy"), ("action_type", "actionType")], filters)
+
+
+def daily_summary(filters: HistoryFilters) -> List[Dict[str, Any]]:
+    """Volumes par jour et type d'action sur la plage"""
+    return _summary([("CAST(created_at AS date)", "day"), ("action_type", "actionType")], filters)
+
+
+def export_csv(filters: HistoryFilters, max_rows: int = HISTORY_EXPORT_MAX_ROWS) -> Iterator[str]:
+    """
+    Export CSV en flux : curseur serveur (stream_results), lignes lues par lots de
+    HISTORY_EXPORT_FETCH_SIZE et écrites au fil de l'eau, jamais toute la sélection en mémoire
+    """
+    clauses, params = filters.where()
+    params["limit"] = max_rows
+    query = text(
+        f"SELECT TOP (:limit) {_SELECT_COLUMNS} FROM SimLiberationProdUat"
+        f"{' WHERE ' + ' AND '.join(clauses) if clauses else ''}"
+        " ORDER BY created_at DESC, id DESC"
+    )
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush() -> str:
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    writer.writerow([column for column, _ in _COLUMNS])
+    yield flush()
+
+    with timed("history_export"), logs.engine.connect() as connection:
+        result = connection.execution_options(stream_results=True).execute(query, params)
+        while True:
+            rows = result.fetchmany(HISTORY_EXPORT_FETCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                writer.writerow([_json_value(value) for value in row])
+            yield flush()
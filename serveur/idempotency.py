@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+# === CONFIG idempotence des demandes de libération ===
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "600"))                  # s de conservation d'une réponse
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "500"))
+# Au-delà (corps JSON en octets), seul le résumé de la réponse est gardé (sans la liste "results")
+IDEMPOTENCY_MAX_BODY_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BODY_BYTES", str(256 * 1024)))
+RECENT_SIM_TTL = int(os.getenv("RECENT_SIM_TTL", "900"))                    # s pendant lesquels une SIM libérée est sautée
+RECENT_SIM_MAX_ENTRIES = int(os.getenv("RECENT_SIM_MAX_ENTRIES", "200000"))
+
+
+class RequestInProgress(Exception):
+    """Une requête identique est déjà en cours de traitement"""
+
+
+class IdempotencyKeyReused(Exception):
+    """Idempotency-Key déjà utilisée pour une demande différente (environnement, mode ou ICCID) : 422"""
+
+
+class TTLCache:
+    """
+    Cache borné en mémoire (par process) : éviction LRU au-delà de max_entries, expiration après ttl s
+    """
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None or time.monotonic() - hit[0] >= self.ttl:
+                if hit is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return hit[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class IdempotencyStore:
+    """
+    Réponses des demandes de libération déjà traitées, rejouées telles quelles pendant IDEMPOTENCY_TTL.
+    Une demande identique arrivant pendant le traitement de la première est refusée (RequestInProgress).
+    Chaque clé garde l'empreinte de sa demande (payload_fingerprint) : la même clé avec un autre contenu
+    est refusée (IdempotencyKeyReused) au lieu de rejouer une réponse qui ne la concerne pas.
+    Une réponse de plus de max_body_bytes n'est gardée que résumée ("resultsOmitted") : le détail par
+    SIM reste disponible via le run (checkpoint_store) ou le job.
+    """
+
+    def __init__(self, max_entries: int, ttl: int, max_body_bytes: int = IDEMPOTENCY_MAX_BODY_BYTES):
+        self.max_body_bytes = max_body_bytes
+        self._responses = TTLCache(max_entries, ttl)
+        self._in_flight: Dict[str, Optional[str]] = {}
+        self._lock = threading.Lock()
+        self.truncated = 0
+
+    @staticmethod
+    def _check(stored: Optional[str], fingerprint: Optional[str]) -> None:
+        if stored is not None and fingerprint is not None and stored != fingerprint:
+            raise IdempotencyKeyReused("Idempotency-Key déjà utilisée pour une autre demande")
+
+    def begin(self, key: str, fingerprint: Optional[str] = None) -> Optional[Tuple[dict, int]]:
+        """
+        Réponse mémorisée (body, code HTTP) si la demande a déjà été traitée,
+        sinon réserve la clé (terminer par finish ou abort)
+        """
+        with self._lock:
+            cached = self._responses.get(key)
+            if cached is not None:
+                stored, body, status_code = cached
+                self._check(stored, fingerprint)
+                return body, status_code
+            if key in self._in_flight:
+                self._check(self._in_flight[key], fingerprint)
+                raise RequestInProgress("Une demande identique est déjà en cours de traitement")
+            self._in_flight[key] = fingerprint
+            return None
+
+    def _compact(self, body: dict) -> dict:
+        if len(json.dumps(body, default=str)) <= self.max_body_bytes:
+            return body
+        summary = {k: v for k, v in body.items() if k not in ("results", "timings")}
+        summary["resultsOmitted"] = True
+        return summary
+
+    def finish(self, key: str, body: dict, status_code: int) -> None:
+        compact = self._compact(body)
+        with self._lock:
+            self.truncated += compact is not body
+            body = compact
+            fingerprint = self._in_flight.pop(key, None)
+            self._responses.set(key, (fingerprint, body, status_code))
+
+    def abort(self, key: str) -> None:
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._responses.stats(), "in_flight": len(self._in_flight), "truncated": self.truncated}
+
+
+def payload_fingerprint(env: str, mode: str, sims: Iterable[str]) -> str:
+    """Empreinte du contenu d'une demande : environnement, mode de réponse, ICCID normalisés (ordre et doublons indifférents)"""
+    h = hashlib.sha256(f"{env.upper()}|{mode}".encode())
+    for sim in sorted(set(sims)):
+        h.update(b"\n")
+        h.update(sim.encode())
+    return h.hexdigest()
+
+
+def request_key(owner: str, client_key: Optional[str], env: str, mode: str, sims: Iterable[str]) -> str:
+    """
+    Clé d'idempotence : Idempotency-Key du client, sinon empreinte du contenu (payload_fingerprint)
+    """
+    if client_key:
+        return hashlib.sha256(f"{owner}|key|{client_key}".encode()).hexdigest()
+    return hashlib.sha256(f"{owner}|{payload_fingerprint(env, mode, sims)}".encode()).hexdigest()
+
+
+class RecentLiberations:
+    """
+    SIM libérées avec AUC créé récemment, par environnement : une nouvelle demande
+    pendant RECENT_SIM_TTL ne refait ni les requêtes Oracle ni le dépôt SPML
+    """
+
+    def __init__(self, max_entries: int, ttl: int):
+        self._cache = TTLCache(max_entries, ttl)
+
+    def add(self, env: str, sim: str) -> None:
+        self._cache.set((env.upper(), sim), True)
+
+    def contains(self, env: str, sim: str) -> bool:
+        return self._cache.get((env.upper(), sim)) is not None
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+idempotency_store = IdempotencyStore(IDEMPOTENCY_MAX_ENTRIES, IDEMPOTENCY_TTL)
+recent_liberations = RecentLiberations(RECENT_SIM_MAX_ENTRIES, RECENT_SIM_TTL)
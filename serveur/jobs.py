@@ -0,0 +1,145 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+# === CONFIG jobs de libération en tâche de fond ===
+JOBS_MAX_WORKERS = int(os.getenv("JOBS_MAX_WORKERS", "2"))      # jobs exécutés en parallèle
+JOBS_MAX_PENDING = int(os.getenv("JOBS_MAX_PENDING", "20"))     # jobs en attente + en cours acceptés
+JOBS_TTL = int(os.getenv("JOBS_TTL", "86400"))                  # s de conservation d'un job terminé
+JOB_CHUNK_SIZE = int(os.getenv("JOB_CHUNK_SIZE", "500"))        # ICCID traités par appel à liberate
+
+
+class JobQueueFull(Exception):
+    """Trop de jobs en attente ou en cours"""
+
+
+class Job:
+    """
+    Job de libération : progression et résultats (partiels puis finaux) consultables pendant l'exécution
+    """
+
+    def __init__(self, owner: str, env: str, total: int):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.env = env
+        self.total = total
+        self.status = "queued"            # queued → running → done / failed
+        self.message = ""
+        self.processed = 0
+        self.success = 0
+        self.errors = 0
+        self.results: List[Dict[str, Any]] = []
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self._finished_monotonic: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            self.status = "running"
+            self.started_at = datetime.now(timezone.utc)
+
+    def add_results(self, results: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self.results.extend(results)
+            self.processed += len(results)
+            ok = sum(1 for r in results if r["status"] == "success")
+            self.success += ok
+            self.errors += len(results) - ok
+
+    def finish(self, status: str, message: str = "") -> None:
+        with self._lock:
+            self.status = status
+            self.message = message or f"{self.success} SIM traitées avec succès, {self.errors} anomalies."
+            self.finished_at = datetime.now(timezone.utc)
+            self._finished_monotonic = time.monotonic()
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def expired(self, ttl: int) -> bool:
+        return self._finished_monotonic is not None and time.monotonic() - self._finished_monotonic > ttl
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "jobId": self.id,
+                "environment": self.env,
+                "status": self.status,
+                "message": self.message,
+                "total": self.total,
+                "processed": self.processed,
+                "successCount": self.success,
+                "errorCount": self.errors,
+                "createdAt": self.created_at.isoformat(),
+                "startedAt": self.started_at.isoformat() if self.started_at else None,
+                "finishedAt": self.finished_at.isoformat() if self.finished_at else None,
+            }
+
+    def results_slice(self, offset: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            end = None if limit is None else offset + limit
+            return self.results[offset:end]
+
+
+class JobManager:
+    """
+    Pool borné de workers exécutant les jobs indépendamment de la requête HTTP qui les a soumis
+    (une déconnexion du client n'interrompt pas le job)
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, ttl: int):
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="liberation-job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def _purge_locked(self) -> None:
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.expired(self.ttl)]:
+            del self._jobs[job_id]
+
+    def submit(self, owner: str, env: str, total: int, target: Callable[..., None], *args, **kwargs) -> Job:
+        """
+        Enregistre le job et le planifie ; target(job, *args, **kwargs) alimente job.add_results
+        """
+        with self._lock:
+            self._purge_locked()
+            if sum(1 for job in self._jobs.values() if job.is_active) >= self.max_pending:
+                raise JobQueueFull("Trop de jobs en cours, réessayez plus tard")
+            job = Job(owner, env, total)
+            self._jobs[job.id] = job
+
+        self._executor.submit(self._run, job, target, args, kwargs)
+        return job
+
+    def _run(self, job: Job, target: Callable[..., None], args: tuple, kwargs: dict) -> None:
+        job.start()
+        try:
+            target(job, *args, **kwargs)
+            job.finish("done")
+        except Exception as e:
+            traceback.print_exc()
+            job.finish("failed", f"Erreur interne: {str(e)}")
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            self._purge_locked()
+            return self._jobs.get(job_id)
+
+    def active_count(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.is_active)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+
+job_manager = JobManager(max_workers=JOBS_MAX_WORKERS, max_pending=JOBS_MAX_PENDING, ttl=JOBS_TTL)
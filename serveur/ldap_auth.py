@@ -1,10 +1,147 @@
 import os
-from ldap3 import Server, Connection, ALL, SIMPLE
+import threading
+import time
+from ldap3 import Server, ServerPool, Connection, NONE, SIMPLE, SUBTREE, REUSABLE, FIRST, ROUND_ROBIN, RANDOM
 import re
+from typing import Any, Dict, List, Optional, Tuple
 from ldap3.utils.conv import escape_filter_chars
+from metrics import timed
 
+# Règle AD LDAP_MATCHING_RULE_IN_CHAIN : appartenance aux groupes imbriqués en une requête
+LDAP_MATCHING_RULE_IN_CHAIN = "1.2.840.113556.1.4.1941"
 
-def bind_user(username, password):
+_CN_RE = re.compile(r'CN=([^,]+)', re.IGNORECASE)
+
+# Groupe AD → user_type (par ordre de priorité)
+USER_TYPE_BY_GROUP = [
+    ('ADM Support 1515 Group', 'support1515'),
+    ('CRM IT Team', 'crm_it_team'),
+    ('Digital Factory Group', 'digital_factory'),
+    ('B2B Activations', 'boa_activations'),
+    ('RoamingTeam', 'roaming_team'),
+]
+
+# Cache user_type (TTL en secondes)
+LDAP_USER_TYPE_TTL = int(os.getenv("LDAP_USER_TYPE_TTL", "300"))
+# Utilisateur sans groupe habilité : TTL court (0 = pas mis en cache), un ajout au groupe vaut dès le login suivant
+LDAP_USER_TYPE_NEGATIVE_TTL = int(os.getenv("LDAP_USER_TYPE_NEGATIVE_TTL", "0"))
+LDAP_USER_TYPE_CACHE_SIZE = int(os.getenv("LDAP_USER_TYPE_CACHE_SIZE", "1000"))
+
+# Pool de contrôleurs de domaine (LDAP_SERVER peut lister plusieurs DC séparés par des virgules)
+LDAP_CONNECT_TIMEOUT = int(os.getenv("LDAP_CONNECT_TIMEOUT", "5"))     # s pour ouvrir la socket vers un DC
+LDAP_RECEIVE_TIMEOUT = int(os.getenv("LDAP_RECEIVE_TIMEOUT", "10"))    # s d'attente d'une réponse
+LDAP_POOL_STRATEGY = os.getenv("LDAP_POOL_STRATEGY", "FIRST")          # FIRST | ROUND_ROBIN | RANDOM
+LDAP_POOL_ACTIVE = int(os.getenv("LDAP_POOL_ACTIVE", "3"))             # cycles de recherche d'un DC joignable
+LDAP_POOL_EXHAUST = int(os.getenv("LDAP_POOL_EXHAUST", "60"))          # s d'exclusion d'un DC injoignable
+
+# Compte de service pour la recherche des groupes (connexion poolée, optionnelle)
+LDAP_SERVICE_USER = os.getenv("LDAP_SERVICE_USER")
+LDAP_SERVICE_PASSWORD = os.getenv("LDAP_SERVICE_PASSWORD")
+LDAP_SERVICE_POOL_SIZE = int(os.getenv("LDAP_SERVICE_POOL_SIZE", "5"))
+
+_POOL_STRATEGIES = {"FIRST": FIRST, "ROUND_ROBIN": ROUND_ROBIN, "RANDOM": RANDOM}
+
+_user_type_cache = {}
+_user_type_cache_lock = threading.Lock()
+
+_server_pool = None
+_service_conn = None
+_init_lock = threading.RLock()
+
+# Classe des connexions ldap3 (remplaçable par un annuaire MOCK_SYNC, cf. bench/)
+_connection_class = Connection
+
+
+def get_server_pool() -> ServerPool:
+    """
+    ServerPool partagé, créé une fois : pas de lecture RootDSE/schéma (get_info=NONE)
+    """
+    global _server_pool
+    if _server_pool is not None:
+        return _server_pool
+
+    with _init_lock:
+        if _server_pool is None:
+            ldap_server = os.getenv("LDAP_SERVER")
+            if not ldap_server:
+                raise ValueError("LDAP_SERVER is not set in environment variables")
+            servers = [
+                Server(host.strip(), get_info=NONE, connect_timeout=LDAP_CONNECT_TIMEOUT)
+                for host in ldap_server.split(",") if host.strip()
+            ]
+            _server_pool = ServerPool(
+                servers,
+                _POOL_STRATEGIES.get(LDAP_POOL_STRATEGY.upper(), FIRST),
+                active=LDAP_POOL_ACTIVE,
+                exhaust=LDAP_POOL_EXHAUST
+            )
+    return _server_pool
+
+
+def get_service_connection() -> Optional[Connection]:
+    """
+    Connexion poolée (stratégie REUSABLE) du compte de service, None si non configuré
+    """
+    global _service_conn
+    if not LDAP_SERVICE_USER or not LDAP_SERVICE_PASSWORD:
+        return None
+    if _service_conn is not None:
+        return _service_conn
+
+    with _init_lock:
+        if _service_conn is None:
+            _service_conn = _connection_class(
+                get_server_pool(),
+                user=LDAP_SERVICE_USER,
+                password=LDAP_SERVICE_PASSWORD,
+                authentication=SIMPLE,
+                client_strategy=REUSABLE,
+                pool_name="ldap-service",
+                pool_size=LDAP_SERVICE_POOL_SIZE,
+                read_only=True,
+                receive_timeout=LDAP_RECEIVE_TIMEOUT
+            )
+    return _service_conn
+
+
+def configure_directory(server, connection_class=Connection) -> None:
+    """
+    Remplace le ServerPool et la classe de connexion (annuaire de test) ;
+    la connexion de service et le cache user_type sont réinitialisés
+    """
+    global _server_pool, _service_conn, _connection_class
+    with _init_lock:
+        _server_pool, _service_conn, _connection_class = server, None, connection_class
+    with _user_type_cache_lock:
+        _user_type_cache.clear()
+
+
+def _cache_get(username):
+    with _user_type_cache_lock:
+        hit = _user_type_cache.get(username)
+        if hit:
+            ttl = LDAP_USER_TYPE_TTL if hit[1] else LDAP_USER_TYPE_NEGATIVE_TTL
+            if time.monotonic() - hit[0] < ttl:
+                return True, hit[1]
+        _user_type_cache.pop(username, None)
+        return False, None
+
+
+def _cache_set(username, user_type):
+    if not user_type and LDAP_USER_TYPE_NEGATIVE_TTL <= 0:
+        return
+    with _user_type_cache_lock:
+        if len(_user_type_cache) >= LDAP_USER_TYPE_CACHE_SIZE:
+            # Éviction de l'entrée la plus ancienne
+            oldest = min(_user_type_cache, key=lambda k: _user_type_cache[k][0])
+            del _user_type_cache[oldest]
+        _user_type_cache[username] = (time.monotonic(), user_type)
+
+
+def _user_connection(username, password) -> Optional[Connection]:
+    """
+    Ouvre une connexion liée avec les identifiants de l'utilisateur, None si le bind échoue
+    """
     ldap_server = os.getenv("LDAP_SERVER")
     ldap_base_dn = os.getenv("LDAP_BASE_DN")
 
@@ -14,82 +151,132 @@ def bind_user(username, password):
     user_dn = f"{username}@{ldap_base_dn}"
 
     try:
-        server = Server(ldap_server, get_info=ALL)
-        conn = Connection(server, user=user_dn, password=password, authentication=SIMPLE)
-        return conn.bind()
+        conn = _connection_class(get_server_pool(), user=user_dn, password=password, authentication=SIMPLE,
+                                 receive_timeout=LDAP_RECEIVE_TIMEOUT)
+        with timed("ldap_bind") as timing:
+            if not conn.bind():
+                timing.outcome = "rejected"
+                return None
+        return conn
     except Exception as e:
         print(f"LDAP Error: {e}")
+        return None
+
+
+def bind_user(username, password):
+    conn = _user_connection(username, password)
+    if conn is None:
         return False
+    conn.unbind()
+    return True
 
-def get_user_type(username, password):
-    user_groups = get_user_groups(username, password)
-    if 'ADM Support 1515 Group' in user_groups:
-        return 'support1515'
-    if 'CRM IT Team' in user_groups:
-        return 'crm_it_team'
-    if 'Digital Factory Group' in user_groups:
-        return 'digital_factory'
-    if 'B2B Activations' in user_groups:
-        return 'boa_activations'
-    if 'RoamingTeam' in user_groups:
-        return 'roaming_team'
-    
-    return None
 
-def get_user_groups(username, password):
-    ldap_server = os.getenv("LDAP_SERVER")
-    ldap_base_dn = os.getenv("LDAP_BASE_DN")
-    search_base = os.getenv("LDAP_SEARCH_BASE")
+def _search(conn, search_base, search_filter, attributes) -> List[Dict[str, Any]]:
+    with timed("ldap_search"):
+        result = conn.search(
+            search_base=search_base,
+            search_filter=search_filter,
+            search_scope=SUBTREE,
+            attributes=attributes
+        )
+        if conn.strategy.pooled:
+            # Stratégie REUSABLE : search() renvoie un message id
+            response, _ = conn.get_response(result)
+        else:
+            response = conn.response
+    return [r for r in response or [] if r.get("type") == "searchResEntry"]
 
-    if not ldap_server or not ldap_base_dn or not search_base:
+
+def _search_user_groups(conn, username) -> List[str]:
+    """
+    Groupes (directs et imbriqués) de l'utilisateur via LDAP_MATCHING_RULE_IN_CHAIN
+    """
+    search_base = os.getenv("LDAP_SEARCH_BASE")
+    if not search_base:
         raise ValueError("One or more LDAP environment variables are not set")
 
-    user_dn = f"{username}@{ldap_base_dn}"
+    safe_username = escape_filter_chars(username)
 
-    try:
-        server = Server(ldap_server, get_info=ALL)
-        conn = Connection(server, user=user_dn, password=password, auto_bind=True)
+    users = _search(conn, search_base, f'(&(objectClass=user)(sAMAccountName={safe_username}))', ['1.1'])
 
-        safe_username = escape_filter_chars(username)
+    if not users:
+        print("Utilisateur introuvable.")
+        return []
 
-        conn.search(
-            search_base=search_base,
-            search_filter=f'(&(objectClass=user)(sAMAccountName={safe_username}))',
-            attributes=['memberOf']
-        )
+    safe_user_dn = escape_filter_chars(users[0]["dn"])
 
-        if not conn.entries:
-            print("Utilisateur introuvable.")
-            return []
+    groups = _search(
+        conn, search_base,
+        f'(&(objectClass=group)(member:{LDAP_MATCHING_RULE_IN_CHAIN}:={safe_user_dn}))',
+        ['1.1']
+    )
 
-        user_entry = conn.entries[0]
-        direct_groups_dn = user_entry.memberOf.values if 'memberOf' in user_entry else []
+    groups_cns = []
+    for entry in groups:
+        match = _CN_RE.search(entry["dn"])
+        if match:
+            groups_cns.append(match.group(1))
+    return groups_cns
 
-        all_group_dns = set(direct_groups_dn)
-        parent_group_dns = set()
 
-        for group_dn in direct_groups_dn:
-            safe_group_dn = escape_filter_chars(group_dn)
-            conn.search(
-                search_base=search_base,
-                search_filter=f'(&(objectClass=group)(distinguishedName={safe_group_dn}))',
-                attributes=['memberOf']
-            )
-            if conn.entries:
-                group_entry = conn.entries[0]
-                parents = group_entry.memberOf.values if 'memberOf' in group_entry else []
-                parent_group_dns.update(parents)
+def _user_type_from_groups(user_groups) -> Optional[str]:
+    groups = set(user_groups)
+    for group, user_type in USER_TYPE_BY_GROUP:
+        if group in groups:
+            return user_type
+    return None
 
-        all_group_dns.update(parent_group_dns)
 
-        groups_cns = [
-            re.search(r'CN=([^,]+)', dn).group(1)
-            for dn in all_group_dns if re.search(r'CN=([^,]+)', dn)
-        ]
+def get_user_type(username, password):
+    cached, user_type = _cache_get(username)
+    if cached:
+        return user_type
+    user_type = _user_type_from_groups(get_user_groups(username, password))
+    _cache_set(username, user_type)
+    return user_type
 
-        return groups_cns
 
+def get_user_groups(username, password):
+    conn = _user_connection(username, password)
+    if conn is None:
+        return []
+    try:
+        return _search_user_groups(get_service_connection() or conn, username)
+    except ValueError:
+        raise
     except Exception as e:
         print(f"Erreur LDAP : {e}")
         return []
+    finally:
+        conn.unbind()
+
+
+def authenticate(username, password) -> Tuple[bool, Optional[str]]:
+    """
+    Login en un seul bind : vérifie le mot de passe puis résout le user_type
+    sur la même connexion ou la connexion de service (ou depuis le cache TTL).
+    Retourne (bind réussi, user_type ou None).
+    """
+    conn = _user_connection(username, password)
+    if conn is None:
+        return False, None
+
+    try:
+        cached, user_type = _cache_get(username)
+        if cached:
+            return True, user_type
+
+        try:
+            # Recherche sur la connexion poolée du compte de service si disponible
+            search_conn = get_service_connection() or conn
+            user_type = _user_type_from_groups(_search_user_groups(search_conn, username))
+        except ValueError:
+            raise
+        except Exception as e:
+            print(f"Erreur LDAP : {e}")
+            return True, None
 
+        _cache_set(username, user_type)
+        return True, user_type
+    finally:
+        conn.unbind()
@@ -0,0 +1,219 @@
+import os
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import text
+
+import creation_liberation_sim
+import ldap_auth
+import logs
+from jobs import job_manager
+
+# === CONFIG démarrage / sondes / arrêt ===
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+HEALTH_CACHE_TTL = float(os.getenv("HEALTH_CACHE_TTL", "10"))           # s de validité d'un résultat de sonde
+# Dépendances dont l'échec rend le worker non prêt (/health/ready en 503). UAT n'en fait pas partie :
+# une panne UAT ne doit pas sortir les instances de la rotation (elle reste visible dans checks)
+HEALTH_REQUIRED = [
+    name.strip() for name in os.getenv("HEALTH_REQUIRED", "oracle_prod,sftp,ldap,logs").split(",")
+    if name.strip()
+]
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "240"))                # s max d'attente des libérations en cours
+DRAIN_FLUSH_MARGIN = float(os.getenv("DRAIN_FLUSH_MARGIN", "30"))       # s gardées avant le SIGKILL pour les logs
+DRAIN_RETRY_AFTER = int(os.getenv("DRAIN_RETRY_AFTER", "30"))           # s suggérés au client refusé pendant l'arrêt
+
+
+# =========================
+# Sondes des dépendances
+# =========================
+def _probe_oracle(env: str) -> None:
+    conn, cur = creation_liberation_sim.get_connection(env)
+    try:
+        conn.ping()
+    finally:
+        creation_liberation_sim.close_connection(conn, cur)
+
+
+def _probe_sftp() -> None:
+    # Ouvre le transport s'il est tombé (sinon simple vérification)
+    creation_liberation_sim.sftp_pool.connect()
+
+
+def _probe_ldap() -> None:
+    pool = ldap_auth.get_server_pool()
+    servers = getattr(pool, "servers", [pool])
+    if not any(server.check_availability() is True for server in servers):
+        raise ConnectionError("Aucun contrôleur de domaine joignable")
+    # Bind du compte de service s'il est configuré
+    conn = ldap_auth.get_service_connection()
+    if conn is not None and not conn.bound:
+        conn.bind()
+
+
+def _probe_logs() -> None:
+    with logs.engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+
+PROBES: Dict[str, Callable[[], None]] = {
+    "oracle_prod": lambda: _probe_oracle("PROD"),
+    "oracle_uat": lambda: _probe_oracle("UAT"),
+    "sftp": _probe_sftp,
+    "ldap": _probe_ldap,
+    "logs": _probe_logs,
+}
+
+
+class ProbeCache:
+    """
+    Résultat de chaque sonde gardé HEALTH_CACHE_TTL secondes : les appels fréquents de l'orchestrateur
+    ne coûtent pas un aller-retour par dépendance. Une sonde déjà en cours n'est pas relancée
+    (le résultat précédent est servi).
+    """
+
+    def __init__(self, probes: Dict[str, Callable[[], None]], ttl: float):
+        self.probes = probes
+        self.ttl = ttl
+        self._results: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._locks = {name: threading.Lock() for name in probes}
+
+    def _run(self, name: str) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            self.probes[name]()
+            result = {"ok": True}
+        except Exception as e:
+            result = {"ok": False, "error": str(e)}
+        result["latencyMs"] = round((time.perf_counter() - start) * 1000, 1)
+        self._results[name] = (time.monotonic(), result)
+        return result
+
+    def check(self, name: str, force: bool = False) -> Dict[str, Any]:
+        cached = self._results.get(name)
+        if not force and cached and time.monotonic() - cached[0] < self.ttl:
+            return {**cached[1], "cached": True}
+        if not self._locks[name].acquire(blocking=cached is None):
+            return {**cached[1], "cached": True}
+        try:
+            return {**self._run(name), "cached": False}
+        finally:
+            self._locks[name].release()
+
+    def check_all(self, names: List[str], force: bool = False) -> Dict[str, Dict[str, Any]]:
+        return {name: self.check(name, force) for name in names}
+
+
+probe_cache = ProbeCache(PROBES, HEALTH_CACHE_TTL)
+
+
+# =========================
+# État du worker
+# =========================
+class _State:
+    def __init__(self):
+        self.warmed = False
+        self.draining = threading.Event()
+        self.drain_started: Optional[float] = None
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def enter(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+
+    def leave(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+
+state = _State()
+
+
+def is_draining() -> bool:
+    return state.draining.is_set()
+
+
+@contextmanager
+def in_flight() -> Iterator[None]:
+    """Libération synchrone / streaming en cours : attendue par drain()"""
+    state.enter()
+    try:
+        yield
+    finally:
+        state.leave()
+
+
+def warm_up() -> Dict[str, Dict[str, Any]]:
+    """
+    Avant d'accepter du trafic : pools Oracle PROD/UAT (sessions min ouvertes), transport SFTP,
+    contrôleurs LDAP (+ bind du compte de service) et engine SQL Server des logs.
+    Une dépendance en échec n'empêche pas le démarrage : /health/ready la signale.
+    """
+    results = probe_cache.check_all(list(PROBES), force=True) if WARMUP_ENABLED else {}
+    for name, result in results.items():
+        if not result["ok"]:
+            print(f"[WARMUP] {name} indisponible : {result['error']}")
+    state.warmed = True
+    return results
+
+
+def liveness() -> Dict[str, Any]:
+    return {"status": "draining" if is_draining() else "alive", "inFlight": state.in_flight,
+            "activeJobs": job_manager.active_count()}
+
+
+def readiness() -> Tuple[bool, Dict[str, Any]]:
+    checks = probe_cache.check_all(list(PROBES))
+    ready = state.warmed and not is_draining() and all(
+        checks[name]["ok"] for name in HEALTH_REQUIRED if name in checks
+    )
+    return ready, {
+        "status": "ready" if ready else ("draining" if is_draining() else "not_ready"),
+        "warmedUp": state.warmed,
+        "checks": checks,
+    }
+
+
+# =========================
+# Arrêt gracieux
+# =========================
+def begin_drain() -> None:
+    """Refuse les nouvelles libérations et passe /health/ready en 503 ; le délai de grâce court dès le premier appel"""
+    with state._lock:
+        if state.drain_started is None:
+            state.drain_started = time.monotonic()
+    state.draining.set()
+
+
+def drain(grace: Optional[float] = None, timeout: float = DRAIN_TIMEOUT) -> bool:
+    """
+    Attend la fin des libérations en cours (requêtes synchrones, flux, jobs), puis vide la file
+    des logs et ferme les pools. Retourne False si le délai a expiré : les fichiers interrompus
+    reprennent depuis leur dernier checkpoint avec le même runId.
+    grace : délai accordé depuis SIGTERM avant le SIGKILL (graceful_timeout de gunicorn). Les délais
+    partent de begin_drain (réception du signal), pas de l'appel : l'attente s'arrête au plus tard
+    DRAIN_FLUSH_MARGIN s avant le SIGKILL, pour vider les logs et fermer les pools.
+    """
+    begin_drain()
+    kill_at = state.drain_started + (grace if grace is not None else timeout + DRAIN_FLUSH_MARGIN)
+    deadline = min(state.drain_started + timeout, kill_at - DRAIN_FLUSH_MARGIN)
+    while (state.in_flight or job_manager.active_count()) and time.monotonic() < deadline:
+        time.sleep(0.5)
+    drained = not state.in_flight and not job_manager.active_count()
+    if not drained:
+        print(f"[SHUTDOWN] délai dépassé : {state.in_flight} requête(s), "
+              f"{job_manager.active_count()} job(s) interrompus")
+
+    job_manager.shutdown(wait=False)
+    # Quelques secondes gardées pour fermer les pools avant le SIGKILL
+    logs.log_sink.close(timeout=max(kill_at - time.monotonic() - 5, 1))
+    try:
+        creation_liberation_sim.sftp_pool.close()
+        creation_liberation_sim.close_pools()
+        logs.engine.dispose()
+    except Exception:
+        traceback.print_exc()
+    return drained
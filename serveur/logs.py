@@ -1,5 +1,19 @@
+import atexit
+import itertools
+import json
+import os
+import queue
+import re
+import threading
+import time
+import traceback
+from datetime import datetime
+from typing import Any, Dict, List
+
 from sqlalchemy import create_engine, text
-from config import LOGS_DB_CONFIG
+from processes import process_alive
+from config import LOGS_DB_CONFIG, LOGS_SINK_CONFIG
+from metrics import timed
 
 # =========================
 # SQL Server Engine
@@ -15,8 +29,263 @@ engine = create_engine(
     pool_size=5,
     max_overflow=10,
     pool_timeout=30,
-    pool_pre_ping=True
+    pool_pre_ping=True,
+    fast_executemany=True
+)
+
+INSERT_LOG_QUERY = text("""
+    INSERT INTO SimLiberationProdUat
+    (
+        action_type,
+        status,
+        created_at,
+        created_by,
+        user_type,
+        num_sim,
+        sim_status,
+        dealer_id,
+        message,
+        ip_address
+    )
+    VALUES
+    (
+        :action_type,
+        :status,
+        :created_at,
+        :created_by,
+        :user_type,
+        :num_sim,
+        :sim_status,
+        :dealer_id,
+        :message,
+        :ip_address
+    )
+""")
+
+# =========================
+# Writer asynchrone par lots
+# =========================
+class LogSink:
+    """
+    File bornée vidée par un thread de fond : les lignes sont insérées par lots (executemany)
+    dès que batch_size est atteint ou toutes les flush_interval secondes.
+    Si SQL Server est injoignable (ou la file pleine), les lignes partent dans un fichier de secours
+    propre au process (spill_file suffixé du pid : les workers gunicorn ne le partagent pas)
+    et sont réinjectées au prochain flush réussi, avec ceux laissés par des process arrêtés.
+    """
+
+    def __init__(self, queue_size: int, batch_size: int, flush_interval: float, spill_file: str):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_file = spill_file
+
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self._stop = object()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._replay_seq = itertools.count(1)
+        self._counters_lock = threading.Lock()
+        self.counters = {"queued": 0, "flushed": 0, "spilled": 0, "replayed": 0, "dropped": 0, "flush_errors": 0,
+                         "corrupt": 0, "sink_errors": 0}
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._counters_lock:
+            self.counters[name] += n
+
+    def _ensure_started(self) -> None:
+        # Thread démarré au premier log : rien ne tourne au moment d'un fork
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="log-sink", daemon=True)
+                self._thread.start()
+
+    def submit(self, row: Dict[str, Any]) -> None:
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(row)
+            self._count("queued")
+        except queue.Full:
+            self._spill([row])
+
+    def _run(self) -> None:
+        batch: List[Dict[str, Any]] = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            # Aucune exception ne doit arrêter le thread : la file ne serait plus jamais vidée
+            item = None
+            try:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    item = None
+
+                if item is self._stop:
+                    batch, pending = [], batch
+                    self._flush(pending)
+                    return
+                if item is not None:
+                    batch.append(item)
+
+                if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                    batch, pending = [], batch
+                    deadline = time.monotonic() + self.flush_interval
+                    self._flush(pending)
+            except Exception:
+                traceback.print_exc()
+                self._count("sink_errors")
+                if item is self._stop:
+                    return
+
+    def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        if not batch:
+            return
+        try:
+            with timed("log_flush"), engine.begin() as connection:
+                connection.execute(INSERT_LOG_QUERY, batch)
+            self._count("flushed", len(batch))
+        except Exception as e:
+            print(f"[LOG ERROR] Failed to insert {len(batch)} SimLiberationProdUat entries: {e}")
+            self._count("flush_errors")
+            self._spill(batch)
+            return
+        try:
+            self._replay_spill()
+        except Exception as e:
+            print(f"[LOG ERROR] Replay of spilled log entries failed: {e}")
+            self._count("flush_errors")
+
+    # -------------------------
+    # Fichier de secours
+    # -------------------------
+    def _spill_path(self) -> str:
+        root, ext = os.path.splitext(self.spill_file)
+        return f"{root}.{os.getpid()}{ext}"
+
+    def _spill(self, rows: List[Dict[str, Any]]) -> None:
+        spill_path = self._spill_path()
+        try:
+            with self._spill_lock, open(spill_path, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row, default=lambda v: v.isoformat()) + "\n")
+            self._count("spilled", len(rows))
+        except Exception as e:
+            print(f"[LOG ERROR] Failed to spill {len(rows)} log entries to {spill_path}: {e}")
+            self._count("dropped", len(rows))
+
+    def _claim_spill_files(self) -> List[str]:
+        """
+        Réserve les fichiers à rejouer par un os.replace atomique vers un nom propre à ce process :
+        son propre spill, et spill / replay laissés par un process qui n'existe plus (ou d'avant le
+        suffixe pid). Un fichier déjà réservé par un autre worker disparaît sous nos pieds : ignoré.
+        """
+        directory = os.path.dirname(self.spill_file) or "."
+        root, ext = os.path.splitext(os.path.basename(self.spill_file))
+        pattern = re.compile(rf"^{re.escape(root)}(?:\.(\d+))?{re.escape(ext)}(\.replay(?:\.\d+)*)?$")
+        pid = os.getpid()
+
+        claimed = []
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return claimed
+        for name in sorted(names):
+            match = pattern.match(name)
+            if match is None:
+                continue
+            owner = int(match.group(1)) if match.group(1) else None
+            if owner == pid:
+                # Le replay de ce process est en cours (thread unique) : seul le spill courant est repris
+                if match.group(2):
+                    continue
+            elif owner is not None and process_alive(owner):
+                continue
+            target = f"{self._spill_path()}.replay.{next(self._replay_seq)}"
+            try:
+                os.replace(os.path.join(directory, name), target)
+            except FileNotFoundError:
+                continue
+            claimed.append(target)
+        return claimed
+
+    def _read_spill(self, path: str) -> List[Dict[str, Any]]:
+        """Lignes d'un fichier de secours ; une ligne illisible (arrêt en pleine écriture) est ignorée et comptée"""
+        rows = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                    row["created_at"] = datetime.fromisoformat(row["created_at"])
+                except (ValueError, TypeError, KeyError) as e:
+                    print(f"[LOG ERROR] Ignored corrupt spilled log entry in {path}: {e}")
+                    self._count("corrupt")
+                    continue
+                rows.append(row)
+        return rows
+
+    def _replay_spill(self) -> None:
+        with self._spill_lock:
+            claimed = self._claim_spill_files()
+
+        failed = False
+        for replay_file in claimed:
+            rows = self._read_spill(replay_file)
+            for i in range(0, len(rows), self.batch_size):
+                batch = rows[i:i + self.batch_size]
+                try:
+                    if failed:
+                        raise ConnectionError("SQL Server indisponible")
+                    with engine.begin() as connection:
+                        connection.execute(INSERT_LOG_QUERY, batch)
+                except Exception as e:
+                    if not failed:
+                        print(f"[LOG ERROR] Replay of spilled log entries failed: {e}")
+                    failed = True
+                    # Retour dans le spill de ce process, repris au prochain flush réussi
+                    self._spill(rows[i:])
+                    break
+                self._count("replayed", len(batch))
+            os.remove(replay_file)
+
+    # -------------------------
+    # Arrêt / stats
+    # -------------------------
+    def close(self, timeout: float = 30) -> None:
+        """Vide complètement la file (appelé à l'arrêt du process)"""
+        if self._thread is None or not self._thread.is_alive():
+            # Thread absent : ce qui reste en file est inséré (ou mis dans le spill) ici
+            pending = []
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not self._stop:
+                    pending.append(item)
+            for i in range(0, len(pending), self.batch_size):
+                self._flush(pending[i:i + self.batch_size])
+            return
+        self._queue.put(self._stop)
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, int]:
+        with self._counters_lock:
+            stats = dict(self.counters)
+        stats["pending"] = self._queue.qsize()
+        return stats
+
+
+log_sink = LogSink(
+    queue_size=LOGS_SINK_CONFIG["queue_size"],
+    batch_size=LOGS_SINK_CONFIG["batch_size"],
+    flush_interval=LOGS_SINK_CONFIG["flush_interval"],
+    spill_file=LOGS_SINK_CONFIG["spill_file"]
 )
+atexit.register(log_sink.close)
 
 # =========================
 # LOG SIM LIBERATION
@@ -34,40 +303,13 @@ def log_sim_liberation(
 ):
     """
     Insert log into SimLiberationProdUat table
+    (mis en file pour le writer asynchrone si LOGS_ASYNC est actif)
     """
 
-    query = text("""
-        INSERT INTO SimLiberationProdUat
-        (
-            action_type,
-            status,
-            created_at,
-            created_by,
-            user_type,
-            num_sim,
-            sim_status,
-            dealer_id,
-            message,
-            ip_address
-        )
-        VALUES
-        (
-            :action_type,
-            :status,
-            GETDATE(),
-            :created_by,
-            :user_type,
-            :num_sim,
-            :sim_status,
-            :dealer_id,
-            :message,
-            :ip_address
-        )
-    """)
-
     data = {
         "action_type": action_type,
         "status": int(status),                       # sécurise BIT
+        "created_at": datetime.now(),                # horodatage au moment de l'action, pas du flush
         "created_by": created_by.lower() if created_by else None,
         "user_type": user_type,                      # 👈 NOUVEAU
         "num_sim": num_sim,
@@ -77,9 +319,13 @@ def log_sim_liberation(
         "ip_address": ip_address
     }
 
+    if LOGS_SINK_CONFIG["async"]:
+        log_sink.submit(data)
+        return
+
     try:
-        with engine.connect() as connection:
-            connection.execute(query, data)
+        with timed("log_insert"), engine.connect() as connection:
+            connection.execute(INSERT_LOG_QUERY, data)
             connection.commit()
     except Exception as e:
         print(f"[LOG ERROR] Failed to insert SimLiberationProdUat entry: {e}")
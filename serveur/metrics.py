@@ -0,0 +1,235 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+# Bornes (s) des histogrammes de durée : de la requête Oracle unitaire au dépôt d'un gros fichier
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+T = TypeVar("T")
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # {labels: [compteurs par borne..., +Inf, somme]}
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, series):
+                    labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-2]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    """
+    Jauge calculée au moment de l'export : collect() retourne {valeurs des labels: valeur}
+    """
+
+    def __init__(self, name: str, doc: str, labelnames: Tuple[str, ...],
+                 collect: Callable[[], Dict[Tuple[str, ...], float]]):
+        self.name = name
+        self.doc = doc
+        self.labelnames = labelnames
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} gauge"]
+        for key, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: Any) -> Any:
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Format texte d'exposition Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # Une jauge en erreur (ex. pool non joignable) ne doit pas casser l'export
+                lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "sim_stage_duration_seconds",
+    "Durée des étapes de libération / création AUC / logs / LDAP",
+    ("stage", "env", "outcome")
+))
+
+SIM_RESULTS = registry.register(Counter(
+    "sim_liberation_results_total",
+    "Statut final des SIM traitées par liberate",
+    ("env", "status")
+))
+
+
+# =========================
+# Détail par requête (réponses debug)
+# =========================
+class StageTrace:
+    """Durées cumulées par étape pour une requête (partagé entre les threads de la requête)"""
+
+    def __init__(self):
+        self._stages: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            entry = self._stages.setdefault(stage, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {
+                stage: {"count": count, "seconds": round(seconds, 6)}
+                for stage, (count, seconds) in self._stages.items()
+            }
+        return {"totalSeconds": round(time.perf_counter() - self._start, 6), "stages": stages}
+
+
+_trace: contextvars.ContextVar[Optional[StageTrace]] = contextvars.ContextVar("stage_trace", default=None)
+
+
+def start_trace() -> StageTrace:
+    """Active le détail par étape pour le contexte courant (requête HTTP)"""
+    trace = StageTrace()
+    _trace.set(trace)
+    return trace
+
+
+def stop_trace() -> None:
+    _trace.set(None)
+
+
+def record(stage: str, seconds: float, env: str = "", outcome: str = "ok") -> None:
+    STAGE_SECONDS.observe(seconds, stage=stage, env=env, outcome=outcome)
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+class Timing:
+    """Issue de l'étape chronométrée, modifiable dans le bloc (ex. "rejected")"""
+
+    def __init__(self):
+        self.outcome = "ok"
+
+
+@contextmanager
+def timed(stage: str, env: str = "") -> Iterator[Timing]:
+    """Chronomètre le bloc ; outcome=error si une exception en sort"""
+    start = time.perf_counter()
+    timing = Timing()
+    try:
+        yield timing
+    except BaseException:
+        timing.outcome = "error"
+        raise
+    finally:
+        record(stage, time.perf_counter() - start, env, timing.outcome)
+
+
+def timed_iter(iterable: Iterable[T], stage: str, env: str = "") -> Iterator[T]:
+    """Chronomètre la production de chaque élément d'un générateur (hors temps passé chez l'appelant)"""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            record(stage, time.perf_counter() - start, env)
+            return
+        except BaseException:
+            record(stage, time.perf_counter() - start, env, "error")
+            raise
+        record(stage, time.perf_counter() - start, env)
+        yield item
+
+
+def run_in_context(fn: Callable[..., T]) -> Callable[..., T]:
+    """
+    Enveloppe fn pour l'exécuter dans une copie du contexte courant (threads d'un executor) :
+    les durées des workers s'ajoutent au détail de la requête
+    """
+    ctx = contextvars.copy_context()
+
+    def wrapper(*args, **kwargs):
+        return ctx.copy().run(fn, *args, **kwargs)
+
+    return wrapper
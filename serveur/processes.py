@@ -0,0 +1,15 @@
+import os
+
+
+def process_alive(pid: int) -> bool:
+    """Le process pid existe-t-il encore sur cet hôte (fichiers de secours, baux de reprise) ?"""
+    if os.name == "nt":
+        # os.kill(pid, 0) termine le process sous Windows : considéré vivant
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,184 @@
+import socket
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, IO, Iterator, List, Optional, Tuple
+
+import paramiko
+
+# Erreurs indiquant un transport SSH (ou un canal) tombé. Les erreurs de statut SFTP (IOError /
+# PermissionError : répertoire absent, droits, disque plein) sont des OSError sur un transport actif
+_TRANSPORT_ERRORS = (paramiko.SSHException, EOFError)
+
+
+class SftpPoolExhausted(Exception):
+    """Aucun canal SFTP libéré dans le délai imparti"""
+
+
+class SftpPool:
+    """
+    Transport SSH persistant (keepalive) partagé entre les threads.
+    Les canaux SFTP ouverts dessus sont réutilisés et leur nombre simultané est borné ;
+    le transport est recréé automatiquement s'il est tombé.
+    """
+
+    def __init__(self, host: str, port: int, username: str, password: str,
+                 max_channels: int = 4, keepalive: int = 30, connect_timeout: float = 15,
+                 acquire_timeout: float = 60):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.keepalive = keepalive
+        self.connect_timeout = connect_timeout
+        self.acquire_timeout = acquire_timeout
+        self.max_channels = max_channels
+
+        self._lock = threading.Lock()
+        self._channels = threading.BoundedSemaphore(max_channels)
+        self._transport: Optional[paramiko.Transport] = None
+        self._idle: List[Tuple[paramiko.Transport, paramiko.SFTPClient]] = []
+        self._in_use = 0
+        self._connects = 0
+        self._reconnects = 0
+
+    # -------------------------
+    # Transport
+    # -------------------------
+    def _transport_locked(self) -> paramiko.Transport:
+        if self._transport is not None and self._transport.is_active():
+            return self._transport
+
+        if self._transport is not None:
+            self._reconnects += 1
+            self._close_locked()
+
+        sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+        transport = paramiko.Transport(sock)
+        try:
+            transport.banner_timeout = self.connect_timeout
+            transport.connect(username=self.username, password=self.password)
+            transport.set_keepalive(self.keepalive)
+        except Exception:
+            transport.close()
+            raise
+        self._transport = transport
+        self._connects += 1
+        return transport
+
+    def _close_locked(self) -> None:
+        for _, sftp in self._idle:
+            try:
+                sftp.close()
+            except Exception:
+                pass
+        self._idle = []
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    def connect(self) -> None:
+        """Ouvre le transport s'il ne l'est pas déjà (pré-chauffage)"""
+        with self._lock:
+            self._transport_locked()
+
+    def reset(self) -> None:
+        """
+        Ferme le transport et les canaux : la prochaine utilisation reconnecte.
+        Coupe les dépôts en cours : réservé à l'arrêt du worker, une fois les libérations terminées.
+        """
+        with self._lock:
+            self._close_locked()
+
+    close = reset
+
+    # -------------------------
+    # Canaux SFTP
+    # -------------------------
+    def _checkout(self) -> Tuple[paramiko.Transport, paramiko.SFTPClient]:
+        with self._lock:
+            transport = self._transport_locked()
+            while self._idle:
+                owner, sftp = self._idle.pop()
+                if owner is transport:
+                    return owner, sftp
+                try:
+                    sftp.close()
+                except Exception:
+                    pass
+        # Ouverture du canal hors verrou : le transport est multiplexé
+        return transport, paramiko.SFTPClient.from_transport(transport)
+
+    def _checkin(self, transport: paramiko.Transport, sftp: paramiko.SFTPClient) -> None:
+        with self._lock:
+            if transport is self._transport and transport.is_active():
+                self._idle.append((transport, sftp))
+                return
+        sftp.close()
+
+    @contextmanager
+    def client(self) -> Iterator[paramiko.SFTPClient]:
+        if not self._channels.acquire(timeout=self.acquire_timeout):
+            raise SftpPoolExhausted("Aucun canal SFTP disponible")
+        with self._lock:
+            self._in_use += 1
+        try:
+            transport, sftp = self._checkout()
+            try:
+                yield sftp
+            except BaseException:
+                # Canal dans un état inconnu : on ne le remet pas dans le pool
+                sftp.close()
+                raise
+            self._checkin(transport, sftp)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._channels.release()
+
+    @staticmethod
+    def _putfo(sftp: paramiko.SFTPClient, fileobj: IO[bytes], remote_path: str, temp_path: Optional[str]) -> None:
+        if not temp_path:
+            sftp.putfo(fileobj, remote_path)
+            return
+        try:
+            sftp.putfo(fileobj, temp_path)
+            # rename SFTP : échoue si remote_path existe déjà, un fichier déposé n'est jamais remplacé
+            sftp.rename(temp_path, remote_path)
+        except BaseException:
+            try:
+                sftp.remove(temp_path)
+            except Exception:
+                pass
+            raise
+
+    def put(self, fileobj: IO[bytes], remote_path: str, temp_path: Optional[str] = None) -> None:
+        """
+        putfo sur un canal du pool, sous temp_path puis renommé en remote_path si temp_path est fourni.
+        Un seul nouvel essai, et seulement si le transport est tombé : les erreurs SFTP remontent telles
+        quelles. Le transport partagé n'est jamais fermé ici (d'autres canaux peuvent être en cours) ;
+        un transport inactif est remplacé au prochain checkout.
+        """
+        start = fileobj.tell()
+        for attempt in (1, 2):
+            transport = None
+            try:
+                with self.client() as sftp:
+                    transport = sftp.get_channel().get_transport()
+                    fileobj.seek(start)
+                    self._putfo(sftp, fileobj, remote_path, temp_path)
+                return
+            except (*_TRANSPORT_ERRORS, OSError) as e:
+                dead = isinstance(e, _TRANSPORT_ERRORS) or transport is None or not transport.is_active()
+                if attempt == 2 or not dead:
+                    raise
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "connected": self._transport is not None and self._transport.is_active(),
+                "connects": self._connects,
+                "reconnects": self._reconnects,
+                "channels_in_use": self._in_use,
+                "channels_idle": len(self._idle),
+                "max_channels": self.max_channels,
+            }
@@ -0,0 +1,43 @@
+-- Index de l'historique SimLiberationProdUat (history.py)
+--
+-- Toutes les lectures trient par (created_at DESC, id DESC) et paginent par clé sur ce couple :
+-- chaque index se termine donc par created_at, id pour servir le filtre, le tri et le curseur
+-- en un seul parcours d'intervalle (seek), sans tri ni OFFSET.
+-- Exécuter hors heures de pointe ; ONLINE = ON requiert l'édition Enterprise (à retirer sinon).
+
+-- Liste sans filtre sélectif, plages de dates, synthèses par jour / par utilisateur :
+-- les colonnes agrégées sont incluses (pas de lookup sur la table)
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_SimLiberationProdUat_created_at'
+               AND object_id = OBJECT_ID('dbo.SimLiberationProdUat'))
+CREATE NONCLUSTERED INDEX IX_SimLiberationProdUat_created_at
+    ON dbo.SimLiberationProdUat (created_at DESC, id DESC)
+    INCLUDE (action_type, status, created_by)
+    WITH (ONLINE = ON, DATA_COMPRESSION = PAGE);
+GO
+
+-- Historique d'une SIM : couvrant (toutes les colonnes affichées)
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_SimLiberationProdUat_num_sim'
+               AND object_id = OBJECT_ID('dbo.SimLiberationProdUat'))
+CREATE NONCLUSTERED INDEX IX_SimLiberationProdUat_num_sim
+    ON dbo.SimLiberationProdUat (num_sim, created_at DESC, id DESC)
+    INCLUDE (action_type, status, created_by, user_type, sim_status, dealer_id, message, ip_address)
+    WITH (ONLINE = ON, DATA_COMPRESSION = PAGE);
+GO
+
+-- Activité d'un utilisateur (liste, export, synthèses filtrées sur created_by) : couvrant
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_SimLiberationProdUat_created_by'
+               AND object_id = OBJECT_ID('dbo.SimLiberationProdUat'))
+CREATE NONCLUSTERED INDEX IX_SimLiberationProdUat_created_by
+    ON dbo.SimLiberationProdUat (created_by, created_at DESC, id DESC)
+    INCLUDE (action_type, status, user_type, num_sim, sim_status, dealer_id, message, ip_address)
+    WITH (ONLINE = ON, DATA_COMPRESSION = PAGE);
+GO
+
+-- Filtres action_type / status (ex. erreurs UAT) : lignes rares parmi des dizaines de millions
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_SimLiberationProdUat_action_status'
+               AND object_id = OBJECT_ID('dbo.SimLiberationProdUat'))
+CREATE NONCLUSTERED INDEX IX_SimLiberationProdUat_action_status
+    ON dbo.SimLiberationProdUat (action_type, status, created_at DESC, id DESC)
+    INCLUDE (created_by)
+    WITH (ONLINE = ON, DATA_COMPRESSION = PAGE);
+GO
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules de serveur/ importés à plat, comme depuis app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
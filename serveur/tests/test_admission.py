@@ -0,0 +1,180 @@
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, BULK, INTERACTIVE, lane_for
+
+
+def controller(**overrides):
+    options = dict(
+        env_slots={"PROD": 4, "UAT": 4},
+        bulk_slots={"PROD": 3, "UAT": 3},
+        user_bulk_limit=2,
+        user_interactive_limit=4,
+        user_type_bulk_limits={"support1515": 1},
+        user_type_bulk_default=3,
+        interactive_wait=0.05,
+    )
+    options.update(overrides)
+    return AdmissionController(**options)
+
+
+def running(ctrl):
+    return {key: count for key, count in ctrl._running.items() if count}
+
+
+def test_lane_for():
+    assert lane_for(1) == INTERACTIVE
+    assert lane_for(10_000) == BULK
+    assert lane_for(1, upload=True) == BULK
+
+
+# -------------------------
+# Demandes
+# -------------------------
+def test_user_bulk_limit_and_release():
+    ctrl = controller()
+    first = ctrl.admit("PROD", "bob", "crm_it_team", BULK)
+    ctrl.admit("UAT", "bob", "crm_it_team", BULK)
+    with pytest.raises(AdmissionRejected) as rejected:
+        ctrl.admit("PROD", "bob", "crm_it_team", BULK)
+    assert rejected.value.retry_after > 0
+    # Les demandes interactives ont leur propre limite
+    ctrl.admit("PROD", "bob", "crm_it_team", INTERACTIVE).release()
+    first.release()
+    first.release()
+    ctrl.admit("PROD", "bob", "crm_it_team", BULK)
+
+
+def test_user_type_bulk_limit():
+    ctrl = controller()
+    ctrl.admit("PROD", "bob", "support1515", BULK)
+    with pytest.raises(AdmissionRejected):
+        ctrl.admit("PROD", "alice", "support1515", BULK)
+    ctrl.admit("PROD", "alice", "crm_it_team", BULK)
+
+
+def test_ticket_context_manager_releases():
+    ctrl = controller(user_interactive_limit=1)
+    with ctrl.admit("PROD", "bob", None, INTERACTIVE):
+        with pytest.raises(AdmissionRejected):
+            ctrl.admit("PROD", "bob", None, INTERACTIVE)
+    ctrl.admit("PROD", "bob", None, INTERACTIVE)
+
+
+def test_disabled_admits_everything():
+    ctrl = controller(enabled=False, user_bulk_limit=0)
+    ctrl.admit("PROD", "bob", None, BULK)
+    slot = ctrl.acquire_slot("PROD", BULK, {"PROD": 100})
+    assert running(ctrl) == {}
+    slot.release()
+    assert ctrl.max_parallelism(["PROD"], BULK, 8) == 8
+
+
+# -------------------------
+# Créneaux en sessions Oracle
+# -------------------------
+def test_max_parallelism_per_lane():
+    ctrl = controller()
+    assert ctrl.max_parallelism(["PROD"], INTERACTIVE, 8) == 4
+    assert ctrl.max_parallelism(["UAT", "PROD"], BULK, 8) == 3
+    assert ctrl.max_parallelism(["PROD"], BULK, 2) == 2
+    assert ctrl.max_parallelism(["OTHER"], BULK, 0) == 1
+
+
+def test_slot_counts_sessions_on_every_env():
+    ctrl = controller()
+    slot = ctrl.acquire_slot("uat", BULK, {"UAT": 2, "prod": 2})
+    assert running(ctrl) == {("UAT", BULK): 2, ("PROD", BULK): 2}
+    slot.release()
+    slot.release()
+    assert running(ctrl) == {}
+
+
+def test_bulk_capped_leaves_interactive_share():
+    ctrl = controller()
+    ctrl.acquire_slot("UAT", BULK, {"UAT": 3, "PROD": 3})
+    # Voie bulk pleine sur PROD (run UAT : sessions du garde-fou)
+    with pytest.raises(AdmissionRejected):
+        ctrl.acquire_slot("PROD", INTERACTIVE, {"PROD": 2})
+    interactive = ctrl.acquire_slot("PROD", INTERACTIVE, {"PROD": 1})
+    assert running(ctrl)[("PROD", INTERACTIVE)] == 1
+    interactive.release()
+
+
+def test_oversize_request_runs_alone():
+    ctrl = controller()
+    big = ctrl.acquire_slot("PROD", BULK, {"PROD": 10})
+    with pytest.raises(AdmissionRejected):
+        ctrl.acquire_slot("PROD", INTERACTIVE, {"PROD": 1})
+    big.release()
+    ctrl.acquire_slot("PROD", INTERACTIVE, {"PROD": 10}).release()
+
+
+def test_bulk_waits_for_slot():
+    ctrl = controller()
+    first = ctrl.acquire_slot("PROD", BULK, {"PROD": 3})
+    acquired = threading.Event()
+
+    def second():
+        ctrl.acquire_slot("PROD", BULK, {"PROD": 1})
+        acquired.set()
+
+    thread = threading.Thread(target=second, daemon=True)
+    thread.start()
+    # Pas de délai pour la voie bulk : attend son tour
+    assert not acquired.wait(0.2)
+    first.release()
+    assert acquired.wait(2)
+    thread.join(2)
+
+
+def test_bulk_yields_to_waiting_interactive():
+    ctrl = controller(interactive_wait=2)
+    hog = ctrl.acquire_slot("PROD", INTERACTIVE, {"PROD": 4})
+    order = []
+
+    def take(lane):
+        ctrl.acquire_slot("PROD", lane, {"PROD": 4}).release()
+        order.append(lane)
+
+    interactive = threading.Thread(target=take, args=(INTERACTIVE,), daemon=True)
+    interactive.start()
+    deadline = time.monotonic() + 2
+    while not ctrl._waiting[("PROD", INTERACTIVE)] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    bulk = threading.Thread(target=take, args=(BULK,), daemon=True)
+    bulk.start()
+    time.sleep(0.05)
+    hog.release()
+    interactive.join(2)
+    bulk.join(2)
+    assert order == [INTERACTIVE, BULK]
+
+
+def test_work_slot_uses_matching_held_slot():
+    ctrl = controller()
+    held = ctrl.acquire_slot("PROD", INTERACTIVE, {"PROD": 2})
+    with ctrl.work_slot("PROD", INTERACTIVE, {"PROD": 2}, held=held):
+        assert running(ctrl) == {("PROD", INTERACTIVE): 2}
+    assert held.released
+    assert running(ctrl) == {}
+
+
+def test_work_slot_replaces_mismatched_held_slot():
+    ctrl = controller()
+    held = ctrl.acquire_slot("PROD", INTERACTIVE, {"PROD": 2})
+    with ctrl.work_slot("UAT", INTERACTIVE, {"UAT": 1, "PROD": 1}, held=held):
+        assert held.released
+        assert running(ctrl) == {("UAT", INTERACTIVE): 1, ("PROD", INTERACTIVE): 1}
+    assert running(ctrl) == {}
+
+
+def test_work_slot_releases_on_error():
+    ctrl = controller()
+    with pytest.raises(RuntimeError):
+        with ctrl.work_slot("PROD", BULK):
+            assert running(ctrl) == {("PROD", BULK): 1}
+            raise RuntimeError("tranche en échec")
+    assert running(ctrl) == {}
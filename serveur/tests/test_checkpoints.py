@@ -0,0 +1,155 @@
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+
+import pytest
+
+import checkpoints
+from checkpoints import CheckpointStore, RunInProgress, RunMismatch, verify_replay
+
+RESULTS = [{"sim": "S1", "status": "success", "message": ""}]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CheckpointStore(str(tmp_path / "checkpoints.sqlite3"), ttl=3600, lease=60)
+
+
+@pytest.fixture
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def become(monkeypatch, holder):
+    """Les appels suivants sont faits au nom d'un autre process"""
+    monkeypatch.setattr(checkpoints, "_holder", lambda: holder)
+
+
+def updated_at(store, run_id):
+    with store._connect() as conn:
+        return conn.execute("SELECT updated_at FROM runs WHERE run_id = ?", (run_id,)).fetchone()[0]
+
+
+def test_resume_returns_saved_chunks(store):
+    assert store.open_run("r1", "fp", "bob", "PROD", total_chunks=2) == {}
+    store.save_chunk("r1", 0, RESULTS)
+    store.finish_run("r1", "failed")
+
+    assert store.open_run("r1", "fp", "bob", "PROD", total_chunks=2) == {0: RESULTS}
+    store.save_chunk("r1", 1, RESULTS)
+    store.finish_run("r1")
+    assert store.get_run("r1") == {
+        "runId": "r1", "owner": "bob", "environment": "PROD", "totalChunks": 2, "doneChunks": 2, "status": "done"
+    }
+
+
+def test_mismatch(store):
+    store.open_run("r1", "fp", "bob", "PROD", total_chunks=1)
+    store.finish_run("r1", "failed")
+    with pytest.raises(RunMismatch):
+        store.open_run("r1", "other", "bob", "PROD", total_chunks=1)
+    with pytest.raises(RunMismatch):
+        store.open_run("r1", "fp", "alice", "PROD", total_chunks=1)
+
+
+def test_restart_done(store):
+    store.open_run("r1", "fp", "bob", "PROD", total_chunks=1)
+    store.save_chunk("r1", 0, RESULTS)
+    store.finish_run("r1")
+    assert store.open_run("r1", "fp", "bob", "PROD", total_chunks=1) == {0: RESULTS}
+    store.finish_run("r1")
+    assert store.open_run("r1", "fp", "bob", "PROD", total_chunks=1, restart_done=True) == {}
+
+
+def test_running_run_held_by_live_process_is_refused(store, monkeypatch):
+    become(monkeypatch, "other-host:1234")
+    store.open_run("r1", "fp", "bob", "PROD", total_chunks=1)
+    monkeypatch.undo()
+    with pytest.raises(RunInProgress):
+        store.open_run("r1", "fp", "bob", "PROD", total_chunks=1)
+
+
+def test_running_run_of_dead_process_is_taken_over(store, monkeypatch, dead_pid):
+    dead_holder = f"{socket.gethostname()}:{dead_pid}"
+    become(monkeypatch, dead_holder)
+    store.open_run("r1", "fp", "bob", "PROD", total_chunks=2)
+    store.save_chunk("r1", 0, RESULTS)
+    monkeypatch.undo()
+
+    assert store.open_run("r1", "fp", "bob", "PROD", total_chunks=2) == {0: RESULTS}
+
+
+def test_expired_lease_is_taken_over(store, monkeypatch):
+    become(monkeypatch, "other-host:1234")
+    store.open_run("r1", "fp", "bob", "PROD", total_chunks=1)
+    monkeypatch.undo()
+    now = time.time()
+    monkeypatch.setattr(checkpoints.time, "time", lambda: now + 61)
+    assert store.open_run("r1", "fp", "bob", "PROD", total_chunks=1) == {}
+
+
+def test_previous_holder_is_fenced_off(store, monkeypatch):
+    become(monkeypatch, "other-host:1234")
+    store.open_run("r1", "fp", "bob", "PROD", total_chunks=2)
+    store.finish_run("r1", "failed")
+    monkeypatch.undo()
+    store.open_run("r1", "fp", "bob", "PROD", total_chunks=2)
+
+    # L'ancien process reprend la main : ni tranche enregistrée, ni statut écrasé
+    become(monkeypatch, "other-host:1234")
+    with pytest.raises(RunInProgress):
+        store.save_chunk("r1", 0, RESULTS)
+    store.finish_run("r1", "done")
+    monkeypatch.undo()
+    assert store.get_run("r1")["status"] == "running"
+    assert store.get_run("r1")["doneChunks"] == 0
+
+
+def test_heartbeat_renews_lease_until_finished(tmp_path):
+    store = CheckpointStore(str(tmp_path / "checkpoints.sqlite3"), ttl=3600, lease=0.3)
+    store.open_run("r1", "fp", "bob", "PROD", total_chunks=1)
+    first = updated_at(store, "r1")
+    time.sleep(0.5)
+    renewed = updated_at(store, "r1")
+    assert renewed > first
+
+    store.finish_run("r1")
+    finished = updated_at(store, "r1")
+    time.sleep(0.5)
+    assert updated_at(store, "r1") == finished
+    assert store._heartbeat is None or not store._heartbeat.is_alive()
+
+
+def test_renew_drops_run_taken_over(store, monkeypatch):
+    store.open_run("r1", "fp", "bob", "PROD", total_chunks=1)
+    with store._connect() as conn:
+        conn.execute("UPDATE runs SET holder = 'other-host:1234' WHERE run_id = 'r1'")
+    store.renew(["r1"])
+    assert "r1" not in store._held
+
+
+def test_database_without_holder_column_is_migrated(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE runs (run_id TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, owner TEXT, env TEXT NOT NULL, "
+        "total_chunks INTEGER NOT NULL, done_chunks INTEGER NOT NULL DEFAULT 0, status TEXT NOT NULL, "
+        "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+    )
+    conn.commit()
+    conn.close()
+
+    store = CheckpointStore(path, ttl=3600, lease=60)
+    store.open_run("r1", "fp", "bob", "PROD", total_chunks=1)
+    store.save_chunk("r1", 0, RESULTS)
+    assert store.get_run("r1")["doneChunks"] == 1
+
+
+def test_verify_replay():
+    verify_replay("r1", 0, ["S1"], RESULTS)
+    with pytest.raises(RunMismatch):
+        verify_replay("r1", 0, ["S1", "S2"], RESULTS)
@@ -0,0 +1,144 @@
+import pytest
+
+from creation_liberation_sim import PREFIX, SUFFIX, is_valid_sm_serialnum, iter_iccid_chunks, parse_iccids
+
+
+def luhn_digit(digits):
+    """Chiffre de contrôle Luhn à ajouter à digits"""
+    total = 0
+    for i, d in enumerate(reversed(digits)):
+        n = int(d)
+        if i % 2 == 0:
+            n = n * 2 - 9 if n > 4 else n * 2
+        total += n
+    return str(-total % 10)
+
+
+def iccid(body):
+    """ICCID normalisé (préfixe + 12 chiffres + suffixe) avec un chiffre de Luhn valide"""
+    digits = PREFIX + body[:11]
+    return f"{digits}{luhn_digit(digits)}{SUFFIX}"
+
+
+def short(norm):
+    """Saisie courte (12 chiffres) de l'ICCID normalisé norm"""
+    return norm[len(PREFIX):len(norm) - len(SUFFIX)]
+
+
+def with_bad_check_digit(norm):
+    digits = norm[:len(norm) - len(SUFFIX)]
+    return f"{digits[:-1]}{(int(digits[-1]) + 1) % 10}{SUFFIX}"
+
+
+# -------------------------
+# parse_iccids
+# -------------------------
+def test_short_input_is_normalized():
+    norm = iccid("00000000001")
+    parsed = parse_iccids([f"  {short(norm)} "], luhn=False)
+    assert parsed.mapping == {short(norm): norm}
+    assert parsed.valid == [norm]
+    assert parsed.invalid == {}
+
+
+def test_full_input_is_upper_cased():
+    norm = iccid("00000000002")
+    raw = norm.lower()
+    parsed = parse_iccids([raw], luhn=False)
+    assert parsed.mapping == {raw: norm}
+    assert parsed.valid == [norm]
+
+
+@pytest.mark.parametrize("raw", ["12345", "abcdefghijkl", f"{PREFIX}12345678901{SUFFIX}", f"9{PREFIX}123456789012"])
+def test_pattern_rejects_malformed(raw):
+    parsed = parse_iccids([raw], luhn=False)
+    assert parsed.valid == []
+    assert parsed.invalid == {raw.upper(): "Invalid SIM number"}
+
+
+def test_blank_lines_are_ignored():
+    parsed = parse_iccids(["", "   ", "\t"], luhn=False)
+    assert parsed.mapping == {}
+    assert parsed.valid == []
+    assert parsed.duplicates == 0
+
+
+def test_duplicates_are_counted_once_and_keep_input_order():
+    first, second = iccid("00000000003"), iccid("00000000004")
+    parsed = parse_iccids([second, short(first), second, first, short(first)], luhn=False)
+    # Même ICCID saisi sous deux formes : deux saisies, un seul ICCID à traiter
+    assert parsed.valid == [second, first]
+    assert parsed.mapping == {second: second, short(first): first, first: first}
+    assert parsed.duplicates == 3
+
+
+def test_luhn_check_is_optional():
+    bad = with_bad_check_digit(iccid("00000000005"))
+    assert parse_iccids([bad], luhn=False).valid == [bad]
+    parsed = parse_iccids([bad], luhn=True)
+    assert parsed.valid == []
+    assert parsed.invalid == {bad: "Invalid SIM check digit"}
+
+
+def test_luhn_accepts_valid_check_digit():
+    good = iccid("12345678901")
+    assert parse_iccids([good], luhn=True).valid == [good]
+    assert is_valid_sm_serialnum(good, luhn=True)
+    assert not is_valid_sm_serialnum(with_bad_check_digit(good), luhn=True)
+
+
+def test_chunks_split_valid_and_keep_invalid_in_first():
+    sims = [iccid(f"{i:011d}") for i in range(5)]
+    parsed = parse_iccids(sims + ["bad"], luhn=False)
+    parts = list(parsed.chunks(2))
+    assert [part.valid for part in parts] == [sims[0:2], sims[2:4], sims[4:5]]
+    assert parts[0].invalid == {"BAD": "Invalid SIM number"}
+    assert all(not part.invalid for part in parts[1:])
+    assert sum(len(part.mapping) for part in parts) == len(parsed.mapping)
+
+
+def test_in_input_order_sorts_by_first_occurrence():
+    first, second = iccid("00000000006"), iccid("00000000007")
+    parsed = parse_iccids([second, "bad", first], luhn=False)
+    entries = [{"sim": first}, {"sim": "BAD"}, {"sim": second}]
+    assert [e["sim"] for e in parsed.in_input_order(entries)] == [second, "BAD", first]
+
+
+# -------------------------
+# iter_iccid_chunks
+# -------------------------
+def test_iter_chunks_match_parse_iccids():
+    sims = [iccid(f"{i:011d}") for i in range(7)]
+    parts = list(iter_iccid_chunks(iter(sims), 3, luhn=False))
+    assert [part.valid for part in parts] == [sims[0:3], sims[3:6], sims[6:7]]
+    assert [v for part in parts for v in part.valid] == parse_iccids(sims, luhn=False).valid
+
+
+def test_iter_chunks_exact_multiple_has_no_empty_tail():
+    sims = [iccid(f"{i:011d}") for i in range(4)]
+    parts = list(iter_iccid_chunks(sims, 2, luhn=False))
+    assert [part.valid for part in parts] == [sims[0:2], sims[2:4]]
+
+
+def test_iter_chunks_empty_input_yields_one_empty_chunk():
+    parts = list(iter_iccid_chunks(["", "  "], 3, luhn=False))
+    assert len(parts) == 1
+    assert parts[0].valid == [] and parts[0].mapping == {}
+
+
+def test_iter_chunks_dedupe_across_chunks():
+    first, second = iccid("00000000008"), iccid("00000000009")
+    parts = list(iter_iccid_chunks([first, second, short(first), "bad", "bad"], 2, luhn=False))
+    assert [part.valid for part in parts] == [[first, second], []]
+    # Doublon d'une tranche précédente : compté dans la tranche où il apparaît, sans statut propre
+    assert parts[1].duplicates == 2
+    assert parts[1].mapping == {"bad": "BAD"}
+    assert parts[1].invalid == {"BAD": "Invalid SIM number"}
+
+
+def test_iter_chunks_luhn():
+    good = iccid("00000000010")
+    bad = with_bad_check_digit(iccid("00000000011"))
+    (part,) = iter_iccid_chunks([good, bad], 10, luhn=True)
+    assert part.valid == [good]
+    assert part.invalid == {bad: "Invalid SIM check digit"}
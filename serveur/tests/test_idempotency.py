@@ -0,0 +1,143 @@
+import pytest
+
+import idempotency
+from idempotency import IdempotencyKeyReused, IdempotencyStore, RecentLiberations, RequestInProgress, TTLCache
+from idempotency import payload_fingerprint, request_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(idempotency.time, "monotonic", lambda: now[0])
+    return now
+
+
+# -------------------------
+# TTLCache
+# -------------------------
+def test_get_set_and_stats(clock):
+    cache = TTLCache(max_entries=10, ttl=60)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 1}
+
+
+def test_entry_expires_after_ttl(clock):
+    cache = TTLCache(max_entries=10, ttl=60)
+    cache.set("a", 1)
+    clock[0] += 59.9
+    assert cache.get("a") == 1
+    clock[0] += 0.1
+    assert cache.get("a") is None
+    # Entrée expirée retirée à la lecture
+    assert cache.stats()["entries"] == 0
+
+
+def test_set_again_restarts_ttl(clock):
+    cache = TTLCache(max_entries=10, ttl=60)
+    cache.set("a", 1)
+    clock[0] += 50
+    cache.set("a", 2)
+    clock[0] += 50
+    assert cache.get("a") == 2
+
+
+def test_lru_eviction_beyond_max_entries(clock):
+    cache = TTLCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # Lecture de a : b devient la plus ancienne utilisation
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["entries"] == 2
+
+
+def test_pop(clock):
+    cache = TTLCache(max_entries=10, ttl=60)
+    cache.set("a", 1)
+    cache.pop("a")
+    cache.pop("missing")
+    assert cache.get("a") is None
+
+
+# -------------------------
+# IdempotencyStore / request_key / RecentLiberations
+# -------------------------
+def test_store_replays_finished_response(clock):
+    store = IdempotencyStore(max_entries=10, ttl=60)
+    assert store.begin("k") is None
+    with pytest.raises(RequestInProgress):
+        store.begin("k")
+    store.finish("k", {"success": True}, 200)
+    assert store.begin("k") == ({"success": True}, 200)
+    clock[0] += 60
+    assert store.begin("k") is None
+
+
+def test_store_abort_releases_key(clock):
+    store = IdempotencyStore(max_entries=10, ttl=60)
+    assert store.begin("k") is None
+    store.abort("k")
+    assert store.begin("k") is None
+    assert store.stats()["in_flight"] == 1
+
+
+def test_reused_key_with_other_payload_is_refused(clock):
+    store = IdempotencyStore(max_entries=10, ttl=60)
+    uat = payload_fingerprint("UAT", "liste|sync", ["A"])
+    prod = payload_fingerprint("PROD", "liste|sync", ["A"])
+    assert store.begin("k", uat) is None
+    with pytest.raises(IdempotencyKeyReused):
+        store.begin("k", prod)
+    store.finish("k", {"success": True}, 200)
+    assert store.begin("k", uat) == ({"success": True}, 200)
+    with pytest.raises(IdempotencyKeyReused):
+        store.begin("k", payload_fingerprint("UAT", "liste|sync", ["A", "B"]))
+
+
+def test_large_body_is_cached_as_summary(clock):
+    store = IdempotencyStore(max_entries=10, ttl=60, max_body_bytes=200)
+    results = [{"sim": f"S{i}", "status": "success", "message": ""} for i in range(20)]
+    body = {"success": True, "runId": "r1", "results": results, "message": "20 SIM traitées"}
+    store.begin("big")
+    store.finish("big", body, 200)
+    assert store.begin("big") == (
+        {"success": True, "runId": "r1", "message": "20 SIM traitées", "resultsOmitted": True}, 200
+    )
+    # La réponse renvoyée au premier appel n'est pas modifiée
+    assert body["results"] == results
+    store.begin("small")
+    store.finish("small", {"success": True, "results": []}, 200)
+    assert store.begin("small") == ({"success": True, "results": []}, 200)
+    assert store.stats()["truncated"] == 1
+
+
+def test_payload_fingerprint_ignores_order_and_duplicates():
+    assert payload_fingerprint("prod", "m", ["B", "A", "A"]) == payload_fingerprint("PROD", "m", ["A", "B"])
+    assert payload_fingerprint("PROD", "m", ["A"]) != payload_fingerprint("UAT", "m", ["A"])
+
+
+def test_request_key_ignores_order_and_duplicates():
+    key = request_key("bob", None, "prod", "liste|sync", ["B", "A", "A"])
+    assert key == request_key("bob", None, "PROD", "liste|sync", ["A", "B"])
+    assert key != request_key("alice", None, "PROD", "liste|sync", ["A", "B"])
+    assert key != request_key("bob", None, "UAT", "liste|sync", ["A", "B"])
+    assert key != request_key("bob", None, "PROD", "liste|async", ["A", "B"])
+
+
+def test_request_key_client_key_wins():
+    assert request_key("bob", "k1", "PROD", "m", ["A"]) == request_key("bob", "k1", "UAT", "x", ["B"])
+    assert request_key("bob", "k1", "PROD", "m", ["A"]) != request_key("alice", "k1", "PROD", "m", ["A"])
+
+
+def test_recent_liberations_per_env(clock):
+    recent = RecentLiberations(max_entries=10, ttl=60)
+    recent.add("prod", "S1")
+    assert recent.contains("PROD", "S1")
+    assert not recent.contains("UAT", "S1")
+    clock[0] += 60
+    assert not recent.contains("PROD", "S1")
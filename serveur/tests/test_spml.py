@@ -0,0 +1,144 @@
+import io
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import creation_liberation_sim
+from creation_liberation_sim import _build_auc_spml
+
+
+# (sm_serialnum, port_num, port_ki, port_tkey, algoId, acsub), triées par sm_serialnum comme la requête
+ROWS = [
+    ("8921303000000000011F", "60402000000001", "A1B2&C3<D4>", "TK01", 1, 2),
+    ("8921303000000000011F", "60402000000002", "E5F6", "TK02", 1, 2),
+    ("8921303000000000029F", "60402000000003", "0011\"2233'", "TK13", 0, 1),
+    ("8921303000000000037F", "60402000000004", "4455", "TK24", 0, 1),
+    ("8921303000000000037F", "60402000000005", "6677", "TK35", 0, 1),
+    ("8921303000000000037F", "60402000000006", "8899", "TK46", 0, 1),
+]
+SIMS = ["8921303000000000011F", "8921303000000000029F", "8921303000000000037F", "8921303000000000045F"]
+
+
+class _ListType:
+    def newobject(self, values):
+        return list(values)
+
+
+class _Connection:
+    def gettype(self, name):
+        return _ListType()
+
+
+class PortCursor:
+    """Curseur réduit aux appels de _build_auc_spml : lignes de ROWS des SIM demandées"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.connection = _Connection()
+        self.executions = 0
+        self._result = iter(())
+
+    def execute(self, sql, sims):
+        self.executions += 1
+        self._result = iter([row for row in self.rows if row[0] in set(sims)])
+
+    def __iter__(self):
+        return self._result
+
+
+def reference_spml(rows):
+    """SPML tel que le construisait l'ancien _build_auc_spml (ElementTree, un seul fichier)"""
+    root = ET.Element('spml:batchRequest', {
+        'language': 'en_us',
+        'execution': 'synchronous',
+        'processing': 'parallel',
+        'xmlns:spml': 'urn:siemens:names:prov:gw:SPML:2:0',
+        'xmlns:subscriber': 'urn:siemens:names:prov:gw:SUBSCRIBER:1:0',
+        'xmlns:xsi': 'http://www.w3.org/2001/XMLSchema-instance',
+        'onError': 'resume'
+    })
+    ET.SubElement(root, 'version').text = 'SUBSCRIBER_v10'
+    for _, port_num, port_ki, port_tkey, algoId, acsub in rows:
+        request = ET.SubElement(root, 'request', {'xsi:type': 'spml:AddRequest'})
+        ET.SubElement(request, 'version').text = 'SUBSCRIBER_v10'
+        obj = ET.SubElement(request, 'object', {'xsi:type': 'subscriber:Subscriber'})
+        ET.SubElement(obj, 'identifier').text = port_num
+        auc = ET.SubElement(obj, 'auc')
+        ET.SubElement(auc, 'imsi').text = port_num
+        ET.SubElement(auc, 'encKey').text = port_ki
+        ET.SubElement(auc, 'algoId').text = str(algoId)
+        ET.SubElement(auc, 'kdbId').text = '1' + port_tkey[-2:]
+        ET.SubElement(auc, 'acsub').text = str(acsub)
+
+    byte_stream = io.BytesIO()
+    ET.ElementTree(root).write(byte_stream, encoding='utf-8', xml_declaration=True)
+    return byte_stream.getvalue()
+
+
+def test_single_file_matches_element_tree_bytes():
+    files = list(_build_auc_spml(PortCursor(ROWS), SIMS))
+    assert len(files) == 1
+    fileobj, included = files[0]
+    assert fileobj.read() == reference_spml(ROWS)
+    # SIM sans port : dans aucun fichier
+    assert included == SIMS[:3]
+
+
+def test_no_port_no_file():
+    assert list(_build_auc_spml(PortCursor(ROWS), ["8921303000000000045F"])) == []
+
+
+def test_split_by_request_count_keeps_ports_of_a_sim_together(monkeypatch):
+    monkeypatch.setattr(creation_liberation_sim, "AUC_SPML_MAX_REQUESTS", 2)
+    files = list(_build_auc_spml(PortCursor(ROWS), SIMS))
+
+    assert [included for _, included in files] == [[SIMS[0]], [SIMS[1], SIMS[2]]]
+    for fileobj, included in files:
+        content = fileobj.read()
+        # Chaque fichier est un batchRequest complet, identique à celui de ses seules SIM
+        assert content == reference_spml([row for row in ROWS if row[0] in included])
+        ET.fromstring(content)
+
+
+def test_split_by_size(monkeypatch):
+    monkeypatch.setattr(creation_liberation_sim, "AUC_SPML_MAX_BYTES", 1)
+    files = list(_build_auc_spml(PortCursor(ROWS), SIMS))
+    assert [included for _, included in files] == [[sim] for sim in SIMS[:3]]
+
+
+def test_fetch_in_chunks(monkeypatch):
+    monkeypatch.setattr(creation_liberation_sim, "AUC_FETCH_CHUNK_SIZE", 2)
+    cursor = PortCursor(ROWS)
+    ((fileobj, included),) = _build_auc_spml(cursor, SIMS)
+    assert cursor.executions == 2
+    assert fileobj.read() == reference_spml(ROWS)
+
+
+@pytest.mark.parametrize("spool_bytes", [1, 1024 * 1024])
+def test_spooled_to_disk_same_bytes(monkeypatch, spool_bytes):
+    monkeypatch.setattr(creation_liberation_sim, "AUC_SPML_SPOOL_BYTES", spool_bytes)
+    ((fileobj, _),) = _build_auc_spml(PortCursor(ROWS), SIMS)
+    assert fileobj.read() == reference_spml(ROWS)
+
+
+def test_null_port_ki_is_empty_enc_key_like_element_tree():
+    rows = [("8921303000000000011F", "60402000000001", None, "TK01", 1, 2),
+            ("8921303000000000011F", "60402000000002", "", "TK02", 1, 2)]
+    ((fileobj, included),) = _build_auc_spml(PortCursor(rows), SIMS)
+    content = fileobj.read()
+    assert content == reference_spml(rows)
+    assert b"<encKey />" in content
+    assert included == [SIMS[0]]
+
+
+@pytest.mark.parametrize("column", [1, 3])
+def test_null_port_num_or_tkey_rejects_only_that_sim(column):
+    rows = [list(row) for row in ROWS]
+    # Deuxième port de la troisième SIM : aucun port de cette SIM ne doit partir
+    rows[4][column] = None
+    rows = [tuple(row) for row in rows]
+    rejected = {}
+    ((fileobj, included),) = _build_auc_spml(PortCursor(rows), SIMS, rejected)
+    assert included == SIMS[:2]
+    assert fileobj.read() == reference_spml([row for row in rows if row[0] in included])
+    assert rejected == {SIMS[2]: "port_num NULL" if column == 1 else "port_tkey NULL"}
@@ -0,0 +1,73 @@
+import gzip
+import os
+import tempfile
+from typing import IO, Iterator
+
+# === CONFIG upload de fichiers d'ICCID (text/plain ou multipart, gzip accepté) ===
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))      # corps reçu (compressé)
+UPLOAD_MAX_LINES = int(os.getenv("UPLOAD_MAX_LINES", "1000000"))                 # lignes après décompression
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(1024 * 1024)))      # au-delà : fichier temporaire disque
+UPLOAD_READ_SIZE = 64 * 1024
+
+# Corps bruts acceptés (le multipart/form-data passe par request.files)
+UPLOAD_MIMETYPES = ("text/plain", "text/csv", "application/gzip", "application/x-gzip", "application/octet-stream")
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_MAX_LINE_BYTES = 1024
+
+
+class UploadTooLarge(Exception):
+    """Fichier au-delà de UPLOAD_MAX_BYTES octets ou UPLOAD_MAX_LINES lignes"""
+
+
+def spool_upload(stream: IO[bytes], max_bytes: int = UPLOAD_MAX_BYTES) -> IO[bytes]:
+    """
+    Recopie le flux de la requête par blocs dans un fichier temporaire (mémoire puis disque au-delà
+    de UPLOAD_SPOOL_BYTES), tel que reçu (compressé ou non). Le traitement peut ainsi continuer après
+    la réponse (job, client déconnecté) sans que le fichier soit jamais entier en mémoire.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+    total = 0
+    try:
+        while True:
+            block = stream.read(UPLOAD_READ_SIZE)
+            if not block:
+                break
+            total += len(block)
+            if total > max_bytes:
+                raise UploadTooLarge(f"Fichier trop volumineux (max {max_bytes} octets)")
+            spool.write(block)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def iter_upload_lines(spool: IO[bytes], max_lines: int = UPLOAD_MAX_LINES) -> Iterator[str]:
+    """
+    Lignes du fichier déposé, décompressées à la volée si gzip (détecté sur l'en-tête), décodées
+    en UTF-8 (BOM toléré). Ferme le fichier une fois lu.
+    """
+    try:
+        raw: IO[bytes] = spool
+        if spool.read(2) == _GZIP_MAGIC:
+            spool.seek(0)
+            raw = gzip.GzipFile(fileobj=spool, mode="rb")
+        else:
+            spool.seek(0)
+        count = 0
+        while True:
+            # Longueur bornée : un fichier sans retour à la ligne n'est pas chargé d'un bloc
+            line = raw.readline(_MAX_LINE_BYTES + 1)
+            if not line:
+                return
+            count += 1
+            if count > max_lines:
+                raise UploadTooLarge(f"Fichier trop volumineux (max {max_lines} lignes)")
+            if len(line) > _MAX_LINE_BYTES:
+                raise UploadTooLarge(f"Ligne {count} trop longue (max {_MAX_LINE_BYTES} octets)")
+            yield line.decode("utf-8-sig" if count == 1 else "utf-8", errors="replace")
+    finally:
+        spool.close()
+
@@ -0,0 +1,12 @@
+"""
+Point d'entrée de production : gunicorn -c gunicorn.conf.py wsgi:application
+
+Importé dans chaque worker après le fork (pas de preload) : pools Oracle, transport SFTP,
+connexions LDAP et thread des logs sont propres au worker et pré-chauffés avant le premier appel.
+"""
+import lifecycle
+from app import app
+
+application = app
+
+lifecycle.warm_up()